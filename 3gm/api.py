@@ -7,6 +7,7 @@ import syntax
 import el_core_news_sm
 import spacy
 import helpers
+import pparser as parser
 from codifier import *
 from archiveapi import ArchiveStats
 from operator import itemgetter
@@ -30,6 +31,7 @@ from flask import Flask
 from flask import jsonify
 from flask import url_for
 from flask import Markup
+from flask import Response
 
 from flask_restful import Resource, Api, output_json, request, reqparse
 from flask_cors import CORS
@@ -186,10 +188,8 @@ def to_hyperlink(l, link_type='markdown'):
 
 
 def render_links(content):
-    search_results = []
-    for entity in entities.LegalEntities.entities:
-        tmp = [(x.group(), x.span()[1]) for x in re.finditer(entity, content)]
-        search_results.extend(tmp)
+    search_results = [(x.text, x.span[1])
+                      for x in entities.statute_scanner.finditer(content)]
     hyperlinks = [to_hyperlink(l[0]) for l in search_results]
     splitted = helpers.split_index(content, [l[1] for l in search_results])
 
@@ -392,16 +392,31 @@ class StatuteCodifiedResource(Resource):
             return text_data
 
         law = codifier.laws[_id]
-        corpus = codifier.get_law(_id, export_type='markdown')
-        is_empty = len(corpus.splitlines()) == 1
+        is_empty = law.get_articles_sorted() == []
         if (is_empty):
             return "<h3>Το νομοθέτημα έχει καταργθεί</h3>"
+        corpus = ''.join(law.iter_export('markdown'))
         corpus = render_links(corpus)
         res = Markup(markdown.markdown(corpus))
         cache_store(cache_key, res, compress=True)
         return res
 
 
+class StatuteExportResource(Resource):
+    def get(self, statute_id, export_type):
+        # Errors must be returned before the response starts streaming
+        if export_type not in parser.LawParser.export_formats and \
+                export_type != 'issue':
+            return {'message': 'Unrecognized export type'}, 400
+        _id = get_title_from_id(statute_id)
+        if _id not in codifier.laws:
+            return {'message': 'Statute not found'}, 404
+        law = codifier.laws[_id]
+        # Stream the law as it is exported
+        return Response(law.iter_export(export_type),
+                        mimetype='text/plain; charset=utf-8')
+
+
 class StatuteTopicsResource(Resource):
     def get(self, statute_id):
         _id = get_title_from_id(statute_id)
@@ -485,19 +500,17 @@ class StatuteLinksResource(Resource):
             item = (r[0], r[2])
             refs.setdefault(statute, set([])).add(item)
 
-        for article in articles:
-            for paragraph in law.get_paragraphs(article):
+        paragraphs = [paragraph for article in articles
+                      for paragraph in law.get_paragraphs(article)]
+        for result in syntax.ActionTreeGenerator.generate_action_trees(paragraphs):
+            for found in result:
                 try:
-                    result = syntax.ActionTreeGenerator.generate_action_tree_from_string(
-                        paragraph)
-                    if result != []:
-                        for found in result:
-                            if 'law' in found['root']['children'] and found['law']['_id']:
-                                statute = found['law']['_id']
-                                item = (found['root']['action'],
-                                        found['what']['context'])
-                                amendments.setdefault(
-                                    statute, set([])).add(item)
+                    if 'law' in found['root']['children'] and found['law']['_id']:
+                        statute = found['law']['_id']
+                        item = (found['root']['action'],
+                                found['what']['context'])
+                        amendments.setdefault(
+                            statute, set([])).add(item)
                 except BaseException:
                     continue
         res = {'incoming': refs, 'outgoing': amendments}
@@ -516,7 +529,8 @@ class StatuteDiffResource(Resource):
         _id = _initial = get_title_from_id(statute_id)
         _final = get_title_from_id(amendee_id)
 
-        history, links = codifier.get_history(_id)
+        history, links = codifier.get_history(
+            _id, amendees=[_initial, _final])
 
         version_initial = next(
             (x for x in history if x.amendee == _initial), None)
@@ -557,6 +571,8 @@ api.add_resource(StatuteStatsResource, '/statute/stats')
 api.add_resource(StatuteResource, '/statute/<string:statute_id>')
 api.add_resource(StatuteCodifiedResource,
                  '/statute/<string:statute_id>/codified')
+api.add_resource(StatuteExportResource,
+                 '/statute/<string:statute_id>/export/<string:export_type>')
 api.add_resource(StatuteHistoryResource,
                  '/statute/<string:statute_id>/history')
 api.add_resource(StatuteLinksResource, '/statute/<string:statute_id>/links')
@@ -1,4 +1,3 @@
-import copy
 import codifier
 import syntax
 import helpers
@@ -31,18 +30,22 @@ def apply_links(identifier, rollback=True):
         except:
             print('No applied links found')
 
-    # Get information from codifier object
-    law = codifier.codifier.laws[identifier]
+    # Get information from codifier object. The law is amended in
+    # place so it stays in memory until its history is stored
+    law = codifier.codifier.laws.pin(identifier)
     links = codifier.codifier.links[identifier]
     links.sort()
 
     # Initialize
-    # pdb.set_trace()
-    initial = law.serialize()
+    # Versions share their unchanged articles and paragraphs
+    initial, delta = law.serialize_version()
     initial['_version'] = 0
 
+    # Deltas of the articles are reused by the history encoder
     versions = []
-    versions.append(copy.deepcopy(initial))
+    deltas = []
+    versions.append(initial)
+    deltas.append(delta)
 
     # Stats
     total = 0
@@ -52,49 +55,66 @@ def apply_links(identifier, rollback=True):
     version_index = 0
     increase_flag = False
 
-    # Apply amendments
-    for i, l in enumerate(links):
-        if l['from'] == tmp_index:
-            # Non applied modifying links trigger amendments
-            if l['status'] == 'μη εφαρμοσμένος' and l['link_type'] in ['τροποποιητικός', 'απαλειπτικός']:
-                increase_flag = True
-                total += 1
-
-                # Detect if removal
-                is_removal = (l['link_type'] == 'απαλειπτικός')
-
-                # Detect amendment
-                try:
-                    d, a, law = law.apply_amendment(
-                        l['text'], is_removal=is_removal)
+    # Detect the modifying links with batched parsing. Removals are
+    # detected without spaCy, link by link
+    def is_modifying(l):
+        return l['status'] == 'μη εφαρμοσμένος' and l['link_type'] == 'τροποποιητικός'
+
+    detected_trees = syntax.ActionTreeGenerator.generate_action_trees(
+        [l['text'] for l in links if is_modifying(l)])
+
+    # Apply amendments. The law is serialized only for its versions
+    with law.transaction(atomic=False) as batch:
+        for i, l in enumerate(links):
+            trees = next(detected_trees) if is_modifying(l) else None
+
+            if l['from'] == tmp_index:
+                # Non applied modifying links trigger amendments
+                if l['status'] == 'μη εφαρμοσμένος' and l['link_type'] in ['τροποποιητικός', 'απαλειπτικός']:
+                    increase_flag = True
+                    total += 1
+
+                    # Detect if removal
+                    is_removal = (l['link_type'] == 'απαλειπτικός')
+
+                    # Detect amendment
+                    try:
+                        if is_removal:
+                            outcomes = batch.apply_amendment(
+                                l['text'], is_removal=is_removal)
+                        else:
+                            outcomes = batch.apply_trees(trees)
+                    except BaseException as e:
+                        outcomes = []
 
                     # Increase accuracy bits
-                    detected += d
-                    applied += a
+                    if outcomes != []:
+                        detected += 1
 
                     # Update link status
-                    if a == 1:
+                    if any(outcome.applied for outcome in outcomes):
+                        applied += 1
                         print('Link applied sucessfully')
                         links.actual_links[i]['status'] = 'εφαρμοσμένος'
-                except BaseException as e:
-                    pass
 
-        else:
-            if increase_flag:
-                # If it indeed modifies law then increase version
-                version_index += 1
-                s = copy.deepcopy(law.serialize())
-                s['_version'] = version_index
-                s['amendee'] = tmp_index
-                versions.append(s)
+            else:
+                if increase_flag:
+                    # If it indeed modifies law then increase version
+                    version_index += 1
+                    s, delta = law.serialize_version()
+                    s['_version'] = version_index
+                    s['amendee'] = tmp_index
+                    versions.append(s)
+                    deltas.append(delta)
 
-            tmp_index = l['from']
-            increase_flag = False
+                tmp_index = l['from']
+                increase_flag = False
 
     # JSON holding all versions to be stored to GridFS
     final_serializable = {
         '_id': identifier,
-        'versions': versions
+        'versions': versions,
+        'deltas': deltas
     }
 
     # Calculate accuracy
@@ -163,8 +183,10 @@ def apply_all_links(identifiers=None):
 
             # Store versioning history to fs
             try:
-                codifier.codifier.db.save_json_to_fs(
+                codifier.codifier.db.save_history_to_fs(
                     identifier, final_serializable)
+                # The latest version can now be reloaded from GridFS
+                codifier.codifier.laws.release(identifier)
             except:
                 print('GridFS Error in storing history')
 
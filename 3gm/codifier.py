@@ -1,18 +1,27 @@
 #!/usr/bin/env python3
 
 import logging
+import os
 import re
 import sys
 import syntax
+import tree_cache
 import entities
 import pparser as parser
 import helpers
 import database
+import history
+import issue_cache
+import snapshot
 import pprint
 import tokenizer
 import collections
+import collections.abc
+import json
+import time
 import argparse
 import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
 import gensim
 from gensim.models import KeyedVectors
 from networkx import (
@@ -21,6 +30,8 @@ from networkx import (
     pagerank
 )
 
+json_decoder = json.JSONDecoder()
+
 
 class UnrecognizedCodificationAction(Exception):
     """Exception class which is raised when the
@@ -51,6 +62,7 @@ class Link:
         :params link_type : Link type (can be modifying, referential etc.)
         """
 
+        self.is_sorted = 0
         self.links_to |= {other}
         self.actual_links.append({
             'from': other,
@@ -138,6 +150,296 @@ class Link:
         return l
 
 
+def latest_version(x):
+    """Return the latest version of a law history
+    :params x : Dictionary with the versions of the law
+    """
+    current_version = 0
+    current_instance = None
+    for v in x['versions']:
+        if int(v['_version']) >= current_version:
+            current_version = int(v['_version'])
+            current_instance = v
+
+    return current_instance
+
+
+def decode_latest_version(dump):
+    """Decode only the latest version of a law history stored in GridFS.
+    The head of a delta-encoded history ends with its latest version
+    under "latest", so only that object is decoded. Since quotes are
+    escaped inside JSON strings the last '"latest": ' marks it, and it
+    is only taken if it closes the head. Histories holding full
+    versions are decoded whole and their highest version is returned
+    :params dump : Bytes of the history head
+    """
+    start = dump.rfind(b'"latest": {')
+    if start > 0:
+        try:
+            # Only the tail is decoded from UTF-8
+            s = dump[start + len(b'"latest": '):].decode('utf-8')
+            v, end = json_decoder.raw_decode(s)
+            if s[end:].strip() == '}' and '_version' in v:
+                return v
+        except ValueError:
+            pass
+
+    head = json.loads(dump.decode('utf-8'))
+    if history.is_delta_encoded(head):
+        return head['latest']
+    return latest_version(head)
+
+
+def law_from_version(v):
+    """Deserialize a version of a law
+    Returns the LawParser object
+    """
+    law, identifier = parser.LawParser.from_serialized(v)
+    law.version_index = int(v['_version'])
+    return law
+
+
+def law_size(law):
+    """Rough estimate of the memory held by a law in bytes"""
+    size = 0
+    for paragraphs in law.sentences.values():
+        for periods in paragraphs.values():
+            for period in periods:
+                # Greek text is stored with two bytes per character
+                size += 80 + 2 * len(period or '')
+    return size
+
+
+class LawStore(collections.abc.MutableMapping):
+    """Mapping of law identifiers to LawParser objects backed by GridFS.
+    Laws are fetched and deserialized on first access and the recently
+    used ones are kept in an LRU bounded by a memory budget. Laws
+    assigned to the store may not exist in the database so they stay
+    pinned in memory until released. Laws amended in place must be
+    pinned first, or the LRU may drop the amendments. The identifiers
+    are fetched on first use."""
+
+    def __init__(self, db, max_bytes=None):
+        """Law store constructor
+        :params db : Database object
+        :params max_bytes : Memory budget of the LRU in bytes
+        (default CODIFIER_LAW_CACHE_MB megabytes)
+        """
+        if max_bytes is None:
+            max_bytes = int(os.environ.get(
+                'CODIFIER_LAW_CACHE_MB', 1024)) * 2**20
+        self.db = db
+        self.max_bytes = max_bytes
+        self._identifiers = None
+        self.hot = collections.OrderedDict()
+        self.sizes = {}
+        self.total_bytes = 0
+        self.pinned = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def identifiers(self):
+        """Identifiers of the stored laws"""
+        if self._identifiers is None:
+            self.load_index()
+        return self._identifiers
+
+    def load_index(self):
+        """Fetch the identifiers of the laws with versions"""
+        self._identifiers = {}
+        cursor = self.db.laws.find({"versions": {"$ne": None}}, {'_id': 1})
+        for ptr in cursor:
+            self._identifiers[ptr['_id']] = True
+
+    def __contains__(self, identifier):
+        return identifier in self.identifiers
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __iter__(self):
+        return iter(list(self.identifiers))
+
+    def __getitem__(self, identifier):
+        if identifier in self.pinned:
+            return self.pinned[identifier]
+
+        if identifier in self.hot:
+            self.hits += 1
+            self.hot.move_to_end(identifier)
+            return self.hot[identifier]
+
+        if identifier not in self.identifiers:
+            raise KeyError(identifier)
+
+        self.misses += 1
+        return self.cache(identifier, self.fetch(identifier))
+
+    def fetch(self, identifier):
+        """Load the latest version of a law from GridFS"""
+        try:
+            dump = self.db.read_from_fs(_id=identifier)
+        except AttributeError:
+            # No history on GridFS
+            raise KeyError(identifier)
+
+        return law_from_version(decode_latest_version(dump))
+
+    def __setitem__(self, identifier, law):
+        self.discard(identifier)
+        self.identifiers[identifier] = True
+        self.pinned[identifier] = law
+
+    def __delitem__(self, identifier):
+        if identifier not in self.identifiers:
+            raise KeyError(identifier)
+        self.discard(identifier)
+        del self.identifiers[identifier]
+
+    def cache(self, identifier, law):
+        """Put a law loaded from the database in the LRU"""
+        self.discard(identifier)
+        self.hot[identifier] = law
+        self.sizes[identifier] = law_size(law)
+        self.total_bytes += self.sizes[identifier]
+
+        # Evict least recently used laws but always keep the last one
+        while self.total_bytes > self.max_bytes and len(self.hot) > 1:
+            evicted, _ = self.hot.popitem(last=False)
+            self.total_bytes -= self.sizes.pop(evicted)
+
+        return law
+
+    def discard(self, identifier):
+        """Drop a law from memory"""
+        self.pinned.pop(identifier, None)
+        if self.hot.pop(identifier, None) is not None:
+            self.total_bytes -= self.sizes.pop(identifier)
+
+    def pin(self, identifier):
+        """Keep a law in memory until released, e.g. before amending
+        it in place. Returns the law"""
+        law = self[identifier]
+        self.discard(identifier)
+        self.pinned[identifier] = law
+        return law
+
+    def release(self, identifier):
+        """Unpin a law whose latest version has been stored to GridFS
+        so that it is loaded from there when needed again"""
+        self.pinned.pop(identifier, None)
+
+    def prefetch(self, identifiers, batch_size=64, workers=4):
+        """Load many laws with batched GridFS reads. Reading runs in a
+        thread pool ahead of the decoding in the calling thread
+        :params identifiers : Law identifiers
+        :params batch_size : Laws fetched with one query
+        :params workers : Reading threads
+        Returns the number of laws loaded
+        """
+        missing = [identifier for identifier in identifiers
+                   if identifier in self.identifiers
+                   and identifier not in self.pinned
+                   and identifier not in self.hot]
+        batches = [missing[i: i + batch_size]
+                   for i in range(0, len(missing), batch_size)]
+
+        loaded = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Keep a bounded number of batches in flight
+            pending = collections.deque()
+            for batch in batches:
+                pending.append(
+                    executor.submit(self.db.read_heads_from_fs, batch))
+                if len(pending) < 2 * workers:
+                    continue
+                loaded += self.decode_batch(pending.popleft().result())
+
+            while pending:
+                loaded += self.decode_batch(pending.popleft().result())
+
+        return loaded
+
+    def decode_batch(self, dumps):
+        """Decode fetched histories and cache the laws
+        :params dumps : List of (identifier, bytes) pairs
+        """
+        for identifier, dump in dumps:
+            self.misses += 1
+            self.cache(
+                identifier, law_from_version(decode_latest_version(dump)))
+        return len(dumps)
+
+    def iter_laws(self, identifiers=None, batch_size=256):
+        """Iterate over laws, prefetching them batch by batch so that
+        the LRU only holds the laws in use
+        :params identifiers : Law identifiers (default every law)
+        :params batch_size : Laws prefetched at once
+        Yields (identifier, law) pairs
+        """
+        if identifiers is None:
+            identifiers = list(self.identifiers)
+
+        for i in range(0, len(identifiers), batch_size):
+            batch = [identifier for identifier in identifiers[i: i + batch_size]
+                     if identifier in self.identifiers]
+            self.prefetch(batch)
+            for identifier in batch:
+                yield identifier, self[identifier]
+
+    def load_all(self, batch_size=64, workers=4):
+        """Bulk load every law and report the throughput
+        :params batch_size : Laws fetched with one query
+        :params workers : Reading threads
+        """
+        start = time.perf_counter()
+        loaded = self.prefetch(
+            list(self.identifiers), batch_size=batch_size, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        print('Loaded {} laws in {:.2f}s ({:.1f} laws/s, {:.2f}s per 1000 laws)'.format(
+            loaded, elapsed, loaded / max(elapsed, 1e-9),
+            1000 * elapsed / max(loaded, 1)))
+
+        return loaded
+
+
+class SnapshotLawStore(LawStore):
+    """LawStore reading the latest law versions from a snapshot"""
+
+    def __init__(self, snap, max_bytes=None):
+        """Snapshot law store constructor
+        :params snap : snapshot.Snapshot object
+        :params max_bytes : Memory budget of the LRU in bytes
+        """
+        super().__init__(db=None, max_bytes=max_bytes)
+        self.snapshot = snap
+
+    def load_index(self):
+        """Fetch the identifiers of the laws in the snapshot"""
+        self._identifiers = {}
+        for identifier in self.snapshot.keys('laws'):
+            self._identifiers[identifier] = True
+
+    def fetch(self, identifier):
+        """Load a law from the snapshot"""
+        if ('laws', identifier) not in self.snapshot:
+            raise KeyError(identifier)
+        return law_from_version(self.snapshot.get('laws', identifier))
+
+    def prefetch(self, identifiers, batch_size=None, workers=None):
+        """Load many laws from the snapshot"""
+        loaded = 0
+        for identifier in identifiers:
+            if identifier in self.identifiers and identifier not in self.pinned \
+                    and identifier not in self.hot:
+                self.misses += 1
+                self.cache(identifier, self.fetch(identifier))
+                loaded += 1
+        return loaded
+
+
 class LawCodifier:
     """This class is responsible for binding the different
     modules of the project into the codifier module.
@@ -147,35 +449,111 @@ class LawCodifier:
     3. Invoke Codification tool that recognizes actions and
     builds queries
     4. Interfacing with MongoDB
+    Links, topics, named entities and the ranking are loaded from the
+    database when first accessed, so creating the object is cheap.
+    Codifiers restored from a snapshot only connect to the database
+    when it is used.
     """
 
-    def __init__(self, issues_directory=None):
+    # Lazily loaded attributes, their initial values and the method
+    # populating them
+    lazy_attributes = {
+        'db': (None, 'connect'),
+        'links': (dict, 'populate_links'),
+        'topics': (list, 'populate_topics'),
+        'named_entities': (list, 'populate_named_entities'),
+        'graph': (None, 'pagerank'),
+        'ranks': (None, 'pagerank'),
+        'ranking': (None, 'pagerank')
+    }
+
+    def __init__(self, issues_directory=None, snapshot_file=None):
         """Constructor for LawCodifier class
         :param issues_directory : Issues directory
+        :param snapshot_file : Restore from this snapshot instead
+        of the database
         """
 
-        self.laws = {}
-        self.links = {}
-        self.topics = []
-        self.named_entities = []
-        self.db = database.Database()
-        self.populate_laws()
-        self.populate_links()
-        self.populate_topics()
-        self.populate_named_entities()
+        if snapshot_file and os.path.exists(snapshot_file):
+            self.restore_snapshot(snapshot_file)
+        else:
+            if snapshot_file:
+                logging.warning('No snapshot ' + snapshot_file)
+            self.laws = LawStore(self.db)
         self.issues = []
         if issues_directory:
             self.populate_issues(issues_directory)
 
-        self.pagerank()
+    def __getattr__(self, name):
+        """Load a lazily loaded attribute"""
+        try:
+            initial, populate = LawCodifier.lazy_attributes[name]
+        except KeyError:
+            raise AttributeError(name)
+        if initial:
+            setattr(self, name, initial())
+        getattr(self, populate)()
+        return self.__dict__[name]
+
+    def connect(self):
+        """Connect to the database"""
+        self.db = database.Database()
+        return self.db
+
+    def save_snapshot(self, filename):
+        """Write latest law versions, links, ranking, topics
+        and named entities to a binary snapshot
+        :params filename : Snapshot path
+        """
+        writer = snapshot.SnapshotWriter(filename)
+
+        for identifier, law in self.laws.items():
+            v = law.serialize()
+            v['_version'] = law.version_index
+            v['issue'] = getattr(law, 'issue', '')
+            writer.add('laws', identifier, v)
 
-    def add_directory(self, issues_directory, text_format=True):
-        """Add additional Directories"""
+        for identifier, link in self.links.items():
+            writer.add('links', identifier, link.serialize())
+
+        for attribute in ['ranks', 'ranking', 'topics', 'named_entities']:
+            writer.add('state', attribute, getattr(self, attribute))
+
+        writer.close()
+
+    def restore_snapshot(self, filename):
+        """Restore the state written by save_snapshot. Laws and links
+        are unpickled when first accessed
+        :params filename : Snapshot path
+        """
+        snap = snapshot.Snapshot(filename)
+
+        self.laws = SnapshotLawStore(snap)
+        self.laws.load_index()
+        self.links = snapshot.SnapshotMapping(
+            snap, 'links', Link.from_serialized)
+
+        for attribute in ['ranks', 'ranking', 'topics', 'named_entities']:
+            setattr(self, attribute, snap.get('state', attribute))
+
+    def add_directory(
+            self,
+            issues_directory,
+            text_format=True,
+            workers=None,
+            chunksize=1):
+        """Add additional Directories
+        :param issues_directory : Directory or list of directories
+        :param workers : Number of parsing processes (default all cores)
+        :param chunksize : Files handed to a worker at once
+        """
 
         self.issues.extend(
-            parser.get_issues_from_dataset(
+            parser.iter_issues_from_dataset(
                 issues_directory,
-                text_format=text_format))
+                text_format=text_format,
+                workers=workers,
+                chunksize=chunksize))
 
     def populate_topics(self):
         """Populate topics in codifier object"""
@@ -193,36 +571,25 @@ class LawCodifier:
             self.named_entities.append(x)
         return self.named_entities
 
-    def populate_laws(self):
-        """Populate laws from database and fetch latest versions"""
-
-        cursor = self.db.laws.find({"versions": {"$ne": None}})
-        for ptr in cursor:
-            x = self.db.get_json_from_fs(_id=ptr['_id'])
-            current_version = 0
-            current_instance = None
-            for v in x['versions']:
-                if int(v['_version']) >= current_version:
-                    current_version = int(v['_version'])
-                    current_instance = v
-
-            law, identifier = parser.LawParser.from_serialized(v)
-            law.version_index = current_version
-            self.laws[identifier] = law
+    def populate_laws(self, eager=False):
+        """Populate laws from database. The latest versions
+        are fetched when first accessed
+        :params eager : Bulk load every law now
+        """
 
-    def get_history(self, law):
-        """Return the history and links of a certain law"""
+        self.laws.load_index()
+        if eager:
+            self.laws.load_all()
 
-        history = []
+    def get_history(self, law, amendees=None):
+        """Return the history and links of a certain law
+        :params law : Law identifier
+        :params amendees : Only return the versions introduced by
+        these laws
+        """
 
-        x = self.db.get_json_from_fs(_id=law)
-
-        for v in x['versions']:
-            current_version = int(v['_version'])
-            current_instance = v
-            instance, identifier = parser.LawParser.from_serialized(v)
-            instance.version_index = current_version
-            history.append(instance)
+        versions = self.db.get_versions_from_fs(law, amendees=amendees)
+        history = [law_from_version(v) for v in versions]
 
         try:
             self.links[law].sort()
@@ -232,11 +599,11 @@ class LawCodifier:
 
         return history, history_links
 
-    def populate_issues(self, directory, text_format=True):
+    def populate_issues(self, directory, text_format=True, workers=None):
         """Populate issues from directory"""
 
         self.issues = parser.get_issues_from_dataset(
-            directory, text_format=text_format)
+            directory, text_format=text_format, workers=workers)
 
     def codify_issue(self, filename):
         """Codify certain issue (legacy)
@@ -264,7 +631,8 @@ class LawCodifier:
                             print('Not in keys')
                             self.laws[law_id] = parser.LawParser(law_id)
 
-                        self.db.query_from_tree(self.laws[law_id], t)
+                        # Amended in place and not stored to GridFS
+                        self.db.query_from_tree(self.laws.pin(law_id), t)
 
                         print('Pushed to Database')
                     except Exception as e:
@@ -286,10 +654,10 @@ class LawCodifier:
                 print(article, issue.name)
                 print('Codifying')
 
-                for i, non_extract in enumerate(
-                        issue.get_non_extracts(article)):
-                    trees[i] = syntax.ActionTreeGenerator.generate_action_tree(
-                        non_extract, issue, article)
+                detected = syntax.ActionTreeGenerator.generate_action_trees(
+                    issue.get_non_extracts(article))
+                for i, article_trees in enumerate(detected):
+                    trees[i] = article_trees
                     for j, t in enumerate(trees[i]):
                         print(t['root'])
                         print(t['what'])
@@ -303,8 +671,9 @@ class LawCodifier:
                                 self.laws[law_id] = parser.LawParser(law_id)
 
                             print('Ammendee, ', issue.name)
+                            # Amended in place and not stored to GridFS
                             self.db.query_from_tree(
-                                self.laws[law_id], t, issue.name)
+                                self.laws.pin(law_id), t, issue.name)
 
                             print('Pushed to Database')
                         except Exception as e:
@@ -315,16 +684,21 @@ class LawCodifier:
                         input()
 
     def codify_new_laws(self):
-        """Append new laws found in self.issues"""
+        """Append new laws found in self.issues
+        Returns a dictionary of the new laws by identifier"""
+
+        codified = {}
 
         for issue in self.issues:
             new_laws = issue.detect_new_laws()
             print(new_laws)
+            codified.update(new_laws)
             for k in new_laws.keys():
                 new_laws[k].amendee = k
+                issue_filename = os.path.basename(issue.filename)
                 archive_link = {
                     '_id': k,
-                    'issue': issue.filename.replace('.txt', '')
+                    'issue': issue_filename.replace('.txt', '')
                 }
                 self.db.archive_links.save(archive_link)
                 try:
@@ -336,11 +710,11 @@ class LawCodifier:
                     serializable_non_full['amendee'] = k
                     try:
                         serializable['issue'] = helpers.parse_filename(
-                            issue.filename)
+                            issue_filename)
                     except BaseException:
                         pass
-                    self.db.save_json_to_fs(_id=new_laws[k].identifier,
-                                            _json={
+                    self.db.save_history_to_fs(_id=new_laws[k].identifier,
+                                               _json={
                         '_id': new_laws[k].identifier,
                         'versions': [
                             serializable
@@ -357,6 +731,22 @@ class LawCodifier:
                 except BaseException as e:
                     logging.warning(str(e))
 
+        return codified
+
+    def record_issues(self, issues):
+        """Record parsed issues in the processed-issue manifest
+        together with the laws they produced
+        :params issues : IssueParser objects
+        """
+        for issue in issues:
+            filename = os.path.abspath(issue.filename)
+            try:
+                laws = list(issue.new_laws.keys())
+            except AttributeError:
+                laws = []
+            self.db.save_manifest_entry(
+                manifest_entry(filename, laws=laws))
+
     def get_law(self, identifier, export_type='latex'):
         """Get law string in LaTeX, Markdown, str, plaintext or issue-like format
         :param identifier : Law identifier
@@ -370,11 +760,15 @@ class LawCodifier:
             labels = open(labels, 'w+')
         with open(outfile, 'w+') as f:
             for law in self.laws:
-                s = self.get_law(law, export_type='str')
-                if s:
-                    f.write(s + '\n')
+                # Laws without articles are skipped
+                if self.laws[law].get_articles_sorted() == []:
+                    continue
+                self.laws[law].export_law(export_type='str', outfile=f)
+                f.write('\n')
+                if labels:
                     labels.write(str(law) + '\n')
-        labels.close()
+        if labels:
+            labels.close()
 
     def export_phrase_links(self, outfile):
         """Export links that have to do with operations
@@ -389,27 +783,26 @@ class LawCodifier:
                             f.write(p + '\n')
 
     def export_law(self, identifier, outfile, export_type='markdown'):
-        """Export a law in markdown or LaTeX"""
-
-        if export_type not in [
-            'latex',
-            'markdown',
-            'str',
-            'plaintext',
-                'issue']:
-            raise Exception('Unrecognized export type')
+        """Export a law in LaTeX, Markdown, str, plaintext or issue-like format"""
 
-        result = self.get_law(identifier, export_type=export_type)
+        chunks = self.laws[identifier].iter_export(export_type)
         if export_type == 'latex':
-            helpers.texify(result, outfile)
-        elif export_type == 'markdown':
+            helpers.texify(chunks, outfile)
+        else:
             with open(outfile, 'w+') as f:
-                f.write(result)
+                f.writelines(chunks)
 
-    def create_law_links(self):
-        """Creates links from existing laws"""
+    def create_law_links(self, identifiers=None):
+        """Creates links from existing laws
+        :params identifiers : Only scan these laws (default all laws)
+        Returns the statutes whose incoming links changed
+        """
 
-        for identifier, law in self.laws.items():
+        laws = self.laws.iter_laws(identifiers)
+
+        sizes = {u: len(link) for u, link in self.links.items()}
+
+        for identifier, law in laws:
             articles = law.sentences.keys()
 
             self.detect_and_apply_removals(
@@ -421,58 +814,49 @@ class LawCodifier:
                         extracts, non_extracts = helpers.get_extracts(
                             paragraph, 0)
 
-                        for entity in entities.LegalEntities.entities:
-                            # If law found in amendment body then it is
-                            # modifying
-                            for s in non_extracts:
-
-                                neighbors = re.finditer(entity, s)
-                                neighbors = set([neighbor.group().lower()
-                                                 for neighbor in neighbors])
-
-                                tmp = s.split(' ')
-
-                                for u in map(lambda x: x.lower(), neighbors):
-                                    if u not in self.links:
-                                        self.links[u] = Link(u)
-                                    is_modifying = False
-
-                                    for action in entities.actions:
-                                        for i, w in enumerate(tmp):
-                                            if action == w:
-                                                is_modifying = True
-                                                break
-                                        if is_modifying:
-                                            break
-
-                                    if is_modifying:
-                                        self.links[u].add_link(
-                                            law.identifier, paragraph, link_type='τροποποιητικός')
-                                    else:
-                                        self.links[u].add_link(
-                                            law.identifier, paragraph, link_type='αναφορικός')
-
-                            # If enclosed in brackets the link is only
-                            # referential
-                            for s in extracts:
-                                neighbors = re.finditer(entity, s)
-                                neighbors = set([neighbor.group().lower()
-                                                 for neighbor in neighbors])
-
-                                for u in map(lambda x: x.lower(), neighbors):
-                                    u = u.lower()
-                                    if u not in self.links:
-                                        self.links[u] = Link(u)
+                        # If law found in amendment body then it is
+                        # modifying
+                        for s in non_extracts:
+
+                            neighbors = set([
+                                statute.text.lower() for statute in
+                                entities.statute_scanner.finditer(s)])
+
+                            tmp = s.split(' ')
 
+                            is_modifying = entities.action_lookup.contains(tmp)
+
+                            for u in neighbors:
+                                if u not in self.links:
+                                    self.links[u] = Link(u)
+
+                                if is_modifying:
+                                    self.links[u].add_link(
+                                        law.identifier, paragraph, link_type='τροποποιητικός')
+                                else:
                                     self.links[u].add_link(
                                         law.identifier, paragraph, link_type='αναφορικός')
+
+                        # If enclosed in brackets the link is only
+                        # referential
+                        for s in extracts:
+                            neighbors = set([
+                                statute.text.lower() for statute in
+                                entities.statute_scanner.finditer(s)])
+
+                            for u in neighbors:
+                                if u not in self.links:
+                                    self.links[u] = Link(u)
+
+                                self.links[u].add_link(
+                                    law.identifier, paragraph, link_type='αναφορικός')
                     # except there are Unmatched brackets
                     except Exception as e:
-                        neighbors = re.finditer(entity, paragraph)
-                        neighbors = set([neighbor.group().lower()
-                                         for neighbor in neighbors])
+                        neighbors = set([
+                            statute.text.lower() for statute in
+                            entities.statute_scanner.finditer(paragraph)])
 
-                        for u in map(lambda x: x.lower(), neighbors):
+                        for u in neighbors:
 
                             if u not in self.links:
                                 self.links[u] = Link(u)
@@ -480,12 +864,17 @@ class LawCodifier:
                             self.links[u].add_link(
                                 law.identifier, paragraph, link_type='γενικός')
 
-        for link in self.links.values():
+        changed = [u for u, link in self.links.items()
+                   if len(link) != sizes.get(u)]
+
+        for u in (self.links if identifiers is None else changed):
             try:
-                self.db.links.save(link.serialize())
+                self.db.links.save(self.links[u].serialize())
             except:
                 pass
 
+        return changed
+
     def populate_links(self):
         """Populate links from database and fetch latest versions"""
 
@@ -610,7 +999,9 @@ class LawCodifier:
                                 identifier, paragraph, link_type='απαλειπτικός')
                             self.db.links.save(self.links[target].serialize())
                         else:
-                            self.laws[target].query_from_tree(subtree)
+                            # Keep the modified law in memory
+                            law = self.laws.pin(target)
+                            law.query_from_tree(subtree)
                             logging.info('Applied removal on ' + target)
                     except KeyError as e:
                         logging.warning('Statute nonexistent ' + target)
@@ -630,18 +1021,27 @@ def build(
             'links',
             'topics',
             'named_entities',
-            'versions'],
-        drop=True):
+            'versions',
+            'snapshot'],
+        drop=True,
+        workers=None,
+        chunksize=1,
+        snapshot_file=None):
     """Build codifier object
     :params start : Start year
     :params end : End year
     :params data_dir : Text files directory
     :params pipeline : Pipeline to build
-    Full pipeline ['laws', 'links', 'topics', 'versions']
+    :params workers : Number of processes parsing issues (default all cores)
+    :params chunksize : Issues handed to a parsing process at once
+    :params snapshot_file : Output of the snapshot stage
+    (default codifier.snapshot in data_dir)
+    Full pipeline ['laws', 'links', 'topics', 'named_entities', 'versions', 'snapshot']
     laws: Build laws
     links: Build links
     topics: Build topics
     versions: Build versions
+    snapshot: Write a warm-start snapshot of the built codifier
     """
     # Import here for performance
     import topic_models
@@ -651,13 +1051,18 @@ def build(
     if not data_dir[-1] == '/':
         data_dir = data_dir + '/'
 
+    if not snapshot_file:
+        snapshot_file = data_dir + 'codifier.snapshot'
+
     # Create object to be returned
     cod = LawCodifier()
 
     # Add build dirs
     if 'laws' in pipeline:
-        for i in range(start, end + 1):
-            cod.add_directory(data_dir + str(i))
+        cod.add_directory(
+            [data_dir + str(i) for i in range(start, end + 1)],
+            workers=workers,
+            chunksize=chunksize)
 
     # Build Lookup
     build_lookup = {
@@ -665,7 +1070,9 @@ def build(
         'links': cod.create_law_links,
         'topics': topic_models.build_topics,
         'named_entities': entity_recogniser.build_named_entities,
-        'versions': apply_links.apply_all_links
+        'versions': apply_links.apply_all_links,
+        # Fresh object so that the snapshot reflects the database
+        'snapshot': lambda: LawCodifier().save_snapshot(snapshot_file)
     }
 
     # Drop Lookup
@@ -674,7 +1081,8 @@ def build(
         'links': cod.db.drop_links,
         'topics': cod.db.drop_topics,
         'named_entities': cod.db.drop_named_entities,
-        'versions': cod.db.rollback_all
+        'versions': cod.db.rollback_all,
+        'snapshot': lambda: None
     }
 
     # Apply stages
@@ -683,9 +1091,129 @@ def build(
         if drop:
             drop_lookup[stage]()
         build_lookup[stage]()
+    tree_cache.tree_cache.flush()
+
+    print('Paragraph text cache: {} hits, {} misses'.format(
+        parser.text_cache_stats['hits'], parser.text_cache_stats['misses']))
+    print('Action tree cache: {} hits, {} misses'.format(
+        tree_cache.tree_cache.hits, tree_cache.tree_cache.misses))
+    print('Amendment pre-filter: {} sentences parsed, {} skipped'.format(
+        syntax.detection_stats['parsed'], syntax.detection_stats['skipped']))
+
+    # Laws are rebuilt from scratch so the manifest follows
+    if 'laws' in pipeline:
+        if drop:
+            cod.db.drop_manifest()
+        cod.record_issues(cod.issues)
 
     return cod
 
 
-# Codifier object
-codifier = LawCodifier()
+def manifest_entry(filename, laws=None):
+    """Build a manifest entry for an issue file
+    :params filename : Absolute path of the issue
+    :params laws : Laws produced by the issue
+    """
+    stat = os.stat(filename)
+    return {
+        '_id': parser.issue_name(filename),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': issue_cache.file_digest(filename),
+        'laws': laws or []
+    }
+
+
+def is_processed(db, filename):
+    """Check an issue file against the processed-issue manifest.
+    Size and mtime are compared first and the content hash only
+    when they differ
+    :params db : Database object
+    :params filename : Absolute path of the issue
+    """
+    entry = db.get_manifest_entry(parser.issue_name(filename))
+    if entry is None:
+        return False
+
+    stat = os.stat(filename)
+    if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        return True
+
+    if entry['hash'] == issue_cache.file_digest(filename):
+        entry['size'] = stat.st_size
+        entry['mtime'] = stat.st_mtime
+        db.save_manifest_entry(entry)
+        return True
+
+    return False
+
+
+def build_incremental(
+        start=1998,
+        end=2018,
+        data_dir='../data/',
+        workers=None,
+        chunksize=1,
+        snapshot_file=None):
+    """Incremental build. Only issues missing from the processed-issue
+    manifest are parsed, only their laws are codified, scanned for
+    links and named entities and only laws whose incoming links changed
+    get their versions rebuilt. Topics are fitted on the whole corpus,
+    so they are not updated here and need a full build of the topics
+    stage. Works on the module level codifier object since apply_links
+    operates on it.
+    :params start : Start year
+    :params end : End year
+    :params data_dir : Text files directory
+    :params workers : Number of processes parsing issues (default all cores)
+    :params chunksize : Issues handed to a parsing process at once
+    :params snapshot_file : Warm-start snapshot rewritten after the
+    build if given
+    Returns the new laws and the laws whose versions were rebuilt
+    """
+    import apply_links
+    import entity_recogniser
+
+    if not data_dir[-1] == '/':
+        data_dir = data_dir + '/'
+
+    cod = codifier
+
+    filelist = parser.list_issues(
+        [data_dir + str(i) for i in range(start, end + 1)],
+        text_format=True)
+    new_files = [f for f in filelist if not is_processed(cod.db, f)]
+    print('{} new issues out of {}'.format(len(new_files), len(filelist)))
+
+    if new_files == []:
+        return [], []
+
+    # Laws
+    cod.issues = list(parser.iter_issues(
+        new_files, workers=workers, chunksize=chunksize))
+    new_laws = cod.codify_new_laws()
+    cod.laws.update(new_laws)
+
+    # Links of the new laws only
+    changed = cod.create_law_links(identifiers=list(new_laws.keys()))
+
+    # Versions of the laws with new incoming links
+    affected = [identifier for identifier in changed
+                if identifier in cod.laws]
+    if affected != []:
+        apply_links.apply_all_links(identifiers=affected)
+
+    entity_recogniser.build_named_entities(identifiers=list(new_laws.keys()))
+
+    cod.record_issues(cod.issues)
+    cod.pagerank()
+
+    if snapshot_file:
+        # Fresh object so that the snapshot reflects the database
+        LawCodifier().save_snapshot(snapshot_file)
+
+    return list(new_laws.keys()), affected
+
+
+# Codifier object, restored from a snapshot if CODIFIER_SNAPSHOT is set
+codifier = LawCodifier(snapshot_file=os.environ.get('CODIFIER_SNAPSHOT'))
@@ -12,6 +12,8 @@ from bson.objectid import ObjectId
 from syntax import *
 import gridfs
 import json
+import uuid
+import history
 
 try:
     global client
@@ -34,6 +36,7 @@ class Database:
         self.archive_links = self.db.archive_links
         self.fs = gridfs.GridFS(self.db)
         self.summaries = self.db.summaries
+        self.processed_issues = self.db.processed_issues
 
     def insert_issue_to_db(self, issue):
         """Inserts issue to database"""
@@ -125,21 +128,13 @@ class Database:
     def checkout_laws(self, identifier=None, version=0):
         """Checkout to certain version
         :param identifier Law to apply checkout"""
-        x = self.get_json_from_fs(identifier)
-
-        try:
-            for v in x['versions']:
-                if int(v['_version']) == version:
-                    y = {
-                        '_id': identifier,
-                        'versions': [v]
-                    }
-                    break
-
+        y = None
+        for v in self.get_versions_from_fs(identifier, versions=[version]):
+            y = {
+                '_id': identifier,
+                'versions': [v]
+            }
             self.laws.save(y)
-        # Version 0 does not exist
-        except IndexError:
-            pass
 
         return y
 
@@ -190,11 +185,115 @@ class Database:
         logging.info('File nonexistent')
         self.put_json_to_fs(_id, _json)
 
+    def save_history_to_fs(self, _id, _json):
+        """Save the version history of a law to GridFS delta-encoded.
+        The segments and then the head are written as new files under
+        a fresh generation and the old files are deleted last, so a
+        failed save leaves the previous history readable
+        :params _id : Law identifier
+        :params _json : Dictionary with the versions of the law in order
+        and optionally the deltas of their articles
+        """
+        old = [f._id for f in self.fs.find({'filename': _id})]
+        if self.fs.exists(_id):
+            # Histories saved whole by save_json_to_fs
+            old.append(_id)
+
+        generation = uuid.uuid4().hex[:8]
+        head, segments = history.encode(
+            _id, _json['versions'], deltas=_json.get('deltas'),
+            generation=generation)
+        for segment_id, segment in segments:
+            dump = json.dumps(segment, ensure_ascii=False).encode('utf-8')
+            self.fs.put(dump, _id=segment_id, filename=_id)
+
+        dump = json.dumps(head, ensure_ascii=False).encode('utf-8')
+        self.fs.put(dump, _id=history.head_id(_id, generation),
+                    filename=_id, kind='head')
+
+        for file_id in old:
+            self.fs.delete(file_id)
+
+    def delete_history_from_fs(self, _id):
+        """Delete the version history of a law from GridFS"""
+        self.fs.delete(_id)
+        for f in self.fs.find({'filename': _id}):
+            self.fs.delete(f._id)
+
+    def get_versions_from_fs(self, _id, versions=None, amendees=None):
+        """Get versions of a law from GridFS. Only the history segments
+        holding the requested versions are read
+        :params _id : Law identifier
+        :params versions : Version numbers. If None and no amendees are
+        given every version is returned
+        :params amendees : Return the versions introduced by these laws
+        Returns the serialized versions in order
+        """
+        head = json.loads(self.read_from_fs(_id).decode('utf-8'))
+
+        positions = None
+        if versions is not None or amendees is not None:
+            positions = [
+                i for i, entry in enumerate(head['versions'])
+                if (versions is not None and int(entry['_version']) in versions)
+                or (amendees is not None and entry.get('amendee') in amendees)]
+
+        required = []
+        if history.is_delta_encoded(head):
+            required = history.required_segments(head, positions)
+
+        segments = {
+            segment_id: json.loads(dump.decode('utf-8'))
+            for segment_id, dump in self.read_many_from_fs(required)}
+
+        return history.decode(head, segments, positions)
+
     def get_json_from_fs(self, _id=None):
         """Get json from GridFS"""
         dump = self.fs.find_one({'_id': _id})
         return json.loads(dump.read().decode('utf-8'))
 
+    def find_head(self, _id):
+        """Latest head of the history of a law in GridFS or None"""
+        cursor = self.fs.find({'filename': _id, 'kind': 'head'}).sort(
+            'uploadDate', -1).limit(1)
+        for dump in cursor:
+            return dump
+        # Histories saved whole by save_json_to_fs
+        return self.fs.find_one({'_id': _id})
+
+    def read_from_fs(self, _id=None):
+        """Get the raw bytes of the history head of a law from GridFS"""
+        return self.find_head(_id).read()
+
+    def read_heads_from_fs(self, ids):
+        """Get the raw bytes of the history heads of many laws with one
+        query
+        :params ids : Law identifiers
+        Returns a list of (identifier, bytes) pairs
+        """
+        heads = {}
+        cursor = self.fs.find(
+            {'filename': {'$in': list(ids)}, 'kind': 'head'}).sort(
+                'uploadDate', 1)
+        for dump in cursor:
+            heads[dump.filename] = dump
+
+        missing = [_id for _id in ids if _id not in heads]
+        if missing:
+            for dump in self.fs.find({'_id': {'$in': missing}}):
+                heads[dump._id] = dump
+
+        return [(_id, dump.read()) for _id, dump in heads.items()]
+
+    def read_many_from_fs(self, ids):
+        """Get the raw bytes of many jsons from GridFS with one query
+        :params ids : GridFS ids
+        Returns a list of (id, bytes) pairs
+        """
+        return [(dump._id, dump.read())
+                for dump in self.fs.find({'_id': {'$in': list(ids)}})]
+
     def drop_fs(self):
         """Drop GridFS"""
         self.db.drop_collection('fs.files')
@@ -203,3 +302,15 @@ class Database:
     def drop_summaries(self):
         """Drop summaries"""
         self.db.drop_collection('summaries')
+
+    def get_manifest_entry(self, filename):
+        """Get the processed-issue manifest entry of a file"""
+        return self.processed_issues.find_one({'_id': filename})
+
+    def save_manifest_entry(self, entry):
+        """Save a processed-issue manifest entry"""
+        self.processed_issues.save(entry)
+
+    def drop_manifest(self):
+        """Drop processed-issue manifest"""
+        self.db.drop_collection('processed_issues')
@@ -2,6 +2,9 @@ import re
 import numpy as np
 from helpers import *
 import string
+import collections
+import unicodedata
+import fuzzy
 from collections import Iterable
 
 
@@ -27,9 +30,10 @@ class Action:
 
     def score(self, word, _normalize_word=True):
         scores = np.zeros(len(self.derivatives))
+        if _normalize_word:
+            word = normalize_word(word)
         for i, derivative in enumerate(self.derivatives):
-            scores[i] = edit_distance(
-                word if not _normalize_word else normalize_word(word), derivative)
+            scores[i] = edit_distance(word, derivative)
         return np.dot(scores, self.weight_vector)
 
     def __eq__(self, q):
@@ -54,6 +58,74 @@ actions = [
                                                 'αναριθμείται', 'renumber', [
                                                     'αναριθμείται', 'αναριθμούνται'])]
 
+
+class ActionLookup:
+    """Dictionary from the normalized forms of the actions to the
+    actions, so that the actions of a sentence are found in one pass
+    over its tokens. Forms are normalized to lowercase without accents,
+    so uppercase words without accents are found too. Words damaged
+    by OCR are matched to the closest form within max_distance edits"""
+
+    def __init__(self, actions):
+        """Lookup constructor
+        :params actions : List of Action objects, in matching order
+        """
+        self.forms = collections.defaultdict(list)
+        for rank, action in enumerate(actions):
+            for form in [action.name] + action.derivatives:
+                entry = (rank, action)
+                form = ActionLookup.normalize(form)
+                if entry not in self.forms[form]:
+                    self.forms[form].append(entry)
+        self.forms = dict(self.forms)
+        self.lexicon = fuzzy.Lexicon(self.forms, min_length=5)
+
+    @staticmethod
+    def normalize(word):
+        """Lowercase a word and strip its accents. Final sigma is
+        mapped to sigma so that words normalize alike inside and at
+        the end of a text"""
+        word = unicodedata.normalize('NFD', word.lower())
+        word = ''.join(c for c in word if not unicodedata.combining(c))
+        return word.replace('ς', 'σ')
+
+    def closest(self, word, max_distance=0):
+        """Normalized form matching a word, exactly or within
+        max_distance edits, or None"""
+        word = ActionLookup.normalize(word)
+        if word in self.forms:
+            return word
+        if max_distance > 0:
+            match = self.lexicon.lookup(word, max_distance)
+            if match is not None:
+                return match[0]
+        return None
+
+    def get(self, word, max_distance=0):
+        """Actions of a word"""
+        return [action for _, action in
+                self.forms.get(self.closest(word, max_distance), [])]
+
+    def find(self, tokens, max_distance=0):
+        """Actions found in a sequence of tokens
+        Returns (position, action) tuples ordered by action and then
+        by position"""
+        hits = []
+        for i, token in enumerate(tokens):
+            for rank, action in self.forms.get(
+                    self.closest(token, max_distance), []):
+                hits.append((rank, i, action))
+        hits.sort(key=lambda hit: hit[:2])
+        return [(i, action) for _, i, action in hits]
+
+    def contains(self, tokens, max_distance=0):
+        """Tell if any token is a form of an action"""
+        return any(self.closest(token, max_distance) is not None
+                   for token in tokens)
+
+
+action_lookup = ActionLookup(actions)
+
 # Entities - Statutes
 whats = [
     'φράση',
@@ -134,26 +206,17 @@ def flatten(items):
 def get_conditions(text):
 
     # Conditions
-    cond = []
-    cond.append(re.findall('|'.join(x for x in conditions), text))
-
-    return(list(flatten(cond)))
+    return keyword_automaton.findall(text)['Conditions']
          
 def get_constraints(text):
 
     # Constrains
-    const = []
-    const.append(re.findall('|'.join(x for x in constraints), text))
-
-    return(list(flatten(const)))
+    return keyword_automaton.findall(text)['Contraints']
          
 def get_durations(text):
 
     # Durations
-    dur = []
-    dur.append(re.findall('|'.join(x for x in durations), text))
-
-    return(list(flatten(dur)))
+    return keyword_automaton.findall(text)['Durations']
 
 
 # URLS
@@ -281,9 +344,7 @@ def get_metrics(text):
     from plain text
     """
 
-    pattern = '|'.join(item for item in Unit.units)
-    amounts_regex = re.compile(r'('+number_regex+'('+pattern+'))')
-    amounts =  amounts_regex.finditer(text)
+    amounts =  metrics_regex.finditer(text)
 
     result = []
     for match in amounts:
@@ -297,8 +358,6 @@ def get_monetary_amounts(text):
     Extracts all monetary amounts using the currencies class,
     from plain text
     """
-    pattern = '|'.join(item for item in Currency.currencies)
-    currency_regex = re.compile(r'('+number_regex+'('+pattern+'))')
     currency =  currency_regex.finditer(text)
 
     result = []
@@ -318,6 +377,255 @@ class LegalEntities:
     ratification = r'(ΝΟΜΟΣ|NOMOΣ|ΠΡΟΕΔΡΙΚΟ ΔΙΑΤΑΓΜΑ|ΚΟΙΝΗ ΥΠΟΥΡΓΙΚΗ ΑΠΟΦΑΣΗ|ΝΟΜΟΘΕΤΙΚΟ ΔΙΑΤΑΓΜΑ) ΥΠ’ ΑΡΙΘ(|Μ). (\d+)'
 
 
+# A statute citation found by the StatuteScanner
+StatuteCitation = collections.namedtuple(
+    'StatuteCitation', ['type', 'text', 'number', 'year', 'span'])
+
+
+class StatuteScanner:
+    """Finds laws, legislative acts, presidential decrees and
+    legislative decrees in a single pass over the text using one
+    precompiled regular expression with a named group per type"""
+
+    patterns = [
+        ('law', law_regex),
+        ('legislative_act', legislative_act_regex),
+        ('presidential_decree', presidential_decree_regex),
+        ('legislative_decree', legislative_decree_regex)
+    ]
+
+    types = [name for name, _ in patterns]
+
+    # Every statute starts with one of these letters. The lookahead
+    # lets the regex engine skip to candidate positions instead of
+    # trying each alternative at every character
+    first_letters = 'νΝπΠ'
+
+    def __init__(self):
+        self.regex = re.compile('(?=[{}])(?:{})'.format(
+            self.first_letters,
+            '|'.join('(?P<{}>{})'.format(name, pattern)
+                     for name, pattern in self.patterns)))
+
+    def finditer(self, text):
+        """Yield the statute citations of a string in text order
+        :params text : Query string
+        """
+        for match in self.regex.finditer(text):
+            statute = match.group()
+            # Citations end in <number>/<year> or in a dd.mm.yyyy date
+            number = statute[:-5].split(' ')[-1]
+            yield StatuteCitation(
+                type=match.lastgroup,
+                text=statute,
+                number=number,
+                year=int(statute[-4:]),
+                span=match.span())
+
+    def findall(self, text, order=None):
+        """Return the statute citations of a string
+        :params text : Query string
+        :params order : List of types. If given the citations are
+        grouped by type in this order, otherwise they are in text order
+        """
+        result = list(self.finditer(text))
+        if order is not None:
+            result.sort(key=lambda c: order.index(c.type))
+        return result
+
+
+statute_scanner = StatuteScanner()
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton matching several groups of fixed keywords
+    in one pass. Within each group matches follow the semantics of
+    re.findall over the alternation of the keywords: leftmost first,
+    earlier keywords win on the same position and matches do not overlap"""
+
+    def __init__(self, groups):
+        """Automaton constructor
+        :params groups : List of (name, keywords) pairs
+        """
+        self.names = [name for name, _ in groups]
+        self.keywords = [list(keywords) for _, keywords in groups]
+
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+        for g, keywords in enumerate(self.keywords):
+            for k, keyword in enumerate(keywords):
+                state = 0
+                for c in keyword:
+                    if c not in self.goto[state]:
+                        self.goto.append({})
+                        self.fail.append(0)
+                        self.out.append([])
+                        self.goto[state][c] = len(self.goto) - 1
+                    state = self.goto[state][c]
+                self.out[state].append((g, k, len(keyword)))
+
+        # Failure links in breadth first order
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, child in self.goto[state].items():
+                queue.append(child)
+                f = self.fail[state]
+                while f and c not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[child] = self.goto[f].get(c, 0)
+                self.out[child] = self.out[child] + \
+                    self.out[self.fail[child]]
+
+        # Jump over positions where no keyword starts, judging from
+        # the first two characters of every keyword
+        self.first = re.compile('(?={})'.format('|'.join(sorted(set(
+            re.escape(keyword[:2])
+            for keywords in self.keywords for keyword in keywords)))))
+
+    def findall(self, text):
+        """Return a dictionary with the matches of every group
+        :params text : Query string
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        found = [[] for _ in self.names]
+
+        state = 0
+        i = 0
+        n = len(text)
+        while i < n:
+            if state == 0:
+                m = self.first.search(text, i)
+                if not m:
+                    break
+                i = m.start()
+            c = text[i]
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+            for g, k, length in out[state]:
+                found[g].append((i + 1 - length, k))
+            i += 1
+
+        result = {}
+        for g, name in enumerate(self.names):
+            result[name] = []
+            end = 0
+            for start, k in sorted(found[g]):
+                if start >= end:
+                    keyword = self.keywords[g][k]
+                    result[name].append(keyword)
+                    end = start + len(keyword)
+
+        return result
+
+
+keyword_automaton = KeywordAutomaton([
+    ('Conditions', conditions),
+    ('Contraints', constraints),
+    ('Durations', durations)
+])
+
+metrics_regex = re.compile(
+    r'(' + number_regex + '(' + '|'.join(Unit.units) + '))')
+currency_regex = re.compile(
+    r'(' + number_regex + '(' + '|'.join(Currency.currencies) + '))')
+
+
+class EntityEngine:
+    """Registry of entity extractors compiled once. Every registered
+    regex carries a literal that any match must contain so that lines
+    without it are skipped without running the regex"""
+
+    def __init__(self):
+        self.keys = []
+        self.patterns = []
+        self.extractors = []
+
+    def register(self, key, pattern, hint=None):
+        """Register a regex whose re.findall results are stored under key
+        :params key : Key of the entity dictionary
+        :params pattern : Regular expression
+        :params hint : Literal contained in every match (optional)
+        """
+        self.keys.append(key)
+        self.patterns.append((key, re.compile(pattern), hint))
+
+    def register_extractor(self, keys, extractor):
+        """Register a function returning a dictionary of matches
+        :params keys : Keys returned by the extractor
+        :params extractor : Function of a line
+        """
+        self.keys.extend(keys)
+        self.extractors.append(extractor)
+
+    def scan_line(self, line):
+        """Return the non empty matches of a line by key"""
+        result = {}
+        for key, regex, hint in self.patterns:
+            if hint is None or hint in line:
+                found = regex.findall(line)
+                if found != []:
+                    result[key] = found
+        for extractor in self.extractors:
+            for key, found in extractor(line).items():
+                if found != []:
+                    result[key] = found
+        return result
+
+    def scan(self, lines):
+        """Detect the entities of a list of lines. The result maps
+        every key to a list of (line number, matches) pairs
+        :params lines : List of lines
+        """
+        result = {key: [] for key in self.keys}
+        for i, line in enumerate(lines):
+            for key, found in self.scan_line(line).items():
+                result[key].append((i, found))
+        return result
+
+    def scan_many(self, documents):
+        """Detect the entities of many documents
+        :params documents : Iterable of objects with a lines attribute
+        (such as LawParser objects) or lists of lines
+        """
+        return [self.scan(getattr(document, 'lines', document))
+                for document in documents]
+
+
+entity_engine = EntityEngine()
+entity_engine.register('Urls', urls, 'http')
+entity_engine.register('CPC Codes', cpc, 'CPC ')
+entity_engine.register('CPV Codes', cpv, '-')
+entity_engine.register('IBANs', ibans)
+entity_engine.register('E-mails', e_mails, '@')
+entity_engine.register('Id Numbers', id_numbers, 'Δ')
+entity_engine.register('Military Personel', military_personel_id, 'ΣΑ ')
+entity_engine.register('Natura 2000 Regions', natura_regions, 'GR')
+entity_engine.register('Scales', scales, '1:')
+entity_engine.register('EU Directives', directives_eu, 'δηγί')
+entity_engine.register('EU Regulations', regulations_eu, 'ανονισμ')
+entity_engine.register('EU Decisions', decisions_eu, 'πόφασ')
+entity_engine.register('Phone Numbers', phone_numbers, ' 2')
+entity_engine.register('Protocols', protocols, 'πρότυπο ')
+entity_engine.register('AFM numbers', afm, 'Φ')
+entity_engine.register('NUTS Region Codes', nuts_reg, 'NUTS')
+entity_engine.register('Exact times', exact_times, ':')
+entity_engine.register('Ship Tonnage', tonnage, ' κόρ')
+entity_engine.register('KAEK Codes', kaek, 'ΚΑΕΚ')
+entity_engine.register('Hull', hull, 'HULL No ')
+entity_engine.register('Flags', flag, 'σημαία')
+entity_engine.register_extractor(
+    ['Monetary Amounts'],
+    lambda line: {'Monetary Amounts': get_monetary_amounts(line)})
+entity_engine.register_extractor(
+    ['Metrics'], lambda line: {'Metrics': get_metrics(line)})
+entity_engine.register_extractor(
+    keyword_automaton.names, keyword_automaton.findall)
+
+
 class Numerals:
 
     units = {
@@ -441,23 +749,20 @@ class Numerals:
 
     GREEK_NUM_MAX = 199
 
+    # Stems and values of the units, tens and hundreds. The stems are
+    # plain words, so they are found with substring tests
+    full_number_tables = [tuple(table.items())
+                          for table in [units, tens, hundreds]]
+
     @staticmethod
     def full_number_to_integer(s):
         result = 0
 
-        for unit, val in Numerals.units.items():
-            if re.search(unit, s) is not None:
-                result += val
-                break
-        for ten, val in Numerals.tens.items():
-            if re.search(ten, s) is not None:
-                result += val
-                break
-
-        for hundred, val in Numerals.hundreds.items():
-            if re.search(hundred, s) is not None:
-                result += val
-                break
+        for table in Numerals.full_number_tables:
+            for stem, val in table:
+                if stem in s:
+                    result += val
+                    break
 
         return result
 
@@ -586,3 +891,40 @@ class Numerals:
             except BaseException:
                 raise ValueError
             return x
+
+
+# Keywords of the legislative acts as printed on their headers
+legal_vocabulary = [
+    'νόμος',
+    'νόμου',
+    'διάταγμα',
+    'διατάγματος',
+    'προεδρικό',
+    'νομοθετικό',
+    'κοινή',
+    'υπουργική',
+    'απόφαση',
+    'πράξη',
+    'νομοθετικού',
+    'περιεχομένου',
+    'κώδικας',
+    'κεφάλαιο',
+    'μέρος',
+    'αριθμ',
+    'φύλλο',
+    'εφημερίδα',
+    'κυβερνήσεως'
+]
+
+# Ordinal numerals, e.g. πρώτος, πρώτη, πρώτο, πρώτου
+numeral_words = [stem + suffix
+                 for stems in [Numerals.units, Numerals.tens,
+                               Numerals.hundreds]
+                 for stem in stems if stem != 'μόνο'
+                 for suffix in ['ος', 'η', 'ο', 'ου', 'ης']]
+
+# Closest keyword of a word damaged by OCR
+keyword_lexicon = fuzzy.Lexicon(
+    [form for action in actions for form in [action.name] + action.derivatives]
+    + whats + numeral_words + legal_vocabulary,
+    normalize=ActionLookup.normalize)
@@ -40,15 +40,17 @@ def build_greek_stoplist(cnt_swords=300):
     return greek_stopwords
 
 
-def build_data_samples(min_size=4):
-    """Returns a list of data samples to be classified"""
+def build_data_samples(min_size=4, identifiers=None):
+    """Returns a list of data samples to be classified
+    :params identifiers : Laws to sample (default every law)
+    """
     data_samples = []
     indices = {}
 
     i = 0
-    for law in codifier.codifier.laws.keys():
+    for law, law_object in codifier.codifier.laws.iter_laws(identifiers):
         print(law)
-        corpus = codifier.codifier.laws[law].export_law('str')
+        corpus = law_object.export_law('str')
 
         data_samples.append(corpus)
         indices[i] = law
@@ -82,15 +84,19 @@ def displacy_service(text):
     return displacy.parse_deps(doc)
 
 
-def build_named_entities():
-    """Detects named entities in a list of laws and saves to database"""
+def build_named_entities(identifiers=None):
+    """Detects named entities in a list of laws and saves to database
+    :params identifiers : Laws whose entities are detected. The entities
+    of the other laws are kept. Every law is detected anew if None
+    """
     greek_stopwords = build_greek_stoplist()
-    data_samples, indices = build_data_samples()
+    data_samples, indices = build_data_samples(identifiers=identifiers)
     greek_stopwords, words = build_gg_stoplist(data_samples, greek_stopwords)
 
     i = 0
     global db
-    db.drop_named_entities()
+    if identifiers is None:
+        db.drop_named_entities()
 
     for item in data_samples:
         doc = nlp(item)
@@ -0,0 +1,160 @@
+'''
+    Fuzzy matching of words against a fixed vocabulary.
+    OCR'd issues damage action words and keywords by one or two
+    characters, e.g. ΝΟΜΟΣ read as ΝΟΜ0Σ. A Lexicon finds the closest
+    known word within k edits without comparing the word to the whole
+    vocabulary: every known word is indexed under the strings left
+    after deleting up to max_distance of its characters, so two words
+    within k edits share such a string (symmetric delete). Only the
+    first prefix_length characters of a word are indexed, which bounds
+    the strings of long words at a few more candidates. The few
+    candidates found are verified with a bit-parallel Levenshtein
+    distance, which computes a column of the edit distance matrix with
+    a handful of integer operations.
+'''
+
+import collections
+
+
+def deletions(word, k):
+    """Strings left after deleting up to k characters of a word,
+    the word itself included"""
+    result = {word}
+    # Deletions are made left to right so that each set of deleted
+    # positions is visited once
+    level = [(word, 0)]
+    for _ in range(k):
+        level = [(w[:i] + w[i + 1:], i)
+                 for w, start in level for i in range(start, len(w))]
+        result.update(w for w, _ in level)
+    return result
+
+
+def levenshtein(a, b, max_distance=None):
+    """Levenshtein distance with the bit-parallel algorithm of Myers
+    and Hyyrö
+    :params a : First string
+    :params b : Second string
+    :params max_distance : Stop once the distance exceeds it and
+    return max_distance + 1
+    """
+    if a == b:
+        return 0
+    # The longer string is the pattern held in the bit vectors
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    if not b:
+        return len(a)
+
+    m = len(a)
+    peq = {}
+    for i, c in enumerate(a):
+        peq[c] = peq.get(c, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+    remaining = len(b)
+
+    for c in b:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+
+        # Every remaining character lowers the distance by one at most
+        remaining -= 1
+        if max_distance is not None and score - remaining > max_distance:
+            return max_distance + 1
+
+    return score
+
+
+class Lexicon:
+    """Vocabulary answering the closest known word within k edits"""
+
+    def __init__(self, words=(), max_distance=2, min_length=4,
+                 prefix_length=7, normalize=None):
+        """Lexicon constructor
+        :params words : Known words. On equal distances earlier words win
+        :params max_distance : Largest number of edits of a lookup
+        :params min_length : Shorter words are only matched exactly
+        :params prefix_length : Characters of the words indexed
+        :params normalize : Function applied to the known and the
+        looked up words, e.g. lowercasing
+        """
+        self.max_distance = max_distance
+        self.min_length = min_length
+        self.prefix_length = prefix_length
+        self.normalize = normalize
+        self.words = {}
+        self.order = {}
+        self.deletes = collections.defaultdict(list)
+        for word in words:
+            self.add(word)
+
+    def key(self, word):
+        """Normalized form of a word"""
+        return self.normalize(word) if self.normalize else word
+
+    def add(self, word):
+        """Add a known word"""
+        key = self.key(word)
+        if key in self.words:
+            return
+        self.words[key] = word
+        self.order[key] = len(self.order)
+        for variant in deletions(key[:self.prefix_length], self.max_distance):
+            self.deletes[variant].append(key)
+
+    def __contains__(self, word):
+        return self.key(word) in self.words
+
+    def __len__(self):
+        return len(self.words)
+
+    def candidates(self, word, max_distance=None):
+        """Known words within max_distance edits of a word
+        Returns (distance, known word) tuples from the closest"""
+        if max_distance is None:
+            max_distance = self.max_distance
+        max_distance = min(max_distance, self.max_distance)
+
+        key = self.key(word)
+        if key in self.words:
+            return [(0, self.words[key])]
+        if len(key) < self.min_length or max_distance <= 0:
+            return []
+
+        found = set()
+        for variant in deletions(key[:self.prefix_length], max_distance):
+            found.update(self.deletes.get(variant, ()))
+
+        result = []
+        for known in found:
+            distance = levenshtein(key, known, max_distance)
+            if distance <= max_distance:
+                result.append((distance, self.order[known], known))
+        result.sort()
+        return [(distance, self.words[known])
+                for distance, _, known in result]
+
+    def lookup(self, word, max_distance=None):
+        """Closest known word within max_distance edits of a word
+        Returns a (known word, distance) tuple or None"""
+        result = self.candidates(word, max_distance)
+        if not result:
+            return None
+        distance, known = result[0]
+        return known, distance
@@ -272,27 +272,33 @@ class Helper:
             return lesser + [pivot] + greater
 
 
-def edit_distance(str1, str2, weight=lambda s1, s2, i,
-                  j: 0.75 if s1[i - 1] == ' ' or s2[j - 1] == ' ' else 1):
+def edit_distance(str1, str2, weight=None):
+    """Weighted edit distance. By default an edit next to a space
+    costs 0.75 and any other edit 1
+    :params weight : Function of (str1, str2, i, j) giving the cost
+    of an edit at position i of str1 and j of str2
+    """
     m, n = len(str1), len(str2)
-    dp = [[0 for x in range(n + 1)] for x in range(m + 1)]
-
-    for i in range(m + 1):
-        for j in range(n + 1):
-
-            if i == 0:
-                dp[i][j] = j
-
-            elif j == 0:
-                dp[i][j] = i
-            elif str1[i - 1] == str2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
 
+    # Keep only the previous row of the matrix
+    prev = list(range(n + 1))
+    for i in range(1, m + 1):
+        c1 = str1[i - 1]
+        cur = [i] + [0] * n
+        for j in range(1, n + 1):
+            c2 = str2[j - 1]
+            if c1 == c2:
+                cur[j] = prev[j - 1]
             else:
-                dp[i][j] = weight(str1, str2, i, j) + min(dp[i][j - 1],
-                                                          dp[i - 1][j],
-                                                          dp[i - 1][j - 1])
-    return dp[m][n]
+                if weight is not None:
+                    cost = weight(str1, str2, i, j)
+                elif c1 == ' ' or c2 == ' ':
+                    cost = 0.75
+                else:
+                    cost = 1
+                cur[j] = cost + min(cur[j - 1], prev[j], prev[j - 1])
+        prev = cur
+    return prev[n]
 
 
 intonations = {
@@ -354,13 +360,20 @@ def string_to_date(d):
 
 
 def texify(s, outfile):
+    """Write LaTeX in the greek template and compile it
+    :params s : LaTeX string or iterable of LaTeX chunks
+    :params outfile : Output .tex file
+    """
     # TODO complete texifier
     f = open(outfile, 'w+')
     with open('../resources/greek_template.tex') as tmp:
         lines = tmp.readlines()
     for line in lines:
         f.write(line)
-    f.write(s)
+    if isinstance(s, str):
+        f.write(s)
+    else:
+        f.writelines(s)
     f.write('\end{document}')
     f.close()
 
@@ -0,0 +1,273 @@
+'''
+    Delta-encoded version history of laws.
+    The history of a law is split in segments. Every segment starts
+    with a keyframe, a full version of the law, followed by the deltas
+    of the next versions. Any version is rebuilt from one keyframe and
+    the deltas after it.
+
+    The head of the history holds an index of the versions and a full
+    copy of the latest version, so the current text of a law is read
+    without touching the segments. A last segment holding only its
+    keyframe is not stored since the keyframe is the latest version.
+
+    Layout in GridFS: head (_id: identifier@generation) | segments
+    (_id: identifier#generation#k), all under filename identifier.
+    Every save writes its files under a fresh generation and the
+    latest head is the current history, so the previous history stays
+    readable until the new head is stored.
+'''
+
+HISTORY_FORMAT = 2
+KEYFRAME_INTERVAL = 32
+
+
+def head_id(identifier, generation):
+    """GridFS id of a history head
+    :params identifier : Law identifier
+    :params generation : Generation of the history
+    """
+    return '{}@{}'.format(identifier, generation)
+
+
+def segment_id(identifier, segment, generation=None):
+    """GridFS id of a history segment
+    :params identifier : Law identifier
+    :params segment : Segment number
+    :params generation : Generation of the history
+    """
+    if generation is None:
+        return '{}#{}'.format(identifier, segment)
+    return '{}#{}#{}'.format(identifier, generation, segment)
+
+
+def is_delta_encoded(head):
+    """Tell delta-encoded histories from ones holding full versions"""
+    return head.get('format') == HISTORY_FORMAT
+
+
+def diff_articles(old, new):
+    """Delta between the articles of two versions. Maps changed
+    articles to None if removed or to their changed paragraphs, where
+    removed paragraphs map to None
+    :params old : Articles of the previous version
+    :params new : Articles of the next version
+    """
+    delta = {}
+    for article, paragraphs in new.items():
+        if article not in old:
+            delta[article] = dict(paragraphs)
+            continue
+
+        previous = old[article]
+        if previous is paragraphs:
+            continue
+
+        changes = {}
+        for paragraph, periods in paragraphs.items():
+            before = previous.get(paragraph)
+            if before is not periods and before != periods:
+                changes[paragraph] = periods
+        for paragraph in previous:
+            if paragraph not in paragraphs:
+                changes[paragraph] = None
+
+        if changes:
+            delta[article] = changes
+
+    for article in old:
+        if article not in new:
+            delta[article] = None
+
+    return delta
+
+
+def apply_article_delta(articles, delta):
+    """Apply a delta to articles. Unchanged articles are shared with
+    the given ones which are left untouched
+    :params articles : Articles of the previous version
+    :params delta : Delta as returned by diff_articles
+    """
+    articles = dict(articles)
+    for article, paragraphs in delta.items():
+        if paragraphs is None:
+            articles.pop(article, None)
+            continue
+
+        updated = dict(articles.get(article, {}))
+        for paragraph, periods in paragraphs.items():
+            if periods is None:
+                updated.pop(paragraph, None)
+            else:
+                updated[paragraph] = periods
+        articles[article] = updated
+
+    return articles
+
+
+def diff_versions(old, new, articles=None):
+    """Delta between two serialized versions of a law. Dictionary
+    fields present in both versions (e.g. titles) only hold their
+    changed keys
+    :params old : Previous version
+    :params new : Next version
+    :params articles : Delta of the articles if already known, e.g.
+    from LawParser.serialize_version
+    """
+    if articles is None:
+        articles = diff_articles(
+            old.get('articles', {}), new.get('articles', {}))
+    delta = {
+        'fields': {},
+        'maps': {},
+        'removed': [key for key in old if key not in new],
+        'articles': articles
+    }
+    for key, value in new.items():
+        if key == 'articles':
+            continue
+        before = old.get(key)
+        if key in old and (before is value or before == value):
+            continue
+
+        if isinstance(before, dict) and isinstance(value, dict):
+            delta['maps'][key] = {
+                'set': {k: v for k, v in value.items()
+                        if k not in before or before[k] != v},
+                'removed': [k for k in before if k not in value]
+            }
+        else:
+            delta['fields'][key] = value
+
+    return delta
+
+
+def apply_delta(version, delta):
+    """Build the next version of a law from a delta
+    :params version : Previous version
+    :params delta : Delta as returned by diff_versions
+    """
+    result = dict(version)
+    for key in delta['removed']:
+        result.pop(key, None)
+    result.update(delta['fields'])
+    for key, changes in delta['maps'].items():
+        updated = dict(version[key])
+        for k in changes['removed']:
+            updated.pop(k, None)
+        updated.update(changes['set'])
+        result[key] = updated
+    result['articles'] = apply_article_delta(
+        version.get('articles', {}), delta['articles'])
+
+    return result
+
+
+def encode(identifier, versions, keyframe_interval=KEYFRAME_INTERVAL,
+           deltas=None, generation=None):
+    """Encode the versions of a law
+    :params identifier : Law identifier
+    :params versions : Serialized versions in order
+    :params keyframe_interval : Versions per segment
+    :params deltas : Deltas of the articles of every version from the
+    previous one, as returned by LawParser.serialize_version. Computed
+    from the versions if None
+    :params generation : Generation of the segment ids
+    Returns the head and a list of (segment id, segment) pairs
+    """
+    index = []
+    segments = []
+    for i, version in enumerate(versions):
+        number = i // keyframe_interval
+        if i % keyframe_interval == 0:
+            segments.append({'keyframe': version, 'deltas': []})
+        else:
+            segments[-1]['deltas'].append(diff_versions(
+                versions[i - 1], version,
+                articles=deltas[i] if deltas else None))
+
+        index.append({
+            '_version': version.get('_version', i),
+            'amendee': version.get('amendee'),
+            'issue': version.get('issue'),
+            'segment': number
+        })
+
+    if segments and segments[-1]['deltas'] == []:
+        segments.pop()
+        index[-1]['segment'] = None
+
+    # The latest version is the last entry of the head so that
+    # codifier.decode_latest_version can decode it alone. Dumps must
+    # keep the default separators
+    head = {
+        '_id': identifier,
+        'format': HISTORY_FORMAT,
+        'keyframe_interval': keyframe_interval,
+        'generation': generation,
+        'versions': index,
+        'latest': versions[-1] if versions else None
+    }
+
+    return head, [(segment_id(identifier, number, generation), segment)
+                  for number, segment in enumerate(segments)]
+
+
+def required_segments(head, positions):
+    """Segment ids needed to rebuild the versions at certain positions
+    :params head : History head
+    :params positions : Positions of the versions in the index. If
+    None every segment is needed
+    """
+    if positions is None:
+        positions = range(len(head['versions']))
+    needed = {head['versions'][i]['segment'] for i in positions}
+    return [segment_id(head['_id'], number, head.get('generation'))
+            for number in sorted(needed - {None})]
+
+
+def decode(head, segments, positions=None):
+    """Rebuild versions of a law
+    :params head : History head
+    :params segments : Dictionary of segment id to segment holding
+    at least the required segments
+    :params positions : Positions of the versions in the index. If
+    None every version is rebuilt
+    Returns the versions in order
+    """
+    if not is_delta_encoded(head):
+        versions = head['versions']
+        if positions is None:
+            return list(versions)
+        return [versions[i] for i in sorted(positions)]
+
+    if positions is None:
+        positions = range(len(head['versions']))
+
+    interval = head['keyframe_interval']
+    result = []
+    current = None
+    current_position = None
+
+    for i in sorted(positions):
+        entry = head['versions'][i]
+        if entry['segment'] is None:
+            result.append(head['latest'])
+            continue
+
+        segment = segments[segment_id(
+            head['_id'], entry['segment'], head.get('generation'))]
+        start = entry['segment'] * interval
+
+        # Continue from the last rebuilt version when possible
+        if current_position is None or not \
+                start <= current_position <= i:
+            current, current_position = segment['keyframe'], start
+
+        while current_position < i:
+            current = apply_delta(
+                current, segment['deltas'][current_position - start])
+            current_position += 1
+
+        result.append(current)
+
+    return result
@@ -0,0 +1,111 @@
+'''
+    On-disk cache of parsed Government Gazette issues.
+    Issues never change once published, so parsing results are stored
+    under the SHA-256 of the issue text and the parser version and
+    reused by every subsequent build. The cache is off unless
+    CODIFIER_ISSUE_CACHE names its directory.
+'''
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import zlib
+
+
+def file_digest(filename, salt=''):
+    """SHA-256 of the contents of a file
+    :params filename : File path
+    :params salt : Appended to the contents before hashing
+    """
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    h.update(str(salt).encode('utf-8'))
+    return h.hexdigest()
+
+
+def source_digest(modules):
+    """SHA-256 of the source files of modules, so that cache keys
+    change with the code producing the cached results
+    :params modules : Imported modules
+    """
+    h = hashlib.sha256()
+    for module in modules:
+        with open(module.__file__, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class IssueCache:
+    """Content addressed store of parsed issues. Entries are
+    zlib-compressed pickles laid out as <directory>/<xx>/<digest>"""
+
+    def __init__(self, directory):
+        """Cache constructor
+        :params directory : Cache directory (created on first write).
+        If None the cache is disabled
+        """
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, filename, version):
+        """Compute the cache key of an issue file
+        :params filename : Path of the text file
+        :params version : Parser version
+        """
+        return file_digest(filename, salt=version)
+
+    @property
+    def enabled(self):
+        """Tell if the cache reads and writes entries"""
+        return bool(self.directory)
+
+    def path(self, key):
+        """Return the path of an entry"""
+        return os.path.join(self.directory, key[:2], key)
+
+    def load(self, key):
+        """Load an entry. Returns None if missing or unreadable"""
+        if not self.enabled:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                state = pickle.loads(zlib.decompress(f.read()))
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return state
+
+    def store(self, key, state):
+        """Store an entry atomically so that concurrent
+        workers never observe partial files"""
+        if not self.enabled:
+            return
+        target = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(zlib.compress(pickle.dumps(
+                    state, protocol=pickle.HIGHEST_PROTOCOL)))
+            os.replace(tmp, target)
+        except OSError as e:
+            logging.warning('Could not cache issue: ' + str(e))
+
+    def clear(self):
+        """Remove every entry of the cache"""
+        if not self.enabled:
+            return
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                os.remove(os.path.join(root, f))
+
+
+# Default cache, enabled by setting CODIFIER_ISSUE_CACHE to a directory
+global issue_cache
+issue_cache = IssueCache(os.environ.get('CODIFIER_ISSUE_CACHE'))
@@ -0,0 +1,124 @@
+'''
+    Inverted index of the periods and words of a law.
+    Search-style amendments (a period or a phrase given without its
+    location) look their targets up here instead of scanning the
+    whole law. The index is built on the first lookup and paragraphs
+    changed by the mutators of LawParser are re-indexed lazily.
+'''
+
+import collections
+
+
+class LawIndex:
+    """Maps period texts and words to the (article, paragraph)
+    locations holding them"""
+
+    def __init__(self, law):
+        """Index constructor
+        :params law : LawParser object
+        """
+        self.law = law
+        self.clear()
+
+    def clear(self):
+        """Drop the index. It is rebuilt on the next lookup"""
+        self.periods = collections.defaultdict(set)
+        self.words = collections.defaultdict(set)
+        self.entries = {}
+        self.paragraphs = collections.defaultdict(set)
+        self.stale = set()
+        self.complete = False
+
+    def invalidate(self, article=None, paragraph=None):
+        """Mark content as changed
+        :params article : Article number. If None the whole law
+        :params paragraph : Paragraph number. If None the whole article
+        """
+        if article is None:
+            self.clear()
+        elif self.complete:
+            self.stale.add((article, paragraph))
+
+    def refresh(self):
+        """Index the whole law or the paragraphs changed since the
+        last lookup"""
+        sentences = self.law.sentences
+        if not self.complete:
+            for article, paragraphs in sentences.items():
+                for paragraph in paragraphs:
+                    self.add(article, paragraph)
+            self.complete = True
+            return
+
+        for article, paragraph in self.stale:
+            current = sentences.get(article, {})
+            if paragraph is None:
+                for p in list(self.paragraphs.get(article, ())):
+                    self.remove(article, p)
+                for p in current:
+                    self.add(article, p)
+            else:
+                self.remove(article, paragraph)
+                if paragraph in current:
+                    self.add(article, paragraph)
+        self.stale.clear()
+
+    def add(self, article, paragraph):
+        """Index a paragraph"""
+        self.remove(article, paragraph)
+        periods = [period for period in self.law.sentences[article][paragraph]
+                   if isinstance(period, str)]
+
+        # A period is also found without its last character
+        keys = set(periods) | set(period[:-1] for period in periods)
+        words = set('. '.join(periods).split())
+
+        location = (article, paragraph)
+        for key in keys:
+            self.periods[key].add(location)
+        for word in words:
+            self.words[word].add(location)
+        self.entries[location] = (keys, words)
+        self.paragraphs[article].add(paragraph)
+
+    def remove(self, article, paragraph):
+        """Remove a paragraph from the index"""
+        location = (article, paragraph)
+        try:
+            keys, words = self.entries.pop(location)
+        except KeyError:
+            return
+
+        for postings, values in [(self.periods, keys), (self.words, words)]:
+            for value in values:
+                postings[value].discard(location)
+                if not postings[value]:
+                    del postings[value]
+        self.paragraphs[article].discard(paragraph)
+
+    def find_period(self, text):
+        """Locations of the periods equal to text or to text followed
+        by one more character"""
+        self.refresh()
+        return list(self.periods.get(text, ()))
+
+    def find_phrase(self, phrase):
+        """Locations that may contain a phrase, found by the words
+        inside it. The first and last words may be parts of words so
+        they are not looked up. Returns None for phrases without
+        inner words
+        """
+        words = set(phrase.split()[1:-1])
+        if not words:
+            return None
+
+        self.refresh()
+        postings = sorted((self.words.get(word, set()) for word in words),
+                          key=len)
+        result = set(postings[0])
+        for locations in postings[1:]:
+            result &= locations
+            if not result:
+                break
+
+        return list(result)
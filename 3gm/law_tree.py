@@ -0,0 +1,268 @@
+'''
+    Addressable document tree of a law:
+    article → paragraph → case → subcase and paragraph → period.
+    The periods in LawParser.sentences stay the stored form of a law, so
+    its serialization keeps the articles layout. The tree is a view
+    over them, built per article on first use and dropped by the
+    mutators of LawParser through invalidate(), which gives O(1)
+    addressing of any part of the law by its numbering. Cases and
+    subcases are located by their markers as offsets in the text of
+    their paragraph.
+'''
+
+import re
+import phrase_fun
+
+ARTICLE = 'article'
+PARAGRAPH = 'paragraph'
+CASE = 'case'
+SUBCASE = 'subcase'
+PERIOD = 'period'
+
+# Leading number of article and paragraph ids, e.g. 5 for 5α
+number_regex = re.compile(r'\d+')
+
+
+def leading_number(s):
+    """Leading number of an article or paragraph id or None"""
+    match = number_regex.match(str(s))
+    return int(match.group()) if match else None
+
+
+class Node:
+    """Node of the document tree. The address is the tuple (article,
+    paragraph, case, subcase, period) identifying the node, with None
+    on the levels below it. Cases, subcases and periods hold their
+    offsets in the text of their paragraph"""
+
+    __slots__ = ('kind', 'address', 'children', 'periods', 'marker',
+                 'start', 'end')
+
+    def __init__(self, kind, address, marker=None, start=None, end=None):
+        self.kind = kind
+        self.address = address
+        self.children = {}
+        self.periods = {}
+        self.marker = marker
+        self.start = start
+        self.end = end
+
+    @property
+    def number(self):
+        """Number of the node in its parent"""
+        return [x for x in self.address if x is not None][-1]
+
+    def __repr__(self):
+        return 'Node({}, {})'.format(self.kind, self.address)
+
+
+class LawTree:
+    """Document tree of a LawParser object"""
+
+    def __init__(self, law):
+        """Tree constructor
+        :params law : LawParser object
+        """
+        self.law = law
+        self.invalidate()
+
+    def invalidate(self, article=None, paragraph=None):
+        """Drop the nodes of changed content
+        :params article : Article number. If None the whole tree
+        :params paragraph : Paragraph number. If None the whole article
+        """
+        if article is None:
+            self.articles = {}
+            self.paragraph_counters = {}
+            self.last_article = None
+            self.changed = set()
+            return
+
+        self.changed.add(article)
+        self.paragraph_counters.pop(article, None)
+        node = self.articles.get(article)
+        if node is None:
+            return
+        if paragraph is None:
+            del self.articles[article]
+        else:
+            node.children.pop(paragraph, None)
+
+    def article(self, article):
+        """Article node with its paragraphs"""
+        article = str(article)
+        try:
+            return self.articles[article]
+        except KeyError:
+            pass
+
+        if article not in self.law.sentences:
+            raise KeyError(article)
+        node = Node(ARTICLE, (article, None, None, None, None))
+        self.articles[article] = node
+        return node
+
+    def paragraph(self, article, paragraph):
+        """Paragraph node with its cases, subcases and periods"""
+        node = self.article(article)
+        paragraph = str(paragraph)
+        try:
+            return node.children[paragraph]
+        except KeyError:
+            pass
+
+        periods = self.law.sentences[node.address[0]][paragraph]
+        child = Node(PARAGRAPH, (node.address[0], paragraph, None, None, None))
+        self.build_paragraph(child, periods)
+        node.children[paragraph] = child
+        return child
+
+    @staticmethod
+    def build_paragraph(node, periods):
+        """Add the case, subcase and period nodes of a paragraph"""
+        article, paragraph = node.address[:2]
+        editor = phrase_fun.PhraseEditor(periods)
+        text = editor.text
+
+        start = 0
+        for i, end in enumerate(editor.breaks + [len(text)], 1):
+            node.periods[i] = Node(
+                PERIOD, (article, paragraph, None, None, i),
+                start=start, end=end)
+            start = end + len(editor.separator)
+
+        cases = phrase_fun.find_cases(text)
+        for i, (start, marker) in enumerate(cases):
+            end = cases[i + 1][0] if i + 1 < len(cases) else len(text)
+            letter = marker[:-1]
+            case = Node(CASE, (article, paragraph, letter, None, None),
+                        marker=marker, start=start, end=end)
+            node.children[letter] = case
+
+            subcases = phrase_fun.find_cases(text[start:end], prefix=letter)
+            for j, (sub_start, sub_marker) in enumerate(subcases):
+                sub_start += start
+                if j + 1 < len(subcases):
+                    sub_end = start + subcases[j + 1][0]
+                else:
+                    sub_end = end
+                sub_letter = sub_marker[len(letter):-1]
+                case.children[sub_letter] = Node(
+                    SUBCASE, (article, paragraph, letter, sub_letter, None),
+                    marker=sub_marker, start=sub_start, end=sub_end)
+
+    def paragraphs(self, article):
+        """Paragraph nodes of an article in the order of the law"""
+        return [self.paragraph(article, paragraph)
+                for paragraph in self.law.get_paragraphs_sorted(article)]
+
+    def node(self, article, paragraph=None, case=None, subcase=None,
+             period=None):
+        """Node at an address. Raises KeyError for missing nodes
+        :params article : Article number
+        :params paragraph : Paragraph number
+        :params case : Case letter, e.g. β
+        :params subcase : Subcase letter, e.g. α for βα
+        :params period : Period number in the paragraph starting from 1
+        """
+        if paragraph is None:
+            return self.article(article)
+
+        node = self.paragraph(article, paragraph)
+        if period is not None:
+            return node.periods[int(period)]
+        if case is not None:
+            node = node.children[case]
+            if subcase is not None:
+                node = node.children[subcase]
+        return node
+
+    def address(self, tree):
+        """Address of the target of an action tree
+        :params tree : Action tree from syntax.ActionTreeGenerator
+        """
+        def _id(level):
+            try:
+                value = tree[level]['_id']
+            except (KeyError, TypeError):
+                return None
+            if value in [None, '']:
+                return None
+            return str(value).strip(')').strip('΄')
+
+        case, subcase = _id(CASE), _id(SUBCASE)
+        if case and subcase and len(subcase) > 1 and subcase.startswith(case):
+            subcase = subcase[len(case):]
+
+        return (_id(ARTICLE), _id(PARAGRAPH), case, subcase, _id(PERIOD))
+
+    def case_letter(self, address):
+        """Letter of a case or subcase as used by the markers of the
+        text, e.g. βα for subcase α of case β. A subcase is taken alone
+        if its case is not found in the paragraph
+        :params address : Address as returned by address()
+        """
+        article, paragraph, case, subcase = address[:4]
+        if subcase is None:
+            return case
+        if case is not None:
+            try:
+                self.node(article, paragraph, case)
+            except KeyError:
+                pass
+            else:
+                return case + subcase
+        return subcase
+
+    def case_span(self, article, paragraph, case_letter):
+        """Span of a case or subcase in the text of its paragraph as
+        returned by phrase_fun.case_span: the markers and offsets of
+        the case and its siblings, its start and end offsets and its
+        marker. Raises KeyError for missing cases
+        :params case_letter : Letter as returned by case_letter()
+        """
+        node = self.paragraph(article, paragraph)
+        if case_letter not in node.children and len(case_letter) > 1:
+            node = node.children[case_letter[:-1]]
+            case_letter = case_letter[-1]
+        case = node.children[case_letter]
+
+        cases = [(child.start, child.marker)
+                 for child in node.children.values()]
+        return cases, case.start, case.end, case.marker
+
+    def next_article(self):
+        """Number following the largest article number"""
+        sentences = self.law.sentences
+        if self.last_article is not None:
+            for article in self.changed:
+                number = leading_number(article)
+                if number is None:
+                    continue
+                if article in sentences and number > self.last_article:
+                    self.last_article = number
+                elif article not in sentences and number == self.last_article:
+                    self.last_article = None
+                    break
+        self.changed = set()
+
+        if self.last_article is None:
+            numbers = [leading_number(article) for article in sentences]
+            self.last_article = max(
+                [number for number in numbers if number is not None] or [0])
+
+        return str(self.last_article + 1)
+
+    def next_paragraph(self, article):
+        """Number following the largest paragraph number of an article"""
+        article = str(article)
+        try:
+            return self.paragraph_counters[article]
+        except KeyError:
+            pass
+
+        numbers = [leading_number(p) for p in self.law.sentences[article]]
+        result = str(max(
+            [number for number in numbers if number is not None] or [0]) + 1)
+        self.paragraph_counters[article] = result
+        return result
@@ -1,7 +1,113 @@
-import tokenizer
 import re
+import bisect
 import entities
 import helpers
+import tokenizer
+
+
+class PhraseEditor:
+    """Phrase editing on the periods of a paragraph. The periods are
+    kept joined with '. ' and their boundaries as offsets in the text
+    so that edits only shift the boundaries after them instead of
+    splitting the whole paragraph again. Separators brought in by an
+    edit start new periods unless they belong to a tokenizer exception.
+    Phrases are found by literal search.
+    """
+
+    separator = '. '
+
+    def __init__(self, periods):
+        """Editor constructor
+        :params periods : List of periods of the paragraph
+        """
+        periods = list(periods) or ['']
+        self.text = self.separator.join(periods)
+
+        # Offsets of the separators between the periods
+        self.breaks = []
+        offset = 0
+        for period in periods[:-1]:
+            offset += len(period)
+            self.breaks.append(offset)
+            offset += len(self.separator)
+
+    @property
+    def periods(self):
+        """The periods of the edited paragraph"""
+        result = []
+        start = 0
+        for offset in self.breaks:
+            result.append(self.text[start:offset])
+            start = offset + len(self.separator)
+        result.append(self.text[start:])
+        return result
+
+    def find_all(self, phrase):
+        """Offsets of the non-overlapping occurrences of a phrase"""
+        result = []
+        if not phrase:
+            return result
+
+        offset = self.text.find(phrase)
+        while offset != -1:
+            result.append(offset)
+            offset = self.text.find(phrase, offset + len(phrase))
+        return result
+
+    def edit(self, start, end, new=''):
+        """Replace the text between two offsets. Periods whose
+        separator lies in the edited text are joined and separators
+        of the new text split its period
+        :params start : Start offset
+        :params end : End offset
+        :params new : New text
+        """
+        width = len(self.separator)
+        first = bisect.bisect_left(self.breaks, start - width + 1)
+        last = bisect.bisect_left(self.breaks, end)
+        shift = len(new) - (end - start)
+        self.breaks[first:] = [offset + shift for offset in self.breaks[last:]]
+        self.text = self.text[:start] + new + self.text[end:]
+
+        # Separators may also be formed with the text around the edit
+        window = self.text[max(start - width + 1, 0): start + len(new) + width - 1]
+        if self.separator in window:
+            self.split_period(first, start, start + len(new))
+
+    def split_period(self, index, start, end):
+        """Add the breaks of the separators of a period that overlap
+        an edited range. Separators inside tokenizer exceptions are
+        skipped
+        :params index : Index of the period
+        :params start : Start offset of the edited range
+        :params end : End offset of the edited range
+        """
+        width = len(self.separator)
+        low = self.breaks[index - 1] + width if index > 0 else 0
+        high = self.breaks[index] if index < len(self.breaks) else len(self.text)
+
+        found = []
+        offset = low
+        for piece in tokenizer.tokenizer.split(
+                self.text[low:high], False, self.separator)[:-1]:
+            offset += len(piece)
+            if start - width < offset < end:
+                found.append(offset)
+            offset += width
+        self.breaks[index:index] = found
+
+    def insert(self, offset, new):
+        """Insert text at an offset"""
+        self.edit(offset, offset, new)
+
+    def replace(self, old, new):
+        """Replace every occurrence of a phrase
+        Returns the number of replacements
+        """
+        offsets = self.find_all(old)
+        for offset in reversed(offsets):
+            self.edit(offset, offset + len(old), new)
+        return len(offsets)
 
 
 def replace_phrase(
@@ -15,11 +121,10 @@ def replace_phrase(
     :paragraph optional detect phrase in certain paragraph
     """
 
-    joined = '. '.join(s)
-    joined = re.sub(old_phrase, new_phrase, joined)
-    splitted = tokenizer.tokenizer.split(joined, False, '. ')
+    editor = PhraseEditor(s)
+    editor.replace(old_phrase, new_phrase)
 
-    return splitted
+    return editor.periods
 
 
 def remove_phrase(s, old_phrase):
@@ -33,12 +138,12 @@ def insert_phrase(
         old_phrase=''):
     """Phrase insertion with respect to another phrase"""
 
-    joined = '. '.join(s)
+    editor = PhraseEditor(s)
 
     if position == 'prepend':
-        joined = new_phrase + ' ' + joined
+        editor.insert(0, new_phrase + ' ')
     elif position == 'append':
-        joined = joined + ' ' + new_phrase
+        editor.insert(len(editor.text), ' ' + new_phrase)
     elif position in ['before', 'after']:
         assert(old_phrase != '')
         if position == 'before':
@@ -47,12 +152,9 @@ def insert_phrase(
             rep = old_phrase + ' ' + new_phrase
         else:
             raise Exception('Not a valid position')
-        q = replace_phrase(s, old_phrase, rep)
-        joined = '. '.join(q)
-
-    splitted = tokenizer.tokenizer.split(joined, False, '. ')
+        editor.replace(old_phrase, rep)
 
-    return splitted
+    return editor.periods
 
 
 def get_cases(s):
@@ -152,67 +254,178 @@ def detect_prhase_locations(s, tree):
     return tree
 
 
-def insert_case(s, case_letter, content, suffix=')'):
-    if not content.startswith(case_letter):
-        content = case_letter + suffix + content
+def is_greek_numeral(s):
+    """Whether a string is a greek numeral as written in case markers"""
+    value = entities.Numerals.greek_nums_to_int(s)
+    return value > 0 and entities.Numerals.int_to_greek_num(value) == s
 
-    return insert_phrase(s, content)
 
+def split_case_letter(case_letter, text=None, suffix=')'):
+    """Split a case letter of arbitrary depth (e.g. αβ) to the
+    prefix of its parent cases and its own numeral. Numerals of
+    several letters (e.g. στ, ια) are tried before the shorter ones
+    :params text : Text of the paragraph. If given, the split whose
+    case marker is found in the text is preferred
+    :params suffix : Suffix of the markers
+    """
+    case_letter = case_letter.strip(')').strip('΄')
+    splits = [(case_letter[:i], case_letter[i:])
+              for i in range(len(case_letter))
+              if is_greek_numeral(case_letter[i:])
+              and all(is_greek_numeral(c) for c in case_letter[:i])]
+    if not splits:
+        splits = [(case_letter[:-1], case_letter[-1:])]
+
+    if text is not None:
+        for prefix, numeral in splits:
+            value = entities.Numerals.greek_nums_to_int(numeral)
+            if len(find_cases(text, prefix=prefix, suffix=suffix)) >= value:
+                return prefix, entities.Numerals.GreekNum(numeral)
+
+    prefix, numeral = splits[0]
+    return prefix, entities.Numerals.GreekNum(numeral)
+
+
+def find_cases(text, prefix='', suffix=')'):
+    """Offsets of the consecutive case markers α), β), ... of a text
+    :params text : Text of the paragraph
+    :params prefix : Letters of the parent cases
+    :params suffix : Suffix of the markers
+    Returns a list of (offset, marker) tuples
+    """
+    cases = []
+    start = 0
+    for marker in entities.Numerals.greek_num_generator(suffix=suffix):
+        marker = prefix + marker
+        offset = text.find(marker, start)
+        while offset > 0 and not text[offset - 1].isspace():
+            offset = text.find(marker, offset + 1)
+        if offset == -1:
+            break
+        cases.append((offset, marker))
+        start = offset + len(marker)
 
-def replace_case(s, case_letter, new_content, suffix=')'):
-    """Replaces a case (περίπτωση, υποπερίπτωση) of arbitrary depth"""
+    return cases
 
-    # find depth of splitting
-    case_letter = case_letter.strip(')').strip('΄')
-    depth = len(case_letter)
 
-    prefix = case_letter[:len(case_letter) - 1]
-    case_letter = case_letter[-1]
+def case_span(editor, prefix, value, suffix=')'):
+    """Offsets of a case from its marker up to the next case or the
+    end of the case it belongs to
+    :params editor : PhraseEditor of the paragraph
+    :params prefix : Letters of the parent cases
+    :params value : Value of the case numeral
+    :params suffix : Suffix of the markers
+    Returns the markers of the cases, the start and end offsets and
+    the marker of the case
+    """
+    cases = find_cases(editor.text, prefix=prefix, suffix=suffix)
+    start, marker = cases[value - 1]
+    if value < len(cases):
+        end = cases[value][0]
+    else:
+        end = len(editor.text)
 
-    case_numeral = entities.Numerals.GreekNum(case_letter)
+    for depth in range(len(prefix)):
+        parents = find_cases(editor.text, prefix=prefix[:depth], suffix=suffix)
+        parent = entities.Numerals.GreekNum(prefix[depth]).value
+        if parent < len(parents) and parents[parent][0] > start:
+            end = min(end, parents[parent][0])
 
-    # split cases
-    s = tokenizer.tokenizer.split_cases(
-        s, case_numeral.value + 1, prefix=prefix, suffix=suffix)
+    return cases, start, end, marker
 
-    # replace content
-    s[case_numeral.value] = ' ' + new_content
 
-    joined = tokenizer.tokenizer.join_cases(s, prefix=prefix)
+def content_end(editor, start, end):
+    """End of the content of a case without the whitespace or the
+    period separator before the next case"""
+    separator = end - len(editor.separator)
+    if separator >= start and separator in editor.breaks:
+        return separator
+    return start + len(editor.text[start:end].rstrip())
 
-    return tokenizer.tokenizer.split(joined, False, '. ')
 
+def insert_case(s, case_letter, content, suffix=')'):
+    if not content.startswith(case_letter):
+        content = case_letter + suffix + content
 
-def renumber_case(s, case_letter, new_letter, suffix=')'):
-    """Renumbers a case of arbitrary depth"""
+    return insert_phrase(s, content)
 
-    case_letter = ' ' + case_letter.strip(')').strip('΄') + suffix + ' '
-    new_letter = ' ' + new_leter.strip(')').strip('΄')
-    s = re.sub(case_letter, new_letter, s)
 
-    return tokenizer.tokenizer.split(s, False, '. ')
+def replace_case(s, case_letter, new_content, suffix=')', span=None):
+    """Replaces a case (περίπτωση, υποπερίπτωση) of arbitrary depth
+    :params span : Span of the case as returned by case_span, e.g.
+    from the document tree of the law. Found in the text if None
+    """
 
+    editor = PhraseEditor(s)
+    if span is None:
+        prefix, case_numeral = split_case_letter(
+            case_letter, editor.text, suffix)
+        span = case_span(editor, prefix, case_numeral.value, suffix)
+    _, start, end, marker = span
 
-def delete_case(s, case_letter):
-    """Deletes a case of arbitrary depth
-    Performs auto-renumbering"""
+    # keep the marker and the separator before the next case
+    if not new_content.startswith(marker):
+        start += len(marker)
+        new_content = ' ' + new_content
+    end = content_end(editor, start, end)
 
-    # find depth of splitting
-    case_letter = case_letter.strip(')').strip('΄')
-    depth = len(case_letter)
+    editor.edit(start, end, new_content)
 
-    prefix = case_letter[:len(case_letter) - 1]
-    case_letter = case_letter[-1]
+    return editor.periods
 
-    case_numeral = entities.Numerals.GreekNum(case_letter)
 
-    # split cases
-    s = tokenizer.tokenizer.split_cases(
-        s, case_numeral.value + 1, prefix=prefix)
+def renumber_case(s, case_letter, new_letter, suffix=')', span=None):
+    """Renumbers a case of arbitrary depth
+    :params span : Span of the case as returned by case_span. Found in
+    the text if None
+    """
 
-    # delete content
-    del s[case_numeral.value]
+    new_letter = new_letter.strip(')').strip('΄')
 
-    joined = tokenizer.tokenizer.join_cases(s, prefix=prefix)
+    editor = PhraseEditor(s)
+    if span is None:
+        prefix, case_numeral = split_case_letter(
+            case_letter, editor.text, suffix)
+        cases = find_cases(editor.text, prefix=prefix, suffix=suffix)
+        start, marker = cases[case_numeral.value - 1]
+    else:
+        _, start, _, marker = span
+    editor.edit(start, start + len(marker), new_letter + suffix)
+
+    return editor.periods
+
+
+def delete_case(s, case_letter, suffix=')', span=None):
+    """Deletes a case of arbitrary depth
+    Performs auto-renumbering
+    :params span : Span of the case as returned by case_span. Found in
+    the text if None
+    """
+
+    editor = PhraseEditor(s)
+    if span is None:
+        prefix, case_numeral = split_case_letter(
+            case_letter, editor.text, suffix)
+        span = case_span(editor, prefix, case_numeral.value, suffix)
+    cases, start, end, marker = span
+
+    # renumber the following cases from the last one so that the
+    # offsets of the rest stay valid
+    following = [i for i in range(cases.index((start, marker)) + 1, len(cases))
+                 if cases[i][0] >= end]
+    for i in reversed(following):
+        offset, marker = cases[i]
+        editor.edit(offset, offset + len(marker), cases[i - 1][1])
+
+    # the last case takes the separator before it along and leaves
+    # the one after it to the text that follows
+    if end not in [offset for offset, _ in cases]:
+        end = content_end(editor, start, end)
+        separator = start - len(editor.separator)
+        if separator in editor.breaks:
+            start = separator
+        else:
+            start = len(editor.text[:start].rstrip())
+    editor.edit(start, end)
 
-    return tokenizer.tokenizer.split(joined, False, '. ')
+    return editor.periods
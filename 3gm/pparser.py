@@ -22,6 +22,10 @@ import sys
 import phrase_fun
 import syntax
 import json
+import issue_cache
+import law_index
+import law_tree
+from concurrent.futures import ProcessPoolExecutor
 
 # configuration and parameters
 
@@ -31,6 +35,31 @@ logging.basicConfig(
 params = {'size': 200, 'iter': 20, 'window': 2, 'min_count': 15,
           'workers': max(1, multiprocessing.cpu_count() - 1), 'sample': 1E-3, }
 
+YEAR_REGEX = r'([1-2][0-9][0-9][0-9])'
+
+# Bump whenever parsing output changes to invalidate cached issues.
+# Cache keys also hold a digest of the sources of the parsing modules,
+# so cached issues are not reused after these change
+ISSUE_PARSER_VERSION = 2
+
+# Hits and misses of the paragraph text cache of every LawParser
+text_cache_stats = collections.Counter()
+
+
+def issue_parser_version():
+    """Version of the cached issues: the parser version and the
+    digest of the modules producing them, including those building
+    the index and document tree pickled with the laws"""
+    global issue_parser_digest
+    if issue_parser_digest is None:
+        issue_parser_digest = issue_cache.source_digest(
+            [sys.modules[__name__], entities, helpers, tokenizer,
+             law_index, law_tree, phrase_fun])
+    return '{}:{}'.format(ISSUE_PARSER_VERSION, issue_parser_digest)
+
+
+issue_parser_digest = None
+
 
 class IssueParser:
     """
@@ -43,12 +72,34 @@ class IssueParser:
     4. Detect Signatories of Given Documents
     5. Train a word2vec model with gensim for further usage."""
 
-    def __init__(self, filename, stdin=False, toTxt=False):
+    def __init__(self, filename, stdin=False, toTxt=False, streaming=False,
+                 keep_lines=None, use_cache=True, name=None):
+        """Parse an issue from a file
+        :param filename : Path of the issue (.txt or .pdf) or an open file object
+        :param stdin : Read the issue from standard input
+        :param streaming : Ingest the issue in a single pass over its lines
+        instead of reading the whole file and walking it several times
+        :param keep_lines : Keep the cleaned lines in self.lines. Defaults
+        to False in streaming mode, so that memory stays bounded, and is
+        always True otherwise (detect_new_laws and detect_signatories
+        need them)
+        :param use_cache : Load and store the parsed issue in the
+        on-disk issue cache (files only)
+        :param name : Identifier of the issue, defaults to the filename
+        """
         self.filename = filename
         self.lines = []
-        tmp_lines = []
-
-        if not stdin:
+        self.cache_key = None
+        close_file = False
+        if keep_lines is None or not streaming:
+            keep_lines = not streaming
+
+        if stdin:
+            infile = sys.stdin
+        elif hasattr(filename, 'read'):
+            infile = filename
+            filename = getattr(filename, 'name', 'stream')
+        else:
             filetype = mimetypes.guess_type(filename)[0]
 
             # if it is in PDF format convert it to txt
@@ -60,58 +111,141 @@ class IssueParser:
             elif filetype != 'text/plain':
                 raise UnrecognizedFileException(filename)
 
-        if not stdin:
+            if use_cache and issue_cache.issue_cache.enabled:
+                self.cache_key = issue_cache.issue_cache.key(
+                    filename, issue_parser_version())
+                state = issue_cache.issue_cache.load(self.cache_key)
+                if state is not None:
+                    self.__setstate__(state)
+                    if not keep_lines:
+                        self.lines = []
+                    self.filename = filename
+                    self.name = name or filename.replace('.pdf', '')
+                    return
+
             infile = open(filename, 'r')
+            close_file = True
+
+        self.dates = []
+        self.articles = {}
+        self.articles_as_paragraphs = {}
+        self.sentences = {}
+        self.extracts = {}
+        self.non_extracts = {}
+        self.statutes = {}
+        if name:
+            self.name = name
+        elif not stdin:
+            self.name = filename.replace('.pdf', '')
+        else:
+            self.name = 'stdin'
 
+        if streaming:
+            self.ingest(infile, keep_lines=keep_lines)
+        else:
+            self.lines = list(self.read_lines(infile))
+            self.find_dates()
+            self.find_articles()
+            self.detect_statutes()
 
+        if close_file:
+            infile.close()
 
-        # remove ugly hyphenthation
-        while True:
-            if not stdin:
-                l = infile.readline()
-            else:
-                l = sys.stdin.readline()
-            if not l:
-                break
+        # Only complete states are cached, the lines included
+        if not keep_lines:
+            self.cache_key = None
+        if self.cache_key:
+            issue_cache.issue_cache.store(self.cache_key, self.__getstate__())
+
+    def read_lines(self, infile):
+        """Generator over the cleaned lines of an issue. Removes
+        hyphenthation, headers and page numbers and captures the
+        issue number on the way
+        :param infile : File object to read from
+        """
+        for l in infile:
+            # remove ugly hyphenthation
             l = l.replace('−\n', '')
             l = l.replace('\n', ' ')
             l = re.sub(r' +', ' ', l)
             l = helpers.fix_par_abbrev(l)
-            tmp_lines.append(l)
 
-        if not stdin:
-            infile.close()
-
-        for line in tmp_lines:
-            if line == '':
+            if l == '':
                 continue
-            elif line.startswith('Τεύχος') or line.startswith('ΕΦΗΜΕΡΙ∆Α TΗΣ ΚΥΒΕΡΝΗΣΕΩΣ') or line.startswith('ΕΦΗΜΕΡΙΣ ΤΗΣ ΚΥΒΕΡΝΗΣΕΩΣ'):
+            elif l.startswith('Τεύχος') or l.startswith('ΕΦΗΜΕΡΙ∆Α TΗΣ ΚΥΒΕΡΝΗΣΕΩΣ') or l.startswith('ΕΦΗΜΕΡΙΣ ΤΗΣ ΚΥΒΕΡΝΗΣΕΩΣ'):
                 continue
-            else:
-                try:
-                    n = int(line)
-                    continue
-                except ValueError:
-                    self.lines.append(line)
-                    if line.startswith('Αρ. Φύλλου'):
-                        for x in line.split(' '):
-                            if x.isdigit():
-                                self.issue_number = x
-                                break
+            try:
+                n = int(l)
+                continue
+            except ValueError:
+                pass
 
-        self.dates = []
-        self.find_dates()
-        self.articles = {}
-        self.articles_as_paragraphs = {}
-        if not stdin:
-            self.name = filename.replace('.pdf', '')
-        else:
-            self.name = 'stdin'
-        self.sentences = {}
-        self.find_articles()
-        self.detect_statutes()
+            if l.startswith('Αρ. Φύλλου'):
+                for x in l.split(' '):
+                    if x.isdigit():
+                        self.issue_number = x
+                        break
+            yield l
+
+    def ingest(self, infile, keep_lines=False, min_extract_chars=100):
+        """Single pass ingestion of an issue. Dates, the issue year,
+        article boundaries, extracts and statutes are detected while
+        the lines are read, so only the article being assembled is
+        held in memory besides the results.
+        :param infile : File object to read from
+        :param keep_lines : Also store the cleaned lines in self.lines
+        :param min_extract_chars : Minimum size of an extract
+        """
+        now = datetime.now()
+        title = None
+        content = []
 
+        for i, line in enumerate(self.read_lines(infile)):
+            if keep_lines:
+                self.lines.append(line)
 
+            result = entities.date_regex.findall(line)
+            if result != []:
+                self.dates.append((i, result))
+
+            if not hasattr(self, 'year'):
+                res = re.search(YEAR_REGEX, line)
+                if res and 1976 <= int(res.group()) <= now.year:
+                    self.year = int(res.group())
+
+            if line.startswith('Άρθρο') or line.startswith(
+                    'Ο Πρόεδρος της Δημοκρατίας'):
+                if title is not None:
+                    self.add_article_content(
+                        title, content, min_extract_chars)
+                if line not in self.articles:
+                    self.articles[line] = ''
+                title = line
+                content = []
+            elif title is not None:
+                content.append(line)
+
+        # the last heading closes no article
+        if title is not None and title not in self.extracts:
+            self.split_extracts(title, min_extract_chars)
+            self.detect_article_statutes(title)
+
+        for d in [self.articles, self.extracts, self.non_extracts,
+                  self.statutes, self.sentences]:
+            d.pop('Ο Πρόεδρος της Δημοκρατίας', None)
+
+        self.set_issue_dates()
+
+    def add_article_content(self, article, content, min_extract_chars=100):
+        """Store the lines of an article and detect its extracts
+        and statutes
+        :param article : The article heading
+        :param content : The lines of the article
+        """
+        self.articles[article] = ''.join(content)
+        self.articles_as_paragraphs[article] = self.split_paragraphs(content)
+        self.split_extracts(article, min_extract_chars)
+        self.detect_article_statutes(article)
 
     def __str__(self):
         return self.name
@@ -138,27 +272,21 @@ class IssueParser:
         self.statutes = {}
 
         for article in self.articles.keys():
-            for extract in self.get_non_extracts(article):
+            self.detect_article_statutes(article)
 
-                legislative_acts = list(re.finditer(
-                    entities.legislative_act_regex, extract))
-                laws = list(re.finditer(entities.law_regex, extract))
-                presidential_decrees = list(re.finditer(
-                    entities.presidential_decree_regex, extract))
-                legislative_decrees = list(re.finditer(
-                    entities.legislative_decree_regex, extract))
-
-                self.statutes[article] = []
-                self.statutes[article].extend(laws)
-                self.statutes[article].extend(legislative_acts)
-                self.statutes[article].extend(presidential_decrees)
-                self.statutes[article].extend(legislative_decrees)
+        return self.statutes
 
-                self.statutes[article] = [statute.group()
-                                          for statute in self.statutes[article]]
+    def detect_article_statutes(self, article):
+        """Detect the statutes of a single article"""
+        for extract in self.get_non_extracts(article):
 
-        return self.statutes
+            # Grouped by type as laws, acts, presidential decrees
+            # and legislative decrees
+            self.statutes[article] = [
+                statute.text for statute in entities.statute_scanner.findall(
+                    extract, order=entities.StatuteScanner.types)]
 
+        return self.statutes[article]
 
     def __contains__(self, key):
         for article in self.articles.keys():
@@ -186,9 +314,25 @@ class IssueParser:
     def __dict__(self):
         return self.serialize()
 
+    # __dict__ is shadowed above so pickling (used to send parsed issues
+    # back from worker processes) needs the state spelled out
+    pickled_attributes = [
+        'filename', 'name', 'lines', 'dates', 'year', 'issue_number',
+        'issue_date', 'signed_date', 'articles', 'articles_as_paragraphs',
+        'sentences', 'extracts', 'non_extracts', 'statutes',
+        'cached_new_laws']
+
+    def __getstate__(self):
+        return {key: getattr(self, key)
+                for key in IssueParser.pickled_attributes
+                if hasattr(self, key)}
+
+    def __setstate__(self, state):
+        for key, val in state.items():
+            setattr(self, key, val)
+
     def find_dates(self):
         """Detect all dates withing the given document"""
-        year_regex = r'([1-2][0-9][0-9][0-9])'
         now = datetime.now()
 
         for i, line in enumerate(self.lines):
@@ -197,13 +341,17 @@ class IssueParser:
                 self.dates.append((i, result))
 
         for line in self.lines:
-            res = re.search(year_regex, line)
+            res = re.search(YEAR_REGEX, line)
             if res:
                 result = int(res.group())
                 if 1976 <= result <= now.year:
                     self.year = result
                     break
 
+        return self.set_issue_dates()
+
+    def set_issue_dates(self):
+        """Set issue and signing date from the detected dates"""
         if self.dates == []:
             logging.warning('Could not find dates!')
             return []
@@ -238,26 +386,10 @@ class IssueParser:
 
             content = self.lines[article_indices[j]
                                  [0] + 1: article_indices[j + 1][0]]
-            paragraphs = collections.defaultdict(list)
-            current = '0'
-            for t in content:
-                x = re.search(r'\d+.', t)
-                if x and x.span() in [(0, 2), (0, 3)]:
-                    current = x.group().strip('.')
-                paragraphs[current].append(t)
-
-            sentences = {}
-
-            for par in paragraphs.keys():
-                val = ''.join(paragraphs[par])[1:]
-                paragraphs[par] = val
-                sentences[par] = list(
-                    filter(
-                        lambda x: x.rstrip() != '',
-                        tokenizer.tokenizer.split(val, False, '. ')))
 
             self.articles[article_indices[j][1]] = ''.join(content)
-            self.articles_as_paragraphs[article_indices[j][1]] = paragraphs
+            self.articles_as_paragraphs[article_indices[j][1]] = \
+                self.split_paragraphs(content)
         try:
             del self.articles['Ο Πρόεδρος της Δημοκρατίας']
         except BaseException:
@@ -267,41 +399,62 @@ class IssueParser:
         self.non_extracts = {}
 
         for article in self.articles.keys():
+            self.split_extracts(article, min_extract_chars)
 
-            # find extracts
-            left_quot = [m.start()
-                         for m in re.finditer('«', self.articles[article])]
-            right_quot = [m.start()
-                          for m in re.finditer('»', self.articles[article])]
-            left_quot.extend(right_quot)
-            temp_extr = sorted(left_quot)
-            res_extr = []
-            c = '«'
-            for idx in temp_extr:
-                if c == '«' and self.articles[article][idx] == c:
-                    res_extr.append(idx)
-                    c = '»'
-                elif c == '»' and self.articles[article][idx] == c:
-                    res_extr.append(idx)
-                    c = '«'
-            self.extracts[article] = list(zip(res_extr[::2], res_extr[1::2]))
-
-            # drop extracts with small chars
-            self.extracts[article] = sorted(
-                list(
-                    filter(
-                        lambda x: x[1] -
-                        x[0] +
-                        1 >= min_extract_chars,
-                        self.extracts[article])),
-                key=lambda x: x[0])
-
-            tmp = self.articles[article].strip('-').split('.')
-
-            # remove punctuation
-            tmp = [re.sub(r'[^\w\s]', '', s) for s in tmp]
-            tmp = [line.split(' ') for line in tmp]
-            self.sentences[article] = tmp
+    def split_paragraphs(self, content):
+        """Group the lines of an article into numbered paragraphs"""
+        paragraphs = collections.defaultdict(list)
+        current = '0'
+        for t in content:
+            x = re.search(r'\d+.', t)
+            if x and x.span() in [(0, 2), (0, 3)]:
+                current = x.group().strip('.')
+            paragraphs[current].append(t)
+
+        for par in paragraphs.keys():
+            paragraphs[par] = ''.join(paragraphs[par])[1:]
+
+        return paragraphs
+
+    def split_extracts(self, article, min_extract_chars=100):
+        """Detect the extracts of an article and split it into sentences"""
+
+        # find extracts
+        left_quot = [m.start()
+                     for m in re.finditer('«', self.articles[article])]
+        right_quot = [m.start()
+                      for m in re.finditer('»', self.articles[article])]
+        left_quot.extend(right_quot)
+        temp_extr = sorted(left_quot)
+        res_extr = []
+        c = '«'
+        for idx in temp_extr:
+            if c == '«' and self.articles[article][idx] == c:
+                res_extr.append(idx)
+                c = '»'
+            elif c == '»' and self.articles[article][idx] == c:
+                res_extr.append(idx)
+                c = '«'
+        self.extracts[article] = list(zip(res_extr[::2], res_extr[1::2]))
+
+        # drop extracts with small chars
+        self.extracts[article] = sorted(
+            list(
+                filter(
+                    lambda x: x[1] -
+                    x[0] +
+                    1 >= min_extract_chars,
+                    self.extracts[article])),
+            key=lambda x: x[0])
+
+        tmp = self.articles[article].strip('-').split('.')
+
+        # remove punctuation
+        tmp = [re.sub(r'[^\w\s]', '', s) for s in tmp]
+        tmp = [line.split(' ') for line in tmp]
+        self.sentences[article] = tmp
+
+        return self.extracts[article]
 
     def get_extracts(self, article):
         """Get direct parts that should be added, modified or deleted"""
@@ -383,6 +536,14 @@ class IssueParser:
         3. Construction of LawParser Objects and parse the law corpus
         4. Keep the new laws in a dictionary"""
 
+        # new laws of cached issues are restored from their serialization
+        if getattr(self, 'cached_new_laws', None) is not None:
+            self.new_laws = {}
+            for identifier, serialized in self.cached_new_laws.items():
+                self.new_laws[identifier] = LawParser.from_serialized(
+                    serialized)[0]
+            return self.new_laws
+
         new_law_regex = entities.LegalEntities.ratification
         self.new_laws = {}
         regions_of_interest = []
@@ -392,6 +553,7 @@ class IssueParser:
                 regions_of_interest.append(i)
 
         if regions_of_interest == []:
+            self.cache_new_laws()
             return self.new_laws
         else:
             regions_of_interest.append(len(self.lines) - 1)
@@ -428,8 +590,18 @@ class IssueParser:
                     self.new_laws[identifier].find_corpus(
                         government_gazette_issue=True)
 
+        self.cache_new_laws()
         return self.new_laws
 
+    def cache_new_laws(self):
+        """Store the detected new laws alongside the cached issue"""
+        if not self.cache_key:
+            return
+        self.cached_new_laws = {
+            identifier: law.serialize()
+            for identifier, law in self.new_laws.items()}
+        issue_cache.issue_cache.store(self.cache_key, self.__getstate__())
+
 
 class UnrecognizedFileException(Exception):
 
@@ -437,27 +609,280 @@ class UnrecognizedFileException(Exception):
         super().__init__('Unrecognized filetype ' + str(filename))
 
 
-def get_issues_from_dataset(directory='../data', text_format=False):
-    cwd = os.getcwd()
-    os.chdir(directory)
-    issues = []
-    if text_format:
-        filelist = glob.glob('*.txt')
-        for filename in filelist:
-            issue = IssueParser(filename)
-            issues.append(issue)
-    else:
-        filelist = glob.glob('*.pdf')
+def parse_issue(filename):
+    """Parse a single issue given its absolute path. PDF files
+    are converted to text first. Used by the process pool of
+    iter_issues_from_dataset so it has to live at module level
+    :params filename : Absolute path of the issue
+    """
+    if filename.endswith('.pdf'):
+        outfile = filename[:-len('.pdf')] + '.txt'
+        logging.info(outfile)
+        if not os.path.isfile(outfile):
+            os.system('pdf2txt.py {} > {}'.format(filename, outfile))
+        filename = outfile
+    return IssueParser(filename, name=issue_name(filename))
+
+
+def issue_name(filename):
+    """Identifier of an issue file. The absolute path is only used to
+    open the file, so that identifiers do not depend on the location
+    of the dataset"""
+    return os.path.basename(filename)
+
+
+def list_issues(directories, text_format=False):
+    """List issue files of one or more directories as absolute
+    paths sorted by filename within each directory"""
+    if isinstance(directories, str):
+        directories = [directories]
+
+    suffix = '*.txt' if text_format else '*.pdf'
+    filelist = []
+    for directory in directories:
+        directory = os.path.abspath(directory)
+        filelist.extend(sorted(glob.glob(os.path.join(directory, suffix))))
+
+    return filelist
+
+
+def iter_issues(filelist, workers=None, chunksize=1):
+    """Parse issues in parallel and yield them in the order given
+    :params filelist : Absolute paths of the issues
+    :params workers : Number of worker processes (default is all cores).
+    With workers=1 parsing happens in the current process
+    :params chunksize : Number of files sent to a worker at once
+    """
+    if workers == 1 or len(filelist) <= 1:
         for filename in filelist:
-            outfile = filename.strip('.pdf') + '.txt'
-            logging.info(outfile)
-            if not os.path.isfile(outfile):
-                os.system('pdf2txt.py {} > {}'.format(filename, outfile))
-            issue = IssueParser(outfile)
-            issues.append(issue)
+            yield parse_issue(filename)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for issue in executor.map(
+                parse_issue, filelist, chunksize=chunksize):
+            yield issue
+
+
+def iter_issues_from_dataset(
+        directory='../data',
+        text_format=False,
+        workers=None,
+        chunksize=1):
+    """Parse issues in parallel and yield them in filename order
+    :params directory : Directory or list of directories of issues
+    :params text_format : Parse .txt files instead of .pdf files
+    See iter_issues for the rest of the parameters
+    """
+    filelist = list_issues(directory, text_format=text_format)
+
+    return iter_issues(filelist, workers=workers, chunksize=chunksize)
+
+
+def get_issues_from_dataset(
+        directory='../data',
+        text_format=False,
+        workers=None,
+        chunksize=1):
+    """Return the parsed issues of a dataset in filename order.
+    See iter_issues_from_dataset for the parameters"""
+    return list(iter_issues_from_dataset(
+        directory,
+        text_format=text_format,
+        workers=workers,
+        chunksize=chunksize))
+
 
-    os.chdir(cwd)
-    return issues
+class CorpusAttribute:
+    """Attribute of LawParser produced by find_corpus. The corpus of
+    a law read from a file is split on the first access of any such
+    attribute instead of in the constructor"""
+
+    def __set_name__(self, owner, name):
+        self.name = '_' + name
+
+    def __get__(self, law, owner):
+        if law is None:
+            return self
+        law.load_corpus()
+        return getattr(law, self.name)
+
+    def __set__(self, law, value):
+        setattr(law, self.name, value)
+
+
+AmendmentOutcome = collections.namedtuple(
+    'AmendmentOutcome', ['tree', 'applied', 'error'])
+
+# Marks content missing before a change
+_missing = object()
+
+
+class LawTransaction:
+    """Batch of amendments on a law created by LawParser.transaction().
+    The committed law is serialized once, when result is first read.
+    In atomic
+    batches the content changed by the mutators is recorded before
+    the first change, so if an amendment fails every change of the
+    batch is rolled back and the exception is raised again"""
+
+    def __init__(self, law, atomic=True):
+        """Transaction constructor
+        :params law : LawParser object
+        :params atomic : Roll back the batch if an amendment fails
+        """
+        self.law = law
+        self.atomic = atomic
+        self.journal = []
+        self.recorded = set()
+        self.keys = None
+        self.outcomes = []
+        self.committed = False
+        self._result = None
+
+    def __enter__(self):
+        if self.law.active_transaction is not None:
+            raise Exception('Nested transactions are not supported')
+        self.law.active_transaction = self
+        if self.atomic:
+            # Articles may also appear by reading missing keys
+            self.keys = (set(self.law.sentences), set(self.law.articles))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.law.active_transaction = None
+        if exc_type is None:
+            self.committed = True
+        elif self.atomic:
+            self.rollback()
+        return False
+
+    @property
+    def result(self):
+        """Serialized law after the batch, None if it did not commit"""
+        if self.committed and self._result is None:
+            self._result = self.law.serialize()
+        return self._result
+
+    def record(self, article, paragraph=None):
+        """Record the content of an article or paragraph before its
+        first change in the batch
+        :params article : Article number
+        :params paragraph : Paragraph number or None for the article
+        """
+        if not self.atomic or (article, paragraph) in self.recorded:
+            return
+        self.recorded.add((article, paragraph))
+
+        law = self.law
+        paragraphs = law.sentences.get(article)
+        if paragraph is None:
+            periods = _missing if paragraphs is None else {
+                p: list(v) for p, v in paragraphs.items()}
+            raw = law.articles.get(article, _missing)
+            if raw is not _missing:
+                raw = dict(raw)
+            self.journal.append((article, None, periods, raw,
+                                 law.titles.get(article, _missing),
+                                 law.lemmas.get(article, _missing),
+                                 law.corpus.get(article, _missing)))
+        else:
+            periods = (paragraphs or {}).get(paragraph, _missing)
+            if periods is not _missing:
+                periods = list(periods)
+            raw = law.articles.get(article, {}).get(paragraph, _missing)
+            self.journal.append((article, paragraph, periods, raw))
+
+    def record_all(self):
+        """Record the whole law before it is replaced"""
+        if not self.atomic:
+            return
+        law = self.law
+        self.journal.append((None, None, law.sentences, law.articles,
+                             law.titles, law.lemmas, law.corpus))
+
+    def rollback(self):
+        """Undo every change of the batch"""
+        law = self.law
+        for entry in reversed(self.journal):
+            article, paragraph = entry[:2]
+            if article is None:
+                (law.sentences, law.articles, law.titles,
+                 law.lemmas, law.corpus) = entry[2:]
+                law.touch_all()
+                continue
+
+            if paragraph is None:
+                targets = [law.sentences, law.articles, law.titles,
+                           law.lemmas, law.corpus]
+                for target, value in zip(targets, entry[2:]):
+                    if value is _missing:
+                        target.pop(article, None)
+                    else:
+                        target[article] = value
+            else:
+                periods, raw = entry[2:]
+                for target, value in [(law.sentences, periods),
+                                      (law.articles, raw)]:
+                    if value is _missing:
+                        if article in target:
+                            target[article].pop(paragraph, None)
+                    else:
+                        target.setdefault(article, {})[paragraph] = value
+            law.touch(article, paragraph)
+
+        for target, keys in zip([law.sentences, law.articles], self.keys):
+            for article in set(target) - keys:
+                del target[article]
+                law.touch(article)
+
+        self.journal = []
+        self.recorded = set()
+
+    def apply(self, tree):
+        """Apply an action tree to the law
+        :params tree : A query tree generated from syntax.py
+        Returns the outcome of the operation
+        """
+        try:
+            self.law.query_from_tree(tree)
+        except BaseException as e:
+            self.outcomes.append(AmendmentOutcome(tree, False, e))
+            if self.atomic:
+                raise
+        else:
+            self.outcomes.append(AmendmentOutcome(tree, True, None))
+
+        return self.outcomes[-1]
+
+    def apply_amendment(self, s, is_removal=False):
+        """Apply the action trees of an amendment that target the law
+        :params s : Amendment text
+        :params is_removal : Detect removals
+        Returns the outcomes of the action trees. Trees targeting other
+        laws are reported as not applied
+        """
+        return self.apply_trees(LawParser.amendment_trees(s, is_removal))
+
+    def apply_trees(self, trees):
+        """Apply the action trees that target the law
+        :params trees : Action trees, e.g. from
+        syntax.ActionTreeGenerator.generate_action_trees
+        Returns the outcomes of the action trees
+        """
+        outcomes = []
+        for tree in trees:
+            try:
+                target = tree['law']['_id']
+            except (KeyError, TypeError):
+                target = None
+
+            if target == self.law.identifier:
+                outcomes.append(self.apply(tree))
+            else:
+                self.outcomes.append(AmendmentOutcome(tree, False, None))
+                outcomes.append(self.outcomes[-1])
+        return outcomes
 
 
 class LawParser:
@@ -510,10 +935,45 @@ class LawParser:
         self.sentences = collections.defaultdict(dict)
         self.amendee = None
 
-        self.find_corpus(fix_paragraphs=False)
-        self.detect_entities()
-
-
+        # Corpus splitting and entity detection are deferred
+        # until first accessed
+        self.pending_corpus = self.lines != []
+        self.entity_lines = self.lines
+        self._entities = None
+
+        # Version history: the articles of the last committed version
+        # and the articles and paragraphs changed since. None marks
+        # every article as changed
+        self.committed = None
+        self.dirty = None
+        self.active_transaction = None
+
+        # Rendered paragraphs, sorted keys, the period index and the
+        # document tree, dropped by touch()
+        self.index = law_index.LawIndex(self)
+        self.document = law_tree.LawTree(self)
+        self.invalidate()
+
+    articles = CorpusAttribute()
+    titles = CorpusAttribute()
+    corpus = CorpusAttribute()
+    sentences = CorpusAttribute()
+
+    @property
+    def entities(self):
+        """Entities of the law, detected on first access"""
+        if self._entities is None:
+            self.detect_entities()
+        return self._entities
+
+    @entities.setter
+    def entities(self, value):
+        self._entities = value
+
+    def load_corpus(self):
+        """Split the corpus of the law file if not done already"""
+        if self.pending_corpus:
+            self.find_corpus(fix_paragraphs=False)
 
     def __repr__(self):
         return self.identifier
@@ -592,6 +1052,8 @@ class LawParser:
         """Analyzes the corpus to articles, paragraphs and
         then sentences"""
 
+        self.pending_corpus = False
+
         idx = []
         for i, line in enumerate(self.lines):
             if line.startswith('Αρθρο:') or line.startswith('Άρθρο '):
@@ -654,146 +1116,10 @@ class LawParser:
 
 
     def detect_entities(self):
-        """Detect all entities within the issue and stores them in a dictionary"""
-
-
-        # Creating entity dictionary and setting keys
-        self.entities = {}
-        self.entities["Urls"] = []
-        self.entities["CPC Codes"] = []
-        self.entities["CPV Codes"] = []
-        self.entities["IBANs"] = []
-        self.entities["E-mails"] = []
-        self.entities["Id Numbers"] = []
-        self.entities["Military Personel"] = []
-        self.entities["Natura 2000 Regions"] = []
-        self.entities["Scales"] = []
-        self.entities["EU Directives"] = []
-        self.entities["EU Regulations"] = []
-        self.entities["EU Decisions"] = []
-        self.entities["Phone Numbers"] = []
-        self.entities["Protocols"] = []
-        self.entities["AFM numbers"] = []
-        self.entities["NUTS Region Codes"] = []
-        self.entities["Exact times"] = []
-        self.entities["Ship Tonnage"] = []
-        self.entities["KAEK Codes"] = []
-        self.entities["Hull"] = []
-        self.entities["Flags"] = []
-        self.entities["Monetary Amounts"] = []
-        self.entities["Metrics"] = []
-        self.entities["Conditions"] = []
-        self.entities["Contraints"] = []
-        self.entities["Durations"] = []
-
-        # Iterating through lines
-        for i , line in enumerate(self.lines):
-
-                urls = re.findall(entities.urls,line)
-                cpc = re.findall(entities.cpc, line)
-                cpv = re.findall(entities.cpv,line)
-                ibans = re.findall(entities.ibans,line)
-                e_mails = re.findall(entities.e_mails,line)
-                id_numbers = re.findall(entities.id_numbers, line)
-                military_personel = re.findall(entities.military_personel_id, line)
-                natura_regions = re.findall(entities.natura_regions,line)
-                scales =  re.findall(entities.scales, line)
-                directives_eu =  re.findall(entities.directives_eu, line)
-                regulations_eu = re.findall(entities.regulations_eu, line)
-                decisions_eu = re.findall(entities.decisions_eu, line)
-                phone_numbers = re.findall(entities.phone_numbers, line)
-                protocols = re.findall(entities.protocols, line)
-                afm = re.findall(entities.afm, line)
-                nuts_reg = re.findall(entities.nuts_reg, line)
-                exact_times = re.findall(entities.exact_times, line)
-                tonnage = re.findall(entities.tonnage, line)
-                kaek = re.findall(entities.kaek, line)
-                hull = re.findall(entities.hull, line)
-                flag = re.findall(entities.flag, line)
-                money = entities.get_monetary_amounts(line)
-                metrics = entities.get_metrics(line)
-                conditions = entities.get_conditions(line)
-                constraints = entities.get_constraints(line)
-                durations = entities.get_durations(line)
-
-                if urls != []:
-                    self.entities["Urls"].append((i,urls))
-
-                if cpc != []:
-                    self.entities["CPC Codes"].append((i,cpc))
-
-                if cpv != []:
-                    self.entities["CPV Codes"].append((i,cpv))
-
-                if ibans != []:
-                    self.entities["IBANs"].append((i,ibans))
-
-                if e_mails != []:
-                    self.entities["E-mails"].append((i,e_mails))
-
-                if id_numbers != []:
-                    self.entities["Id Numbers"].append((i,id_numbers))
-
-                if military_personel != []:
-                    self.entities["Military Personel"].append((i,military_personel))
-
-                if natura_regions != []:
-                    self.entities["Natura 2000 Regions"].append((i,natura_regions))
-
-                if scales != []:
-                    self.entities["Scales"].append((i,scales))
-
-                if directives_eu != []:
-                    self.entities["EU Directives"].append((i,directives_eu))
-
-                if regulations_eu != []:
-                    self.entities["EU Regulations"].append((i,regulations_eu))
-
-                if decisions_eu != []:
-                    self.entities["EU Decisions"].append((i,decisions_eu))
-
-                if phone_numbers != []:
-                    self.entities["Phone Numbers"].append((i,phone_numbers))
-
-                if protocols != []:
-                    self.entities["Protocols"].append((i,protocols))
-
-                if afm != []:
-                    self.entities["AFM numbers"].append((i,afm))
-
-                if nuts_reg != []:
-                    self.entities["NUTS Region Codes"].append((i,nuts_reg))
-
-                if exact_times != []:
-                    self.entities["Exact times"].append((i,exact_times))
-
-                if tonnage != []:
-                    self.entities["Ship Tonnage"].append((i,tonnage))
-
-                if kaek != []:
-                    self.entities["KAEK Codes"].append((i,kaek))
-
-                if hull != []:
-                    self.entities["Hull"].append((i,hull))
-
-                if flag != []:
-                    self.entities["Flags"].append((i,flag))
-
-                if money != []:
-                    self.entities["Monetary Amounts"].append((i,money))
-
-                if metrics != []:
-                    self.entities["Metrics"].append((i,metrics))
-
-                if conditions != []:
-                    self.entities["Conditions"].append((i,conditions))
-
-                if constraints != []:
-                    self.entities["Contraints"].append((i,constraints))
-
-                if durations != []:
-                    self.entities["Durations"].append((i,durations))
+        """Detect all entities within the law file and stores them in a dictionary"""
 
+        self.load_corpus()
+        self.entities = entities.entity_engine.scan(self.entity_lines)
 
         return self.entities
 
@@ -824,6 +1150,125 @@ class LawParser:
 
         return data
 
+    def touch(self, article, paragraph=None):
+        """Mark an article or a paragraph as changed since the last
+        committed version. Mutators call it before changing anything
+        so that an active transaction can record the old content
+        :params article : Article number
+        :params paragraph : Paragraph number. If None the whole article
+        is marked
+        """
+        article = str(article)
+        if paragraph is not None:
+            paragraph = str(paragraph)
+
+        self.invalidate(article, paragraph)
+        if self.active_transaction is not None:
+            self.active_transaction.record(article, paragraph)
+
+        if self.dirty is None:
+            return
+        if paragraph is None:
+            self.dirty[article] = None
+        else:
+            paragraphs = self.dirty.setdefault(article, set())
+            if paragraphs is not None:
+                paragraphs.add(paragraph)
+
+    def touch_all(self):
+        """Mark every article as changed"""
+        if self.active_transaction is not None:
+            self.active_transaction.record_all()
+        self.invalidate()
+        self.dirty = None
+
+    def transaction(self, atomic=True):
+        """Start a batch of amendments. Mutators skip serialization
+        inside the batch and the law is serialized once, if the
+        result of the batch is read
+        :params atomic : Roll back every change of the batch if one
+        amendment fails
+        Usage:
+            with law.transaction() as batch:
+                batch.apply(tree)
+        """
+        return LawTransaction(self, atomic=atomic)
+
+    def updated(self):
+        """Serialization returned by mutators. Deferred to the commit
+        inside a transaction"""
+        if self.active_transaction is not None:
+            return None
+        return self.serialize()
+
+    def commit_version(self):
+        """Freeze the current articles into an immutable version.
+        The version shares every unchanged article and paragraph with
+        the previous one, so only the changed nodes are copied.
+        Returns the articles of the version and the delta from the
+        previous one. The delta maps every changed article to None if
+        it was removed or to its changed paragraphs, where removed
+        paragraphs map to None
+        """
+        previous = self.committed or {}
+        sentences = self.sentences
+
+        if self.dirty is None:
+            changed = dict.fromkeys(itertools.chain(sentences, previous))
+        else:
+            # articles may also appear by reading missing keys
+            changed = dict(self.dirty)
+            for article in sentences.keys() - previous.keys():
+                changed.setdefault(article, None)
+
+        version = dict(previous)
+        delta = {}
+
+        for article, paragraphs in changed.items():
+            if article not in sentences:
+                if article in previous:
+                    del version[article]
+                    delta[article] = None
+                continue
+
+            current = sentences[article]
+            old = previous.get(article, {})
+            if paragraphs is None:
+                paragraphs = dict.fromkeys(itertools.chain(current, old))
+
+            frozen = dict(old)
+            changes = {}
+            for paragraph in paragraphs:
+                if paragraph not in current:
+                    if paragraph in old:
+                        del frozen[paragraph]
+                        changes[paragraph] = None
+                elif current[paragraph] != old.get(paragraph):
+                    frozen[paragraph] = list(current[paragraph])
+                    changes[paragraph] = frozen[paragraph]
+
+            if changes or article not in previous:
+                version[article] = frozen
+                delta[article] = changes
+
+        self.committed = version
+        self.dirty = {}
+
+        return version, delta
+
+    def serialize_version(self):
+        """Commit a version and serialize it. The articles are shared
+        with the other committed versions and must not be modified.
+        Returns the serialized version and the delta of its articles
+        """
+        articles, delta = self.commit_version()
+        data = self.serialize(full=False)
+        data['lemmas'] = dict(self.lemmas)
+        data['titles'] = dict(self.titles)
+        data['articles'] = articles
+
+        return data, delta
+
     @staticmethod
     def from_serialized(x):
         identifier = x['_id']
@@ -883,6 +1328,7 @@ class LawParser:
             sentences[key] = tokenizer.tokenizer.split(val, False, '. ')
             paragraphs[key] = val
 
+        self.touch(article)
         self.sentences[article] = sentences
 
         if title:
@@ -890,7 +1336,7 @@ class LawParser:
         if lemmas:
             self.lemmas[article] = lemmas
 
-        return self.serialize()
+        return self.updated()
 
     def remove_article(self, article):
         """Removal of article based on its id
@@ -898,6 +1344,7 @@ class LawParser:
         """
 
         article = str(article)
+        self.touch(article)
         try:
             del self.sentences[article]
         except BaseException:
@@ -915,7 +1362,7 @@ class LawParser:
         except BaseException:
             logging.warning('Could not find titles')
 
-        return self.serialize()
+        return self.updated()
 
     def add_paragraph(self, article, paragraph, content):
         """Addition of paragraph on article
@@ -934,11 +1381,12 @@ class LawParser:
             content = content.rstrip('.')
 
         # add in its full form or split into periods
+        self.touch(article, paragraph)
         self.articles[article][paragraph] = content
         self.sentences[article][paragraph] = tokenizer.tokenizer.split(
             content, False, '. ')
 
-        return self.serialize()
+        return self.updated()
 
     def remove_paragraph(self, article, paragraph):
         """Removal of paragraph"""
@@ -946,12 +1394,68 @@ class LawParser:
         article = str(article)
         paragraph = str(paragraph)
 
+        self.touch(article, paragraph)
         try:
             del self.sentences[article][paragraph]
         except BaseException:
             pass
 
-        return self.serialize()
+        return self.updated()
+
+    def document_order(self, locations):
+        """Sort (article, paragraph) locations in the order of the law"""
+        if len(locations) < 2:
+            return locations
+        articles = {article: i for i, article in enumerate(self.sentences)}
+        paragraphs = {}
+        for article in set(article for article, _ in locations):
+            paragraphs[article] = {
+                paragraph: i for i, paragraph in enumerate(self.sentences[article])}
+        return sorted(locations, key=lambda x: (
+            articles[x[0]], paragraphs[x[0]][x[1]]))
+
+    def locate_period(self, period, article=None, paragraph=None):
+        """Paragraphs holding a period, looked up in the period index
+        :params period : Period text, optionally without its last character
+        :params article : Search only this article
+        :params paragraph : Search only this paragraph of the article
+        Returns (article, paragraph) locations in the order of the law
+        """
+        locations = self.index.find_period(period)
+        if article:
+            article = str(article)
+            if paragraph:
+                paragraph = str(paragraph)
+                # Missing paragraphs raise as when searched directly
+                self.sentences[article][paragraph]
+            locations = [(a, p) for a, p in locations
+                         if a == article and (not paragraph or p == paragraph)]
+
+        return self.document_order(locations)
+
+    def locate_phrase(self, phrase, article=None, paragraph=None):
+        """Paragraphs holding a phrase. Without an article every
+        paragraph holding it is found through the word index
+        :params phrase : Phrase text
+        :params article : Search only this article
+        :params paragraph : Search only this paragraph of the article
+        Returns (article, paragraph) locations in the order of the law
+        """
+        if article and paragraph:
+            return [(article, paragraph)]
+
+        if article:
+            article = str(article)
+            locations = [(article, p) for p in self.sentences[article]]
+        else:
+            locations = self.index.find_phrase(phrase)
+            if locations is None:
+                locations = [(a, p) for a in self.sentences
+                             for p in self.sentences[a]]
+
+        return self.document_order([
+            (a, p) for a, p in locations
+            if phrase in '. '.join(self.sentences[a][p])])
 
     def replace_phrase(
             self,
@@ -965,13 +1469,16 @@ class LawParser:
         :article optional detect phrase in certain article
         :paragraph optional detect phrase in certain paragraph
         """
-        self.sentences[article][paragraph] = phrase_fun.replace_phrase(
-            self.sentences[article][paragraph],
-            new_phrase=new_phrase,
-            old_phrase=old_phrase
-        )
+        for article, paragraph in self.locate_phrase(
+                old_phrase, article, paragraph):
+            self.touch(article, paragraph)
+            self.sentences[article][paragraph] = phrase_fun.replace_phrase(
+                self.sentences[article][paragraph],
+                new_phrase=new_phrase,
+                old_phrase=old_phrase
+            )
 
-        return self.serialize()
+        return self.updated()
 
     def remove_phrase(self, old_phrase, article=None, paragraph=None):
         """Removal of certain phrase i.e. replacement with empty string"""
@@ -987,14 +1494,21 @@ class LawParser:
             paragraph=None):
         """Phrase insertion with respect to another phrase"""
 
-        self.sentences[article][paragraph] = phrase_fun.insert_phrase(
-            self.sentences[article][paragraph],
-            new_phrase=new_phrase,
-            position=position,
-            old_phrase=old_phrase
-        )
+        if position in ['before', 'after']:
+            locations = self.locate_phrase(old_phrase, article, paragraph)
+        else:
+            locations = [(article, paragraph)]
 
-        return self.serialize()
+        for article, paragraph in locations:
+            self.touch(article, paragraph)
+            self.sentences[article][paragraph] = phrase_fun.insert_phrase(
+                self.sentences[article][paragraph],
+                new_phrase=new_phrase,
+                position=position,
+                old_phrase=old_phrase
+            )
+
+        return self.updated()
 
     def renumber_case(
             self,
@@ -1010,13 +1524,16 @@ class LawParser:
         :params paragraph : Paragraph Number
         """
 
-        self.sentence[article][paragraph] = phrase_fun.renumber_case(
+        span = self.case_span(article, paragraph, case_letter, suffix)
+        self.touch(article, paragraph)
+        self.sentences[article][paragraph] = phrase_fun.renumber_case(
             s=self.sentences[article][paragraph],
             case_letter=case_letter,
             new_letter=new_letter,
-            suffix=suffix)
+            suffix=suffix,
+            span=span)
 
-        return self.serialize()
+        return self.updated()
 
     def insert_case(
             self,
@@ -1033,14 +1550,15 @@ class LawParser:
         params paragraph : paragraph number
         """
 
-        tmp = phrase_fun.insert_case(
+        self.touch(article, paragraph)
+        self.sentences[article][paragraph] = phrase_fun.insert_case(
             s=self.sentences[article][paragraph],
             case_letter=case_letter,
             content=content,
             suffix=suffix
         )
 
-        return self.serialize()
+        return self.updated()
 
     def replace_case(
             self,
@@ -1057,14 +1575,17 @@ class LawParser:
         params paragraph : paragraph number
         """
 
+        span = self.case_span(article, paragraph, case_letter, suffix)
+        self.touch(article, paragraph)
         self.sentences[article][paragraph] = phrase_fun.replace_case(
             s=self.sentences[article][paragraph],
             case_letter=case_letter,
             new_content=new_content,
-            suffix=suffix
+            suffix=suffix,
+            span=span
         )
 
-        return self.serialize()
+        return self.updated()
 
     def delete_case(
             self,
@@ -1079,12 +1600,32 @@ class LawParser:
         params paragraph : paragraph number
         """
 
+        span = self.case_span(article, paragraph, case_letter)
+        self.touch(article, paragraph)
         self.sentences[article][paragraph] = phrase_fun.delete_case(
             s=self.sentences[article][paragraph],
             case_letter=case_letter,
+            span=span
         )
 
-        return self.serialize()
+        return self.updated()
+
+    def case_span(self, article, paragraph, case_letter, suffix=')'):
+        """Span of a case taken from the document tree, None if the
+        tree does not hold it so that phrase_fun finds it in the text
+        :params case_letter : The greek case letter
+        :params article : article number
+        :params paragraph : paragraph number
+        :params suffix : ending suffix
+        """
+        # The tree holds the cases marked with ')'
+        if suffix != ')' or not case_letter:
+            return None
+        try:
+            return self.document.case_span(
+                str(article), str(paragraph), case_letter.strip(')').strip('΄'))
+        except KeyError:
+            return None
 
     def replace_period(
             self,
@@ -1095,33 +1636,21 @@ class LawParser:
             paragraph=None):
         """Replacement of a period with new content"""
         if position is None:
-            search_all = (article is None)
-
-            if article:
-                delegate_articles = [str(article)]
-
-                if paragraph:
-                    delegate_paragraphs = [str(paragraph)]
-                else:
-                    delegate_paragraphs = self.sentences[article].keys()
-            else:
-                delegate_articles = self.articles.keys()
-
-            for article in delegate_articles:
-                if search_all:
-                    delegate_paragraphs = self.sentences[article].keys()
-
-                for paragraph in delegate_paragraphs:
-                    for i, period in enumerate(
-                            self.sentences[article][paragraph]):
-                        if old_period == period:
-                            self.sentences[article][paragraph][i] = new_period
+            for article, paragraph in self.locate_period(
+                    old_period, article, paragraph):
+                for i, period in enumerate(
+                        self.sentences[article][paragraph]):
+                    if old_period == period:
+                        self.touch(article, paragraph)
+                        self.sentences[article][paragraph][i] = new_period
         elif position == 'append':
+            self.touch(article, paragraph)
             self.sentences[article][paragraph][-1] = new_period
         else:
+            self.touch(article, paragraph)
             self.sentences[article][paragraph][int(position)] = new_period
 
-        return self.serialize()
+        return self.updated()
 
     def remove_period(
             self,
@@ -1131,33 +1660,20 @@ class LawParser:
             paragraph=None):
         """Removal of period"""
 
-        search_all = (article is None)
-
         if position is None:
-            if article:
-                delegate_articles = [str(article)]
-
-                if paragraph:
-                    delegate_paragraphs = [str(paragraph)]
-                else:
-                    delegate_paragraphs = self.sentences[article].keys()
-            else:
-                delegate_articles = self.sentences.keys()
-
-            for article in delegate_articles:
-                if search_all:
-                    delegate_paragraphs = self.sentences[article].keys()
-
-                for paragraph in delegate_paragraphs:
-                    for i, period in enumerate(
-                            self.sentences[article][paragraph]):
-                        if old_period == period or old_period == period[:-1]:
-                            del self.sentences[article][paragraph][i]
-                            return self.serialize()
+            for article, paragraph in self.locate_period(
+                    old_period, article, paragraph):
+                for i, period in enumerate(
+                        self.sentences[article][paragraph]):
+                    if old_period == period or old_period == period[:-1]:
+                        self.touch(article, paragraph)
+                        del self.sentences[article][paragraph][i]
+                        return self.updated()
         else:
+            self.touch(article, paragraph)
             del self.sentences[article][paragraph][int(position)]
 
-        return self.serialize()
+        return self.updated()
 
     def insert_period(
             self,
@@ -1180,47 +1696,36 @@ class LawParser:
         if position in ['start', 'end']:
             assert(article and paragraph)
             if position == 'start':
+                self.touch(article, paragraph)
                 self.sentences[article][paragraph].insert(0, new_period)
             else:
                 self.append_period(new_period, article, paragraph)
 
-            return self.serialize()
+            return self.updated()
 
         elif isinstance(position, int):
+            self.touch(article, paragraph)
             self.sentences[article][paragraph].insert(position, new_period)
-            return self.serialize()
+            return self.updated()
         else:
-            search_all = (article is None)
-
-            if article:
-                delegate_articles = [str(article)]
-
-                if paragraph:
-                    delegate_paragraphs = [str(paragraph)]
-                else:
-                    delegate_paragraphs = self.sentences[article].keys()
-            else:
-                delegate_articles = self.sentences.keys()
-
-            for article in delegate_articles:
-                if search_all:
-                    delegate_paragraphs = self.sentences[article].keys()
-
-                for paragraph in delegate_paragraphs:
-                    for i, period in enumerate(
-                            self.sentences[article][paragraph]):
-                        if period == old_period or old_period == period[:-1]:
-                            if position == 'before':
-                                self.sentences[article][paragraph].insert(
-                                    max(0, i - 1), new_period)
-                                return self.serialize()
-
-                            elif position == 'after':
-                                self.sentences[article][paragraph].insert(
-                                    i + 1, new_period)
-                                return self.serialize()
-
-        return self.serialize()
+            for article, paragraph in self.locate_period(
+                    old_period, article, paragraph):
+                for i, period in enumerate(
+                        self.sentences[article][paragraph]):
+                    if period == old_period or old_period == period[:-1]:
+                        if position == 'before':
+                            self.touch(article, paragraph)
+                            self.sentences[article][paragraph].insert(
+                                max(0, i - 1), new_period)
+                            return self.updated()
+
+                        elif position == 'after':
+                            self.touch(article, paragraph)
+                            self.sentences[article][paragraph].insert(
+                                i + 1, new_period)
+                            return self.updated()
+
+        return self.updated()
 
     def append_period(self, content, article, paragraph):
         """Append period to article and paragraph
@@ -1230,6 +1735,7 @@ class LawParser:
         """
         assert(article and paragraph)
         article, paragraph = str(article), str(paragraph)
+        self.touch(article, paragraph)
         self.sentences[article][paragraph].append(content)
 
     def set_title(self, content, article):
@@ -1239,8 +1745,9 @@ class LawParser:
         """
         assert(article)
         article = str(article)
+        self.touch(article)
         self.titles[article] = content
-        return self.serialize()
+        return self.updated()
 
     def delete_title(self, article):
         """Delete the title of an article
@@ -1248,42 +1755,52 @@ class LawParser:
         """
         assert(article)
         article = str(article)
+        self.touch(article)
         del self.titles[article]
-        return self.serialize()
+        return self.updated()
 
     def renumber_article(self, old_id, new_id):
         """Renumber article to new id"""
         assert(article)
+        self.touch(old_id)
+        self.touch(new_id)
         self.sentences[new_id] = copy.deepcopy(self.sentences[old_id])
         del self.sentences[old_id]
-        return self.serialize()
+        return self.updated()
 
     def renumber_paragraph(self, article, old_id, new_id):
         """Renumber paragraph to new id"""
         assert(article)
+        self.touch(article, old_id)
+        self.touch(article, new_id)
         self.sentences[article][new_id] = copy.deepcopy(
             self.sentences[article][old_id])
         del self.sentences[article][old_id]
-        return self.serialize()
+        return self.updated()
 
     def delete(self):
+        self.touch_all()
         self.sentences = {}
         self.titles = {}
-        return self.serialize()
+        return self.updated()
 
     def apply_amendment(self, s, is_removal=False, throw_exceptions=False):
         """Applies amendment given a string s
         params s: Query string
         params throw_exceptions: Throw exceptions upon unsucessfull operations
         """
+        return self.apply_trees(
+            LawParser.amendment_trees(s, is_removal), throw_exceptions)
+
+    def apply_trees(self, trees, throw_exceptions=False):
+        """Applies the action trees of an amendment
+        params trees: Action trees, e.g. from
+        syntax.ActionTreeGenerator.generate_action_trees
+        params throw_exceptions: Throw exceptions upon unsucessfull operations
+        """
         detected = 0
         applied = 0
 
-        if is_removal:
-            trees, exc = syntax.ActionTreeGenerator.detect_removals(s)
-        else:
-            trees = syntax.ActionTreeGenerator.generate_action_tree_from_string(
-                s)
         for t in trees:
             detected = 1
             try:
@@ -1295,6 +1812,19 @@ class LawParser:
                     raise UnrecognizedAmendmentException(t)
         return detected, applied, self
 
+    @staticmethod
+    def amendment_trees(s, is_removal=False):
+        """Action trees of an amendment
+        params s: Query string
+        params is_removal: Detect removals
+        """
+        if is_removal:
+            trees, exc = syntax.ActionTreeGenerator.detect_removals(s)
+        else:
+            trees = syntax.ActionTreeGenerator.generate_action_tree_from_string(
+                s)
+        return trees
+
     def query_from_tree(self, tree):
         """Returns a serizlizable object from a tree in nested form
         :params tree : A query tree generated from syntax.py
@@ -1320,7 +1850,7 @@ class LawParser:
 
             elif context in ['παράγραφος', 'παράγραφοι', 'paragraph']:
                 if not tree['paragraph']['_id'].isdigit():
-                    tree['article']['_id'] = self.get_next_paragraph(
+                    tree['paragraph']['_id'] = self.get_next_paragraph(
                         tree['article']['_id'])
                 return self.add_paragraph(
                     article=tree['article']['_id'],
@@ -1373,10 +1903,11 @@ class LawParser:
                     article=tree['article']['_id']
                 )
             elif context in ['περίπτωση', 'περιπτώσεις', 'υποπερίπτωση', 'υποπεριπτώσεις', 'case']:
+                address = self.document.address(tree)
                 if context in ['περίπτωση', 'περιπτώσεις', 'case']:
-                    case_letter = tree['case']['_id']
+                    case_letter = address[2]
                 else:
-                    case_letter = tree['subcase']['_id']
+                    case_letter = self.document.case_letter(address)
 
                 if tree['root']['action'] in ['προστίθεται', 'προστίθενται']:
                     return self.insert_case(
@@ -1438,10 +1969,11 @@ class LawParser:
                 )
 
             elif context in ['περίπτωση', 'περιπτώσεις', 'υποπερίπτωση', 'υποπεριπτώσεις', 'case', 'subcase']:
+                address = self.document.address(tree)
                 if context in ['περίπτωση', 'περιπτώσεις']:
-                    case_letter = tree['case']['_id']
+                    case_letter = address[2]
                 else:
-                    case_letter = tree['subcase']['_id']
+                    case_letter = self.document.case_letter(address)
 
                 return self.delete_case(
                     case_letter=case_letter,
@@ -1470,10 +2002,11 @@ class LawParser:
                     tree['what']['to']
                 )
             elif context in ['περίπτωση', 'περιπτώσεις', 'υποπεριπτώση', 'υποπεριπτώσεις', 'case', 'subcase']:
+                address = self.document.address(tree)
                 if context in ['περίπτωση', 'περιπτώσεις']:
-                    case_letter = tree['case']['_id']
+                    case_letter = address[2]
                 else:
-                    case_letter = tree['subcase']['_id']
+                    case_letter = self.document.case_letter(address)
 
                 return self.renumber_case(
                     case_letter=case_letter,
@@ -1483,115 +2016,169 @@ class LawParser:
             else:
                 raise UnsupportedOperationException(tree)
 
-        return self.serialize()
+        return self.updated()
+
+    def invalidate(self, article=None, paragraph=None):
+        """Drop the cached text and key order of changed content
+        :params article : Article number. If None everything is dropped
+        :params paragraph : Paragraph number. If None the whole article
+        is dropped
+        """
+        self.index.invalidate(article, paragraph)
+        self.document.invalidate(article, paragraph)
+        if article is None:
+            self.paragraph_texts = {}
+            self.article_texts = {}
+            self.paragraph_orders = {}
+            self.article_order = None
+            return
+
+        self.article_texts.pop(article, None)
+        self.paragraph_orders.pop(article, None)
+        if paragraph is None:
+            self.paragraph_texts.pop(article, None)
+            self.article_order = None
+        elif article in self.paragraph_texts:
+            self.paragraph_texts[article].pop(paragraph, None)
 
     def get_paragraph(self, article, paragraph_id):
         """Join sentences to paragraph
         :params article : Article number
         :params paragraph_id : Paragraph ID
         """
+        texts = self.paragraph_texts.setdefault(article, {})
         try:
-            return '. '.join(self.sentences[article][paragraph_id]).rstrip('.') + '.'
-        except:
-            self.sentences[article][paragraph_id] = list(filter(
-                lambda p: p != None, self.sentences[article][paragraph_id]
-            ))
-        finally:
-            return '. '.join(self.sentences[article][paragraph_id]).rstrip('.') + '.'
-
-    def get_paragraphs(self, article):
-        """Return Paragraphs via a generator
-        :params article : The article number
-        """
+            text = texts[paragraph_id]
+        except KeyError:
+            pass
+        else:
+            text_cache_stats['hits'] += 1
+            return text
+
+        text_cache_stats['misses'] += 1
+        periods = self.sentences[article][paragraph_id]
+        if None in periods:
+            self.touch(article, paragraph_id)
+            periods = [p for p in periods if p is not None]
+            self.sentences[article][paragraph_id] = periods
+
+        text = '. '.join(periods).rstrip('.') + '.'
+        self.paragraph_texts.setdefault(article, {})[paragraph_id] = text
+        return text
+
+    def paragraph_order(self, article):
+        """Cached paragraph ids of an article in the order of the law"""
         def _get_par(x):
             try:
                 return int(x.strip(')'))
             except:
                 return 100
 
+        paragraphs = self.sentences[article]
+        order = self.paragraph_orders.get(article)
+        if order is None or len(order) != len(paragraphs):
+            order = sorted(paragraphs.keys(), key=_get_par)
+            self.paragraph_orders[article] = order
+        return order
+
+    def get_paragraphs_sorted(self, article):
+        """Returns the paragraph ids of an article sorted"""
+        return list(self.paragraph_order(str(article)))
+
+    def get_paragraphs(self, article):
+        """Return Paragraphs via a generator
+        :params article : The article number
+        """
         article = str(article)
-        for paragraph_id in sorted(
-                self.sentences[article].keys(),
-                key=_get_par):
-            yield self.get_paragraph(article, paragraph_id)
+        try:
+            texts = self.article_texts[article]
+        except KeyError:
+            pass
+        else:
+            text_cache_stats['hits'] += len(texts)
+            yield from texts
+            return
+
+        order = self.paragraph_order(article)
+        texts = []
+        for paragraph_id in order:
+            texts.append(self.get_paragraph(article, paragraph_id))
+            yield texts[-1]
+
+        # Keep the article only if nothing changed while iterating
+        if self.paragraph_orders.get(article) is order:
+            self.article_texts[article] = tuple(texts)
 
     def get_articles_sorted(self):
         """Returns the articles of the statute sorted"""
-        return sorted(self.sentences.keys(), key=lambda x: int(x))
-
-    def export_law(self, export_type='markdown', add_titles=True):
-        """Get law string in LaTeX, Markdown, string, plaintext and Issue-like format
-        :param identifier : Law identifier
+        if self.article_order is None or \
+                len(self.article_order) != len(self.sentences):
+            self.article_order = sorted(
+                self.sentences.keys(), key=lambda x: int(x))
+        return list(self.article_order)
+
+    # Header, article, title and paragraph templates and the number
+    # of the first paragraph of every export format
+    export_formats = {
+        'latex': ('\\chapter*{{ {} }}', '\\subsection*{{ Άρθρο {} }}\n',
+                  None, '\\paragraph {{ {}. }} {}\n', 0),
+        'markdown': ('# {}\n', '### Άρθρο {} \n', '#### {}\n', ' {}. {}\n', 0),
+        'str': ('', 'Άρθρο {} ', None, '{1}', 0),
+        'plaintext': ('', 'Άρθρο {} \n', '{}\n', ' {}. {}\n', 1),
+    }
+
+    def iter_export(self, export_type='markdown', add_titles=True):
+        """Get law in LaTeX, Markdown, string, plaintext and Issue-like
+        format as a generator of text chunks
+        :param export_type : Export format
+        :param add_titles : Add article titles (markdown and plaintext)
         """
-        if export_type not in [
-            'latex',
-            'markdown',
-            'str',
-            'plaintext',
-                'issue']:
+        if export_type not in self.export_formats and export_type != 'issue':
             raise Exception('Unrecognized export type')
 
-        if export_type == 'latex':
-            result = '\chapter*{{ {} }}'.format(self.identifier)
-            for article in self.get_articles_sorted():
-                result = result + \
-                    '\subsection*{{ Άρθρο {} }}\n'.format(article)
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + '\paragraph {{ {}. }} {}\n'.format(
-                        i, paragraph)
-        elif export_type == 'markdown':
-
-            result = '# {}\n'.format(self.identifier)
-            for article in self.get_articles_sorted():
-                result = result + '### Άρθρο {} \n'.format(article)
-                if add_titles:
-                    try:
-                        result = result + \
-                            '#### {}\n'.format(self.titles[article])
-                    except:
-                        pass
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + \
-                        ' {}. {}\n'.format(i, paragraph)
-
-        elif export_type == 'str':
-            result = ''
-            for article in self.get_articles_sorted():
-                result = result + 'Άρθρο {} '.format(article)
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + '{}'.format(paragraph)
-
-        elif export_type == 'plaintext':
-
-            result = ''
-            for article in self.get_articles_sorted():
-                result = result + 'Άρθρο {} \n'.format(article)
-                if add_titles:
-                    try:
-                        result = result + '{}\n'.format(self.titles[article])
-                    except:
-                        pass
-                for i, paragraph in enumerate(self.get_paragraphs(article)):
-                    result = result + \
-                        ' {}. {}\n'.format(i + 1, paragraph)
+        return self.export_chunks(export_type, add_titles)
 
-        elif export_type == 'issue':
+    def export_chunks(self, export_type, add_titles):
+        """Generator behind iter_export"""
+        if export_type == 'issue':
             abbreviations = {
                 'ν.': 'ΝΌΜΟΣ',
                 'π.δ.': 'ΠΡΟΕΔΡΙΚΟ ΔΙΑΤΑΓΜΑ',
                 'ν.δ.': 'ΝΟΜΟΘΕΤΙΚΟ ΔΙΑΤΑΓΜΑ'
             }
-            result = ''
 
             for key, val in abbreviations.items():
                 if self.identifier.lower().startswith(key):
                     counter = self.identifier.strip(key).split('/')[-2]
-                    result = '{} ΥΠ’ ΑΡΙΘΜ. {}\n'.format(val, counter)
+                    yield '{} ΥΠ’ ΑΡΙΘΜ. {}\n'.format(val, counter)
                     break
 
-            result = result + self.export_law('plaintext')
+            # The issue format is plaintext under the issue header
+            export_type, add_titles = 'plaintext', True
+
+        header, article_format, title_format, paragraph_format, first = \
+            self.export_formats[export_type]
+
+        yield header.format(self.identifier)
+        for article in self.get_articles_sorted():
+            yield article_format.format(article)
+            if add_titles and title_format and article in self.titles:
+                yield title_format.format(self.titles[article])
+            for i, paragraph in enumerate(self.get_paragraphs(article), first):
+                yield paragraph_format.format(i, paragraph)
+
+    def export_law(self, export_type='markdown', add_titles=True, outfile=None):
+        """Get law string in LaTeX, Markdown, string, plaintext and Issue-like format
+        :param export_type : Export format
+        :param add_titles : Add article titles (markdown and plaintext)
+        :param outfile : File object to write the law to instead of
+        returning it
+        """
+        chunks = self.iter_export(export_type, add_titles)
+        if outfile is None:
+            return ''.join(chunks)
 
-        return result
+        outfile.writelines(chunks)
 
     def prune_title(self, article):
         self.titles[article] = re.sub(
@@ -1603,12 +2190,10 @@ class LawParser:
             self.prune_title(title)
 
     def get_next_article(self):
-        maximum = max([int(x) for x in self.sentences.keys()])
-        return str(maximum + 1)
+        return self.document.next_article()
 
     def get_next_paragraph(self, article):
-        maximum = max([int(x) for x in self.sentences[article].keys()])
-        return str(maximum + 1)
+        return self.document.next_paragraph(article)
 
 
 class UnsupportedOperationException(Exception):
@@ -0,0 +1,156 @@
+'''
+    Binary snapshot of the codifier state used for warm starts.
+    A snapshot is a single file holding pickled records followed by an
+    index of their offsets. Restoring memory-maps the file and only
+    unpickles the records that are accessed.
+
+    Layout: header | records | index
+    The header holds a magic string, the format version and the offset
+    and length of the index.
+'''
+
+import collections.abc
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+
+SNAPSHOT_MAGIC = b'3GMSNAP\0'
+SNAPSHOT_VERSION = 1
+
+# magic, version, index offset, index length
+header = struct.Struct('<8sIQQ')
+
+
+class SnapshotFormatException(Exception):
+    """Raised on files that are not snapshots of this version"""
+
+    def __init__(self, filename):
+        super().__init__('Not a codifier snapshot (version {}): {}'.format(
+            SNAPSHOT_VERSION, filename))
+
+
+class SnapshotWriter:
+    """Writes records grouped in sections to a snapshot file.
+    The file appears atomically when the writer is closed"""
+
+    def __init__(self, filename):
+        """Snapshot writer constructor
+        :params filename : Snapshot path
+        """
+        self.filename = filename
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=directory)
+        self.f = os.fdopen(fd, 'wb')
+        self.f.write(header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, 0))
+        self.index = collections.defaultdict(dict)
+
+    def add(self, section, key, obj):
+        """Append a record
+        :params section : Section name (e.g. laws)
+        :params key : Key of the record in the section
+        :params obj : Picklable object
+        """
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        self.index[section][key] = (self.f.tell(), len(data))
+        self.f.write(data)
+
+    def close(self):
+        """Write the index and the header and move the file in place"""
+        data = pickle.dumps(dict(self.index),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+        offset = self.f.tell()
+        self.f.write(data)
+        self.f.seek(0)
+        self.f.write(header.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, offset, len(data)))
+        self.f.close()
+        os.replace(self.tmp, self.filename)
+
+
+class Snapshot:
+    """Read access to a memory-mapped snapshot"""
+
+    def __init__(self, filename):
+        """Open a snapshot
+        :params filename : Snapshot path
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, offset, length = header.unpack_from(self.data)
+        except struct.error:
+            raise SnapshotFormatException(filename)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotFormatException(filename)
+
+        self.index = pickle.loads(self.data[offset: offset + length])
+
+    def keys(self, section):
+        """Return the keys of a section"""
+        return list(self.index.get(section, {}).keys())
+
+    def __contains__(self, item):
+        section, key = item
+        return key in self.index.get(section, {})
+
+    def get(self, section, key):
+        """Unpickle a record
+        :params section : Section name
+        :params key : Key of the record
+        """
+        offset, length = self.index[section][key]
+        return pickle.loads(self.data[offset: offset + length])
+
+
+class SnapshotMapping(collections.abc.MutableMapping):
+    """Mapping over a snapshot section that builds its values on first
+    access. Assigned values shadow the snapshot ones"""
+
+    def __init__(self, snapshot, section, decode=None):
+        """Mapping constructor
+        :params snapshot : Snapshot object
+        :params section : Section name
+        :params decode : Function building the value from a record
+        """
+        self.snapshot = snapshot
+        self.section = section
+        self.decode = decode
+        self.identifiers = dict.fromkeys(snapshot.keys(section), True)
+        self.materialized = {}
+
+    def __contains__(self, key):
+        return key in self.identifiers
+
+    def __len__(self):
+        return len(self.identifiers)
+
+    def __iter__(self):
+        return iter(list(self.identifiers))
+
+    def __getitem__(self, key):
+        try:
+            return self.materialized[key]
+        except KeyError:
+            pass
+
+        if key not in self.identifiers:
+            raise KeyError(key)
+
+        value = self.snapshot.get(self.section, key)
+        if self.decode:
+            value = self.decode(value)
+        self.materialized[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.identifiers[key] = True
+        self.materialized[key] = value
+
+    def __delitem__(self, key):
+        del self.identifiers[key]
+        self.materialized.pop(key, None)
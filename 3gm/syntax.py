@@ -3,18 +3,43 @@ import json
 import re
 import collections
 import logging
+import os
 import helpers
 import tokenizer
 import itertools
+import bisect
 import copy
 import string
 import phrase_fun
+import tree_cache
 import spacy
 
 
 import el_core_news_sm
 nlp = el_core_news_sm.load()
 
+# Amendment detection only reads the dependency parse, so the other
+# pipeline components are disabled when parsing amendments
+NLP_DISABLE = ['tagger', 'morphologizer', 'attribute_ruler', 'lemmatizer', 'ner']
+NLP_BATCH_SIZE = 64
+
+# Bump when detection changes so that cached trees are not reused
+ACTION_TREE_VERSION = 2
+
+# Every normalized form of the amendment actions. A sentence yields
+# trees only if one of its tokens is such a form, so sentences without
+# any of them are not parsed
+action_forms_regex = re.compile('|'.join(sorted(
+    map(re.escape, entities.action_lookup.forms), key=len, reverse=True)))
+
+# Edits allowed between a token and an action form or the subject of
+# an action. Set CODIFIER_ACTION_MAX_DISTANCE to 1 for OCR'd issues,
+# whose keywords may be damaged
+ACTION_MAX_DISTANCE = int(os.environ.get('CODIFIER_ACTION_MAX_DISTANCE', 0))
+
+# Sentences parsed and skipped by the lexical pre-filter
+detection_stats = collections.Counter()
+
 
 class UncategorizedActionException(Exception):
     """This exception is raised whenever an action cannot be
@@ -55,6 +80,9 @@ class ActionTreeGenerator:
         'υποπερίπτωσ': 'subcase'
     }
 
+    # Compiled stems of trans_lookup
+    stem_regexes = [(stem, re.compile(stem)) for stem in trans_lookup]
+
     # Children Lookup (needed for nesting)
     children_loopkup = {
         'law': ['article'],
@@ -66,6 +94,14 @@ class ActionTreeGenerator:
         'phrase': []
     }
 
+    # Ties on the year are resolved in favour of the type appearing last
+    statute_order = [
+        'law',
+        'presidential_decree',
+        'legislative_act',
+        'legislative_decree'
+    ]
+
     @staticmethod
     def get_latest_statute(statutes):
         """Returns latest statute in a given list of
@@ -92,23 +128,8 @@ class ActionTreeGenerator:
         :params extract : Query String
         """
 
-        legislative_acts = list(
-            re.finditer(
-                entities.legislative_act_regex,
-                extract))
-        laws = list(re.finditer(entities.law_regex, extract))
-        presidential_decrees = list(re.finditer(
-            entities.presidential_decree_regex, extract))
-        legislative_decrees = list(
-            re.finditer(
-                entities.legislative_decree_regex,
-                extract))
-
-        laws.extend(presidential_decrees)
-        laws.extend(legislative_acts)
-        laws.extend(legislative_decrees)
-
-        laws = [law.group() for law in laws]
+        laws = [statute.text for statute in entities.statute_scanner.findall(
+            extract, order=ActionTreeGenerator.statute_order)]
 
         law = ActionTreeGenerator.get_latest_statute(laws)
 
@@ -120,16 +141,157 @@ class ActionTreeGenerator:
             nested=False,
             max_what_window=20,
             max_where_window=30,
-            use_regex=False):
+            use_regex=False,
+            prefilter=True):
         """Main algorithm for amendment detection
         The approach followed is hybrid
         The procedure is outlined here:
         https://github.com/eellak/gsoc2018-3gm/wiki/Algorithms-for-analyzing-Government-Gazette-Documents
         """
+        cache_key = ActionTreeGenerator.cache_key(
+            s, nested=nested, prefilter=prefilter)
+        trees = tree_cache.tree_cache.load(cache_key)
+        if trees is not None:
+            return trees
+
+        query = ActionTreeGenerator.prepare_query(s)
+        candidates = ActionTreeGenerator.candidates(query[3], prefilter)
+        parsed = ActionTreeGenerator.parse_documents(
+            [x for x, candidate in zip(query[3], candidates) if candidate])
+        docs = [next(parsed) if candidate else None
+                for candidate in candidates]
+
+        trees = ActionTreeGenerator.action_trees_from_docs(
+            query, docs, nested=nested)
+        tree_cache.tree_cache.store(cache_key, trees)
+        return trees
+
+    @staticmethod
+    def cache_key(s, kind='trees', nested=False, prefilter=True):
+        """Key of a detection result in the tree cache
+        :params s : Query string
+        :params kind : Kind of detection
+        :params nested : Nested trees
+        :params prefilter : Only sentences holding an action were parsed
+        """
+        try:
+            model = '{name}-{version}'.format(**nlp.meta)
+        except (AttributeError, KeyError, TypeError):
+            model = ''
+        if nested:
+            kind += '-nested'
+        if not prefilter:
+            kind += '-unfiltered'
+        if ACTION_MAX_DISTANCE:
+            kind += '-fuzzy{}'.format(ACTION_MAX_DISTANCE)
+
+        return tree_cache.tree_cache.key(
+            s, kind, '{}:{}'.format(ACTION_TREE_VERSION, model))
 
-        # results are stored here
+    @staticmethod
+    def generate_action_trees(
+            paragraphs,
+            nested=False,
+            batch_size=NLP_BATCH_SIZE,
+            n_process=1,
+            prefilter=True):
+        """Amendment detection on many paragraphs, parsing their
+        sentences in batches with nlp.pipe
+        :params paragraphs : Iterable of query strings
+        :params nested : Nest the trees
+        :params batch_size : Sentences per spaCy batch
+        :params n_process : Number of spaCy processes
+        :params prefilter : Parse only sentences holding an action
+        Yields the list of trees of every paragraph in order. Paragraphs
+        whose trees cannot be built yield an empty list. Paragraphs
+        found in the tree cache are not parsed
+        """
+        # Cached trees or the query and cache key of every paragraph
+        queries = []
+        for s in paragraphs:
+            cache_key = ActionTreeGenerator.cache_key(
+                s, nested=nested, prefilter=prefilter)
+            trees = tree_cache.tree_cache.load(cache_key)
+            if trees is not None:
+                queries.append(trees)
+                continue
 
-        trees = []
+            try:
+                query = ActionTreeGenerator.prepare_query(s)
+            except Exception as e:
+                logging.info('Detection failed: ' + str(e))
+                queries.append([])
+            else:
+                queries.append((query, ActionTreeGenerator.candidates(
+                    query[3], prefilter), cache_key))
+
+        docs = ActionTreeGenerator.parse_documents(
+            (x for query in queries if isinstance(query, tuple)
+             for x, candidate in zip(query[0][3], query[1]) if candidate),
+            batch_size=batch_size, n_process=n_process)
+
+        for query in queries:
+            if not isinstance(query, tuple):
+                yield query
+                continue
+
+            query, candidates, cache_key = query
+            query_docs = [next(docs) if candidate else None
+                          for candidate in candidates]
+            try:
+                trees = ActionTreeGenerator.action_trees_from_docs(
+                    query, query_docs, nested=nested)
+            except Exception as e:
+                logging.info('Detection failed: ' + str(e))
+                yield []
+            else:
+                tree_cache.tree_cache.store(cache_key, trees)
+                yield trees
+
+    @staticmethod
+    def candidates(sentences, prefilter=True):
+        """Tell the sentences that may hold an amendment, i.e. contain a
+        form of an action, from the ones that cannot
+        :params sentences : Sentences of a query
+        :params prefilter : If False every sentence is a candidate
+        """
+        if not prefilter:
+            return [True] * len(sentences)
+
+        result = [action_forms_regex.search(
+            entities.ActionLookup.normalize(x)) is not None
+            for x in sentences]
+        if ACTION_MAX_DISTANCE:
+            result = [r or entities.action_lookup.contains(
+                [w.strip(string.punctuation) for w in x.split()],
+                ACTION_MAX_DISTANCE) for r, x in zip(result, sentences)]
+        skipped = result.count(False)
+        detection_stats['parsed'] += len(result) - skipped
+        detection_stats['skipped'] += skipped
+        return result
+
+    @staticmethod
+    def parse_documents(texts, batch_size=NLP_BATCH_SIZE, n_process=1):
+        """Parse sentences with the components needed for detection
+        :params texts : Iterable of sentences
+        :params batch_size : Sentences per spaCy batch
+        :params n_process : Number of spaCy processes. Needs spaCy 2.2.2
+        or later if above 1
+        """
+        disable = [name for name in NLP_DISABLE if name in nlp.pipe_names]
+        # Older spaCy versions parse in a single process and do not
+        # accept n_process
+        kwargs = {'n_process': n_process} if n_process > 1 else {}
+        return nlp.pipe(texts, batch_size=batch_size, disable=disable,
+                        **kwargs)
+
+    @staticmethod
+    def prepare_query(s):
+        """Split a query to the parts used for detection
+        :params s : Query string
+        Returns the query string, its periods, its extracts and the
+        sentences to be parsed
+        """
         # fix par abbrev
         s = helpers.fix_par_abbrev(s)
 
@@ -140,106 +302,122 @@ class ActionTreeGenerator:
         non_extracts = ' '.join(non_extracts)
         non_extracts = tokenizer.tokenizer.split(non_extracts, True, '. ')
 
+        return s, parts, extracts, non_extracts
+
+    @staticmethod
+    def action_trees_from_docs(query, docs, nested=False):
+        """Build the action trees of a query
+        :params query : Query as returned by prepare_query
+        :params docs : Parsed sentences of the query, None for the
+        sentences skipped by the pre-filter
+        :params nested : Nest the trees
+        """
+        s, parts, extracts, non_extracts = query
+
+        # results are stored here
+        trees = []
+
         extract_cnt = 0
 
         for part_cnt, non_extract in enumerate(non_extracts):
 
-            doc = nlp(non_extract)
+            doc = docs[part_cnt]
+            if doc is None:
+                continue
 
             tmp = list(map(lambda s: s.strip(
                 string.punctuation), non_extract.split(' ')))
 
             # Detect amendment action
-            for action in entities.actions:
-                for i, w in enumerate(doc):
-                    if action == w.text:
-                        tree = collections.defaultdict(dict)
-                        tree['root'] = {
-                            '_id': i,
-                            'action': action.__str__(),
-                            'children': []
-                        }
-                        max_depth = 0
+            for i, action in entities.action_lookup.find(
+                    [w.text for w in doc], ACTION_MAX_DISTANCE):
+                tree = collections.defaultdict(dict)
+                tree['root'] = {
+                    '_id': i,
+                    'action': action.__str__(),
+                    'children': []
+                }
+                max_depth = 0
+
+                logging.info('Found ' + str(action))
+
+                extract = None
+                if str(action) not in [
+                        'διαγράφεται', 'παύεται', 'καταργείται']:
+                    try:
+                        extract = extracts[extract_cnt]
+                        extract_cnt += 1
+                    except IndexError:
+                        extract = None
 
-                        logging.info('Found ' + str(action))
+                # Detect what is amended
+                found_what, tree, is_plural = ActionTreeGenerator.get_nsubj(
+                    doc, i, tree)
+                if found_what:
+                    k = tree['what']['index']
+                    if tree['what']['context'] not in [
+                            'φράση', 'φράσεις', 'λέξη', 'λέξεις']:
+                        tree['what']['number'] = list(
+                            helpers.ssconj_doc_iterator(doc, k, is_plural))
+                    else:
+                        tree = phrase_fun.detect_phrase_components(
+                            parts[part_cnt], tree)
+                        tree['what']['context'] = 'φράση'
+                    logging.info(tree['what'])
 
-                        extract = None
-                        if str(action) not in [
-                                'διαγράφεται', 'παύεται', 'καταργείται']:
-                            try:
-                                extract = extracts[extract_cnt]
-                                extract_cnt += 1
-                            except IndexError:
-                                extract = None
-
-                        # Detect what is amended
-                        found_what, tree, is_plural = ActionTreeGenerator.get_nsubj(
-                            doc, i, tree)
-                        if found_what:
-                            k = tree['what']['index']
-                            if tree['what']['context'] not in [
-                                    'φράση', 'φράσεις', 'λέξη', 'λέξεις']:
-                                tree['what']['number'] = list(
-                                    helpers.ssconj_doc_iterator(doc, k, is_plural))
-                            else:
-                                tree = phrase_fun.detect_phrase_components(
-                                    parts[part_cnt], tree)
-                                tree['what']['context'] = 'φράση'
-                            logging.info(tree['what'])
-
-                        else:
-                            found_what, tree, is_plural = ActionTreeGenerator.get_nsubj_fallback(
-                                tmp, tree, i)
-
-                        # get content
-                        if action not in [
-                            'διαγράφεται',
-                            'διαγράφονται',
-                            'αναριθμείται',
-                                'αναριθμούνται']:
-                            tree, max_depth = ActionTreeGenerator.get_content(
-                                tree, extract, s)
-                        if action in ['αναριθμείται', 'αναριθμούνται']:
-                            # get renumbering
-                            tree = ActionTreeGenerator.get_renumbering(
-                                tree, doc)
-                            subtrees = ActionTreeGenerator.split_renumbering_tree(
-                                tree)
-
-                        # split to subtrees
-                        if action not in ['αναριθμείται', 'αναριθμούνται']:
-                            subtrees = ActionTreeGenerator.split_tree(tree)
-
-                        # iterate over subtrees
-                        for subtree in subtrees:
-
-                            subtree, max_depth = ActionTreeGenerator.get_content(
-                                subtree, extract, s, secondary=True)
-
-                            # get latest statute
-                            try:
-                                law = ActionTreeGenerator.detect_latest_statute(
-                                    non_extract)
-                            except BaseException:
-                                law = ''
-
-                            # first level are laws
-                            subtree['law'] = {
-                                '_id': law,
-                                'children': ['article']
-                            }
-
-                            splitted = non_extract.split(' ')
-
-                            # build levels bottom up
-                            subtree = ActionTreeGenerator.build_levels(
-                                splitted, subtree)
-
-                            # nest into dictionary
-                            if nested:
-                                ActionTreeGenerator.nest_tree('root', subtree)
-
-                            trees.append(subtree)
+                else:
+                    found_what, tree, is_plural = ActionTreeGenerator.get_nsubj_fallback(
+                        tmp, tree, i)
+
+                # get content
+                if action not in [
+                    'διαγράφεται',
+                    'διαγράφονται',
+                    'αναριθμείται',
+                        'αναριθμούνται']:
+                    tree, max_depth = ActionTreeGenerator.get_content(
+                        tree, extract, s)
+                if action in ['αναριθμείται', 'αναριθμούνται']:
+                    # get renumbering
+                    tree = ActionTreeGenerator.get_renumbering(
+                        tree, doc)
+                    subtrees = ActionTreeGenerator.split_renumbering_tree(
+                        tree)
+
+                # split to subtrees
+                if action not in ['αναριθμείται', 'αναριθμούνται']:
+                    subtrees = ActionTreeGenerator.split_tree(tree)
+
+                # iterate over subtrees
+                for subtree in subtrees:
+
+                    subtree, max_depth = ActionTreeGenerator.get_content(
+                        subtree, extract, s, secondary=True)
+
+                    # get latest statute
+                    try:
+                        law = ActionTreeGenerator.detect_latest_statute(
+                            non_extract)
+                    except BaseException:
+                        law = ''
+
+                    # first level are laws
+                    subtree['law'] = {
+                        '_id': law,
+                        'children': ['article']
+                    }
+
+                    splitted = non_extract.split(' ')
+
+                    # build levels bottom up
+                    subtree = ActionTreeGenerator.build_levels(
+                        splitted, subtree)
+
+                    # nest into dictionary
+                    if nested:
+                        ActionTreeGenerator.nest_tree('root', subtree)
+
+                    trees.append(subtree)
 
         return trees
 
@@ -285,8 +463,15 @@ class ActionTreeGenerator:
         for child in root_token.children:
 
             if child.dep_ in ['nsubj', 'obl']:
+                text = child.text
+                if ACTION_MAX_DISTANCE and text not in entities.whats:
+                    # Subjects damaged by OCR
+                    match = entities.keyword_lexicon.lookup(
+                        text, ACTION_MAX_DISTANCE)
+                    if match is not None:
+                        text = match[0]
                 for what in entities.whats:
-                    if child.text == what:
+                    if text == what:
                         found_what = True
                         tree['root']['children'].append('law')
                         tree['what'] = {
@@ -478,22 +663,58 @@ class ActionTreeGenerator:
         return tree, max_depth
 
     @staticmethod
-    def build_level(tmp, subtree, max_depth, stem, list_iter=False):
+    def level_positions(tmp):
+        """Tag the words with the hierarchy levels whose stems they
+        hold, scanning the sentence once per stem
+        :params tmp : List of words
+        Returns a dictionary from the stems of trans_lookup to the
+        indices of the words holding them
+        """
+        # Words are joined with newlines, which no stem matches, so
+        # every match of a stem lies inside one word. The word of a
+        # match is the number of newlines before it, unless the words
+        # hold newlines themselves
+        text = '\n'.join(tmp)
+        starts = None
+        if text.count('\n') != max(len(tmp) - 1, 0):
+            starts = [0]
+            for w in tmp[:-1]:
+                starts.append(starts[-1] + len(w) + 1)
+
+        positions = {}
+        for stem, regex in ActionTreeGenerator.stem_regexes:
+            indices = []
+            for m in regex.finditer(text):
+                if starts is None:
+                    i = text.count('\n', 0, m.start())
+                else:
+                    i = bisect.bisect_right(starts, m.start()) - 1
+                if not indices or indices[-1] != i:
+                    indices.append(i)
+            positions[stem] = indices
+        return positions
+
+    @staticmethod
+    def build_level(tmp, subtree, max_depth, stem, list_iter=False,
+                    positions=None, context_positions=None):
         """Builds a level of the tree using the stems lookup"""
 
         lookup = ActionTreeGenerator.trans_lookup[stem]
-
-        if not re.search(stem, subtree['what']['context']):
-            for i, w in enumerate(tmp):
-                if re.search(stem, w):
-                    if not list_iter:
-                        subtree[lookup]['_id'] = next(
-                            helpers.ssconj_doc_iterator(tmp, i))
-                    else:
-                        subtree[lookup]['_id'] = list(
-                            helpers.ssconj_doc_iterator(tmp, i))
-                    subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
-                    break
+        if positions is None:
+            positions = ActionTreeGenerator.level_positions(tmp)
+        if context_positions is None:
+            context_positions = ActionTreeGenerator.level_positions(
+                [subtree['what']['context']])
+
+        if not context_positions[stem]:
+            for i in positions[stem][:1]:
+                if not list_iter:
+                    subtree[lookup]['_id'] = next(
+                        helpers.ssconj_doc_iterator(tmp, i))
+                else:
+                    subtree[lookup]['_id'] = list(
+                        helpers.ssconj_doc_iterator(tmp, i))
+                subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
         else:
             subtree[lookup]['_id'] = subtree['what']['number']
             subtree[lookup]['children'] = []
@@ -504,10 +725,14 @@ class ActionTreeGenerator:
     def build_levels(tmp, subtree, list_iter=False):
         """Build all levels using the stems"""
 
+        positions = ActionTreeGenerator.level_positions(tmp)
+        context_positions = ActionTreeGenerator.level_positions(
+            [subtree['what']['context']])
         stems = list(ActionTreeGenerator.trans_lookup.keys())
         for i, stem in enumerate(stems):
             subtree = ActionTreeGenerator.build_level(
-                tmp, subtree, i + 2, stem, list_iter=list_iter)
+                tmp, subtree, i + 2, stem, list_iter=list_iter,
+                positions=positions, context_positions=context_positions)
 
         return subtree
 
@@ -587,33 +812,37 @@ class ActionTreeGenerator:
         return subtrees, smallest
 
     @staticmethod
-    def build_level_helper(tmp, subtree, max_depth, stem, list_iter=False, recursive=True):
+    def build_level_helper(tmp, subtree, max_depth, stem, list_iter=False, recursive=True, positions=None):
         """Builds a level of the tree using the stems lookup"""
         lookup = ActionTreeGenerator.trans_lookup[stem]
-
-        for i, w in enumerate(tmp):
-            if re.search(stem, w):
-                is_plural = helpers.is_plural(w)
-                if not list_iter:
-                    subtree[lookup]['_id'] = next(
-                        helpers.ssconj_doc_iterator(tmp, i))
-                else:
-                    try:
-                        subtree[lookup]['_id'] = list(
-                            helpers.ssconj_doc_iterator(tmp, i, is_plural=is_plural, recursive=recursive))
-                    except:
-                        continue
-                subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
+        if positions is None:
+            positions = ActionTreeGenerator.level_positions(tmp)
+
+        for i in positions[stem]:
+            w = tmp[i]
+            is_plural = helpers.is_plural(w)
+            if not list_iter:
+                subtree[lookup]['_id'] = next(
+                    helpers.ssconj_doc_iterator(tmp, i))
+            else:
+                try:
+                    subtree[lookup]['_id'] = list(
+                        helpers.ssconj_doc_iterator(tmp, i, is_plural=is_plural, recursive=recursive))
+                except:
+                    continue
+            subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
 
         return subtree
 
     @staticmethod
     def build_levels_helper(tmp, subtree, list_iter=False, recursive=True):
         """Build all levels using the stems"""
+        positions = ActionTreeGenerator.level_positions(tmp)
         stems = list(ActionTreeGenerator.trans_lookup.keys())
         for i, stem in enumerate(stems):
             subtree = ActionTreeGenerator.build_level_helper(
-                tmp, subtree, i + 2, stem, list_iter=list_iter, recursive=recursive)
+                tmp, subtree, i + 2, stem, list_iter=list_iter, recursive=recursive,
+                positions=positions)
 
         return subtree
 
@@ -621,6 +850,11 @@ class ActionTreeGenerator:
     def detect_removals(q):
         """Detect removals (καραργούμενες διατάξεις) on a string
         :params q : Query string"""
+        cache_key = ActionTreeGenerator.cache_key(q, kind='removals')
+        cached = tree_cache.tree_cache.load(cache_key)
+        if cached is not None:
+            return cached
+
         split_regex = r'[^0-9],|[0-9], [^0-9]|καθώς και'
         q = tokenizer.tokenizer.remove_subordinate(q)
 
@@ -650,4 +884,5 @@ class ActionTreeGenerator:
             except ValueError:
                 pass
 
+        tree_cache.tree_cache.store(cache_key, (removals, exceptions))
         return removals, exceptions
@@ -7,16 +7,30 @@ import pprint
 import helpers
 import tokenizer
 import re
+import json
 from copy import deepcopy
 import phrase_fun
 import codifier
+import issue_cache
+import tree_cache
+import snapshot
+import history
 import logging
+import os
+import fuzzy
 logger = logging.getLogger()
 logger.disabled = True
 
 global db
 db = database.Database()
 
+
+@pytest.fixture(autouse=True)
+def disabled_caches(monkeypatch):
+    # Tests never read or write the caches of the environment
+    monkeypatch.setattr(issue_cache, 'issue_cache', issue_cache.IssueCache(None))
+    monkeypatch.setattr(tree_cache, 'tree_cache', tree_cache.TreeCache(None))
+
 # Law Parsing Tests
 
 
@@ -27,9 +41,376 @@ def _test_law_parsing_from_government_gazette_issue():
         assert(new_laws[k].corpus['15'] == '1.  Η Επιτροπή Κεφαλαιαγοράς χορηγεί άδεια λειτουργίας Α.Ε.Π.Ε.Υ. μόνον εφόσον η αιτούσα εταιρεία έχει επαρκές  αρχικό κεφάλαιο, σύμφωνα με τις απαιτήσεις του Κανονισμού (ΕΕ) 575/2013, λαμβανομένης υπόψη της φύσης της σχετικής επενδυτικής υπηρεσίας ή δραστηριότητας. ')
 
 
+def test_streaming_issue_parsing():
+    issue = parser.IssueParser('../examples/20180100009.txt')
+    with open('../examples/20180100009.txt') as f:
+        streamed = parser.IssueParser(f, streaming=True)
+
+    assert(streamed.articles == issue.articles)
+    assert(streamed.extracts == issue.extracts)
+    assert(streamed.statutes == issue.statutes)
+    assert(streamed.dates == issue.dates)
+
+    # Lines are dropped unless asked for
+    assert(streamed.lines == [])
+    with open('../examples/20180100009.txt') as f:
+        assert(parser.IssueParser(f, streaming=True, keep_lines=True).lines
+               == issue.lines)
+
+
+def test_issue_name():
+    issue = parser.parse_issue(os.path.abspath('../examples/20180100009.txt'))
+    assert(issue.name == '20180100009.txt')
+    assert(str(issue) == '20180100009.txt')
+
+
+def test_manifest(tmpdir):
+    class Manifest:
+        def __init__(self):
+            self.entries = {}
+            self.saved = 0
+
+        def get_manifest_entry(self, filename):
+            return self.entries.get(filename)
+
+        def save_manifest_entry(self, entry):
+            self.entries[entry['_id']] = dict(entry)
+            self.saved += 1
+
+    filename = str(tmpdir.join('20180100009.txt'))
+    with open(filename, 'w') as f:
+        f.write('ΝΟΜΟΣ ΥΠ’ ΑΡΙΘΜ. 1')
+    db = Manifest()
+
+    # New file
+    assert(not codifier.is_processed(db, filename))
+
+    # Unchanged file
+    db.save_manifest_entry(codifier.manifest_entry(filename))
+    assert(codifier.is_processed(db, filename))
+    assert(db.saved == 1)
+
+    # Touched file keeps its hash and gets its entry rewritten
+    mtime = os.stat(filename).st_mtime + 10
+    os.utime(filename, (mtime, mtime))
+    assert(codifier.is_processed(db, filename))
+    assert(db.saved == 2)
+    assert(db.entries['20180100009.txt']['mtime'] == mtime)
+
+    # Changed content
+    with open(filename, 'w') as f:
+        f.write('ΝΟΜΟΣ ΥΠ’ ΑΡΙΘΜ. 2')
+    assert(not codifier.is_processed(db, filename))
+    assert(db.saved == 2)
+
+
+def test_disabled_issue_cache(tmpdir):
+    issue = parser.IssueParser('../examples/20180100102.txt')
+    issue.detect_new_laws()
+    assert(issue.cache_key is None)
+    assert(issue_cache.issue_cache.load('0' * 64) is None)
+
+
+def test_issue_cache(tmpdir, monkeypatch):
+    cache = issue_cache.IssueCache(str(tmpdir))
+    monkeypatch.setattr(issue_cache, 'issue_cache', cache)
+    issue = parser.IssueParser('../examples/20180100102.txt')
+    new_laws = issue.detect_new_laws()
+    cached = parser.IssueParser('../examples/20180100102.txt')
+    cached_new_laws = cached.detect_new_laws()
+
+    assert(cache.hits == 1)
+    # Keys follow the parser sources
+    assert(parser.issue_parser_version().startswith(
+        str(parser.ISSUE_PARSER_VERSION) + ':'))
+    assert(cached.articles == issue.articles)
+    assert(cached.statutes == issue.statutes)
+    assert(list(cached_new_laws.keys()) == list(new_laws.keys()))
+
+
+def test_lazy_law_parsing(tmpdir):
+    filename = str(tmpdir.join('law.txt'))
+    with open(filename, 'w') as f:
+        f.write('Άρθρο 1\nΚείμενο Αρθρου\n1. Lorem ipsum.\nΆρθρο 2\nhttp://www.et.gr\n')
+
+    law = parser.LawParser('ν. 1/2000', filename)
+    assert(law.pending_corpus)
+
+    assert(list(law.corpus.keys()) == ['1'])
+    assert(not law.pending_corpus)
+    assert(law.entities['Urls'] == [(4, ['http://www.et.gr'])])
+
+
+def test_law_store():
+    store = codifier.LawStore(db, max_bytes=1)
+    store.load_index()
+    first, second = list(store)[:2]
+
+    law = store[first]
+    assert(store[first] is law)
+    assert((store.hits, store.misses) == (1, 1))
+
+    # The budget only fits the most recent law
+    store[second]
+    assert(list(store.hot.keys()) == [second])
+
+    store[first] = law
+    store.prefetch([first, second])
+    assert(store[first] is law)
+
+    # Pinned laws survive the eviction of the LRU
+    pinned = store.pin(second)
+    store.release(first)
+    store[first]
+    assert(store[second] is pinned)
+    store.release(second)
+    assert(second not in store.pinned)
+
+
+def test_decode_latest_version():
+    law_history = {
+        '_id': 'ν. 1/2000',
+        'versions': [
+            {'_id': 'ν. 1/2000', '_version': 0, 'articles': {'1': {'1': ['{"_id": "x"}']}}},
+            {'_id': 'ν. 1/2000', '_version': 1, 'articles': {}}
+        ]
+    }
+    dump = json.dumps(law_history, ensure_ascii=False).encode('utf-8')
+    assert(codifier.decode_latest_version(dump) == law_history['versions'][1])
+
+    # Histories holding full versions return the highest version
+    law_history['versions'].reverse()
+    dump = json.dumps(law_history, ensure_ascii=False).encode('utf-8')
+    assert(codifier.decode_latest_version(dump)['_version'] == 1)
+
+    # Delta-encoded heads return their latest version
+    versions = [dict(v, articles={'1': {'1': ['"latest": {"_id": {}']}})
+                for v in reversed(law_history['versions'])]
+    head, _ = history.encode('ν. 1/2000', versions)
+    dump = json.dumps(head, ensure_ascii=False).encode('utf-8')
+    assert(codifier.decode_latest_version(dump) == versions[-1])
+
+
+def test_delta_history():
+    versions = []
+    for i in range(5):
+        versions.append({
+            '_id': 'ν. 1/2000',
+            '_version': i,
+            'amendee': 'ν. {}/2001'.format(i),
+            'titles': {'1': 'Title {}'.format(i // 2)},
+            'articles': {'1': {'1': ['Lorem'], '2': ['Ipsum {}'.format(i)]}}
+        })
+    versions[3]['articles']['2'] = {'1': ['Dolor']}
+    versions = json.loads(json.dumps(versions))
+
+    head, segments = history.encode('ν. 1/2000', versions, keyframe_interval=2)
+    head = json.loads(json.dumps(head))
+    segments = json.loads(json.dumps(dict(segments)))
+    assert(list(segments) == ['ν. 1/2000#0', 'ν. 1/2000#1'])
+    assert(history.decode(head, segments) == versions)
+
+    # Only the segment of a version is needed to rebuild it
+    required = history.required_segments(head, [3])
+    assert(required == ['ν. 1/2000#1'])
+    assert(history.decode(
+        head, {k: segments[k] for k in required}, [3]) == [versions[3]])
+
+    # The latest version is read from the head alone
+    dump = json.dumps(head).encode('utf-8')
+    assert(codifier.decode_latest_version(dump) == versions[-1])
+
+    # Deltas of serialize_version replace diffing the versions
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem. Ipsum 2. Dolor')
+    versions, deltas = [], []
+    for change in [lambda: None,
+                   lambda: law.append_period('Amet', '1', '2'),
+                   lambda: law.remove_article('1')]:
+        change()
+        version, delta = law.serialize_version()
+        versions.append(version)
+        deltas.append(delta)
+    head, segments = history.encode(
+        'ν. 1/2000', versions, deltas=deltas, generation='a')
+    assert(head == history.encode('ν. 1/2000', versions, generation='a')[0])
+    assert(dict(segments) == dict(history.encode(
+        'ν. 1/2000', versions, generation='a')[1]))
+    assert(list(dict(segments)) == ['ν. 1/2000#a#0'])
+    assert(history.decode(head, dict(segments)) == versions)
+
+
+def test_snapshot(tmpdir):
+    filename = str(tmpdir.join('codifier.snapshot'))
+    writer = snapshot.SnapshotWriter(filename)
+    writer.add('links', 'ν. 1/2000', {'_id': 'ν. 1/2000', 'links_to': [],
+                                      'actual_links': [], 'is_sorted': 1})
+    writer.add('state', 'ranks', {'ν. 1/2000': 1.0})
+    writer.add('state', 'ranking', {'ν. 1/2000': 0})
+    writer.add('state', 'topics', [])
+    writer.add('state', 'named_entities', [])
+    writer.close()
+
+    snap = snapshot.Snapshot(filename)
+    assert(snap.get('state', 'ranking') == {'ν. 1/2000': 0})
+
+    links = snapshot.SnapshotMapping(snap, 'links', codifier.Link.from_serialized)
+    assert('ν. 1/2000' in links and links.materialized == {})
+    assert(links['ν. 1/2000'].is_sorted == 1)
+    assert(list(links.materialized.keys()) == ['ν. 1/2000'])
+
+    # Restoring does not connect to the database
+    cod = codifier.LawCodifier(snapshot_file=filename)
+    assert('db' not in cod.__dict__)
+    assert(cod.ranking == {'ν. 1/2000': 0} and list(cod.laws) == [])
+
+
+def test_version_history():
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem. Ipsum 2. Dolor')
+    law.add_article('2', '1. Sit amet')
+
+    first, delta = law.serialize_version()
+    assert(set(delta) == {'1', '2'})
+
+    law.append_period('Amet', '1', '2')
+    second, delta = law.serialize_version()
+    assert(delta == {'1': {'2': ['Dolor', 'Amet']}})
+    assert(first['articles']['1']['2'] == ['Dolor'])
+    assert(second['articles']['2'] is first['articles']['2'])
+    assert(second['articles']['1']['1'] is first['articles']['1']['1'])
+
+    law.remove_article('2')
+    third, delta = law.serialize_version()
+    assert(delta == {'2': None})
+    assert('2' in second['articles'] and '2' not in third['articles'])
+
+
+def test_law_transaction():
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem. Ipsum')
+    add = {
+        'root': {'action': 'προστίθεται'},
+        'what': {'context': 'παράγραφος', 'content': 'Dolor'},
+        'law': {'_id': 'ν. 1/2000'},
+        'article': {'_id': '1'},
+        'paragraph': {'_id': '2'}
+    }
+    replace = {
+        'root': {'action': 'αντικαθίσταται'},
+        'what': {'context': 'εδάφιο', 'content': 'Amet'},
+        'law': {'_id': 'ν. 1/2000'},
+        'article': {'_id': '1'},
+        'paragraph': {'_id': '1'},
+        'period': {'_id': '5'}
+    }
+
+    with law.transaction(atomic=False) as batch:
+        outcomes = [batch.apply(add), batch.apply(replace)]
+    assert([x.applied for x in outcomes] == [True, False])
+    # Serialized only when asked for
+    assert(batch._result is None)
+    assert(batch.result['articles']['1']['2'] == ['Dolor'])
+
+    # A failed amendment rolls back the whole atomic batch
+    add['paragraph']['_id'] = '3'
+    with pytest.raises(IndexError):
+        with law.transaction() as batch:
+            batch.apply(add)
+            batch.apply(replace)
+    assert('3' not in law.sentences['1'])
+
+
+def test_paragraph_text_cache():
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem. Ipsum 2. Dolor')
+    assert(list(law.get_paragraphs('1')) == ['Lorem. Ipsum.', 'Dolor.'])
+
+    hits = parser.text_cache_stats['hits']
+    assert(list(law.get_paragraphs('1')) == ['Lorem. Ipsum.', 'Dolor.'])
+    assert(parser.text_cache_stats['hits'] == hits + 2)
+
+    law.append_period('Amet', '1', '2')
+    law.add_article('10', '1. Sit')
+    assert(law.get_paragraph('1', '2') == 'Dolor. Amet.')
+    assert(law.get_articles_sorted() == ['1', '10'])
+
+
+def test_streaming_export(tmpdir):
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem. Ipsum 2. Dolor', title='Title')
+
+    assert(law.export_law('plaintext') ==
+           'Άρθρο 1 \nTitle\n 1. Lorem. Ipsum.\n 2. Dolor.\n')
+    assert(law.export_law('issue').endswith('\n' + law.export_law('plaintext')))
+
+    filename = str(tmpdir.join('law.md'))
+    with open(filename, 'w') as f:
+        law.export_law('markdown', outfile=f)
+    with open(filename) as f:
+        assert(f.read() == ''.join(law.iter_export('markdown')))
+
+    with pytest.raises(Exception):
+        law.iter_export('pdf')
+
+
+def test_law_index():
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Lorem ipsum dolor. Sit amet')
+    law.add_article('2', '1. Sit amet. Lorem ipsum dolor sit')
+
+    assert(law.locate_period('Sit amet') == [('1', '1'), ('2', '1')])
+    law.replace_period('Sit amet', 'Consectetur')
+    assert(law.sentences['2']['1'][0] == 'Consectetur')
+
+    law.replace_phrase('Lorem ipsum dolor', 'Lorem dolor')
+    assert(law.locate_phrase('Lorem ipsum dolor') == [])
+    assert(law.locate_phrase('a Lorem dolor b') == [])
+    assert(law.sentences['1']['1'][0] == 'Lorem dolor')
+
+    law.insert_period('after', 'Consectetur', 'Adipiscing', '2')
+    assert(law.sentences['2']['1'][1] == 'Adipiscing')
+    assert(law.locate_period('Adipiscing') == [('2', '1')])
+
+
+def test_law_tree():
+    law = parser.LawParser('ν. 1/2000')
+    law.add_article('1', '1. Ορίζονται: α) ένα αα) δύο. β) τρία 2. Lorem')
+    law.add_article('3α', '1. Ipsum')
+
+    assert(law.get_next_article() == '4')
+    assert(law.get_next_paragraph('1') == '3')
+    assert([node.address[1] for node in law.document.paragraphs('1')] ==
+           ['1', '2'])
+
+    subcase = law.document.node('1', '1', 'α', 'α')
+    assert(subcase.marker == 'αα)')
+    assert(law.document.node('1', '1', period=2).address ==
+           ('1', '1', None, None, 2))
+
+    tree = {'article': {'_id': '1'}, 'paragraph': {'_id': '1'},
+            'case': {'_id': 'α'}, 'subcase': {'_id': 'α'}}
+    assert(law.document.case_letter(law.document.address(tree)) == 'αα')
+
+    # Case edits take the spans of the tree
+    law.replace_case('αα', 'τέσσερα', '1', '1')
+    assert(law.document.node('1', '1', 'α', 'α').marker == 'αα)')
+    assert(law.sentences['1']['1'] == ['Ορίζονται: α) ένα αα) τέσσερα', 'β) τρία'])
+    law.delete_case('α', '1', '1')
+    assert(law.sentences['1']['1'] == ['Ορίζονται: α) τρία'])
+    law.add_paragraph('1', '3', 'α) a β) b γ) c δ) d ε) e στ) f')
+    law.replace_case('στ', 'g', '1', '3')
+    assert(law.sentences['1']['3'] == ['α) a β) b γ) c δ) d ε) e στ) g'])
+
+    law.remove_article('3α')
+    law.add_paragraph('1', '5', 'Dolor')
+    assert(law.get_next_article() == '2')
+    assert(law.get_next_paragraph('1') == '6')
+
+
 def test_operations():
     cod = codifier.LawCodifier()
-    law = cod.laws['ν. 4511/2018']
+    law = cod.laws.pin('ν. 4511/2018')
 
     law.remove_paragraph('1', '2')
     assert('2' not in law.sentences['1'])
@@ -78,13 +459,77 @@ def test_greek_nums():
     x.s = 'ια'
     assert(x.value == 11)
 
+
+def test_statute_scanner():
+    s = 'Το άρθρο 2 του ν. 4067/2012, το π.δ. 18/1989 και ο ν.δ. 356/1974'
+    statutes = entities.statute_scanner.findall(s)
+
+    assert([x.text for x in statutes] == [
+        'ν. 4067/2012', 'π.δ. 18/1989', 'ν.δ. 356/1974'])
+    assert([x.type for x in statutes] == [
+        'law', 'presidential_decree', 'legislative_decree'])
+    assert((statutes[0].number, statutes[0].year) == ('4067', 2012))
+    assert(s[slice(*statutes[1].span)] == 'π.δ. 18/1989')
+    assert(syntax.ActionTreeGenerator.detect_latest_statute(s) == 'ν. 4067/2012')
+
+
+def test_entity_engine():
+    s = 'Εκτός αν ανεξαρτήτως εάν πληρωθούν 10 ευρώ εντός 12:30 π.μ. εκτός από'
+    result = entities.entity_engine.scan([s, 'Lorem ipsum'])
+
+    assert(result['Conditions'] == [(0, ['Εκτός αν', 'ανεξαρτήτως εάν'])])
+    assert(result['Contraints'] == [(0, ['εκτός από'])])
+    assert(result['Durations'] == [(0, ['εντός '])])
+    assert(result['Exact times'] == [(0, ['12:30 π.μ.'])])
+    assert(result['Monetary Amounts'] == [(0, ['10 ευρώ'])])
+    assert(result['Urls'] == [])
+    assert(entities.get_conditions(s) == re.findall(
+        '|'.join(entities.conditions), s))
+
+
 # Syntax Tests
 # Phrasal operations
 
 
+def test_phrase_editor():
+    s = ['Ορίζονται: α) πρώτο', 'β) δεύτερο (ν. 1/2000)', 'γ) τρίτο']
+
+    assert(phrase_fun.replace_phrase(s, '(ν. 1/2000)', 'x') ==
+           ['Ορίζονται: α) πρώτο', 'β) δεύτερο x', 'γ) τρίτο'])
+    assert(phrase_fun.remove_phrase(s, 'πρώτο. β) ') ==
+           ['Ορίζονται: α) δεύτερο (ν. 1/2000)', 'γ) τρίτο'])
+    assert(phrase_fun.insert_phrase(s, 'νέο', 'after', 'δεύτερο')[1] ==
+           'β) δεύτερο νέο (ν. 1/2000)')
+
+    assert(phrase_fun.replace_case(s, 'β', 'άλλο') ==
+           ['Ορίζονται: α) πρώτο', 'β) άλλο', 'γ) τρίτο'])
+    assert(phrase_fun.delete_case(s, 'α') ==
+           ['Ορίζονται: α) δεύτερο (ν. 1/2000)', 'β) τρίτο'])
+    assert(phrase_fun.delete_case(s, 'γ') == s[:2])
+    assert(phrase_fun.renumber_case(s, 'γ', 'δ')[2] == 'δ) τρίτο')
+
+    # Separators of the new text start periods outside exceptions
+    s = ['α) πρώτο', 'β) δεύτερο']
+    assert(len(phrase_fun.replace_phrase(s, 'πρώτο', 'ένα. Δύο')) == 3)
+    assert(phrase_fun.insert_case(s, 'γ', ' τρίτο. Νέα περίοδος')[1:] ==
+           ['β) δεύτερο γ) τρίτο', 'Νέα περίοδος'])
+    assert(phrase_fun.replace_phrase(s, 'πρώτο', 'του ν. 1/2000') ==
+           ['α) του ν. 1/2000', 'β) δεύτερο'])
+
+    # Numerals of several letters are not split to parent and subcase
+    s = ['α) a β) b γ) c δ) d ε) e στ) f ζ) g']
+    assert(phrase_fun.replace_case(s, 'στ', 'X') ==
+           ['α) a β) b γ) c δ) d ε) e στ) X ζ) g'])
+    assert(phrase_fun.delete_case(s, 'στ') ==
+           ['α) a β) b γ) c δ) d ε) e στ) g'])
+    assert(phrase_fun.renumber_case(s, 'στ', 'ζ') ==
+           ['α) a β) b γ) c δ) d ε) e ζ) f ζ) g'])
+    assert(phrase_fun.split_case_letter('αβ')[0] == 'α')
+
+
 def test_phrase():
     cod = codifier.LawCodifier()
-    law = cod.laws['ν. 4511/2018']
+    law = cod.laws.pin('ν. 4511/2018')
     test = law.sentences['1']['1']
 
     test1 = phrase_fun.replace_phrase(
@@ -151,6 +596,21 @@ def test_tokenizer():
         'Κάτι, όπως έγινε, δεν είναι καλό') == 'Κάτι δεν είναι καλό')
 
 
+def test_tokenizer_exceptions():
+    s = 'Με το π.δ. 12/2010 και την παρ. 2. Νέα περίοδος κ.λπ. εδώ'
+    assert(tokenizer.tokenizer.split(s, False, '. ') == [
+        'Με το π.δ. 12/2010 και την παρ. 2', 'Νέα περίοδος κ.λπ. εδώ'])
+    assert(tokenizer.tokenizer.exception_spans('κ.α. και κ. Α') == [
+        (0, 4), (9, 11)])
+
+    t = tokenizer.Tokenizer(['παρ.'])
+    assert(t.split('Η παρ. 2 και η περ. 3', False, '. ') == [
+        'Η παρ. 2 και η περ', '3'])
+    t.add_exception('περ.')
+    assert(t.split('Η παρ. 2 και η περ. 3', False, '. ') == [
+        'Η παρ. 2 και η περ. 3'])
+
+
 def test_syntax_from_string():
     s = '''Στο τέλος του άρθρου 5 της από 24.12.1990 Πράξης Νομοθετικού Περιεχομένου «Περί Μουσουλμάνων Θρησκευτικών Λειτουργών» (Α΄182) που κυρώθηκε με το άρθρο μόνο του ν. 1920/1991 (Α΄11) προστίθεται παράγραφος 4 ως εξής:  «4.α. Οι υποθέσεις της παραγράφου 2 ρυθμίζονται από τις κοινές διατάξεις και μόνο κατ’ εξαίρεση υπάγονται στη δικαιοδοσία του Μουφτή, εφόσον αμφότερα τα διάδικα μέρη υποβάλουν σχετική αίτησή τους ενώπιόν του για επίλυση της συγκεκριμένης διαφοράς κατά τον Ιερό Μουσουλμανικό Νόμο. Η υπαγωγή της υπόθεσης στη δικαιοδοσία του Μουφτή είναι αμετάκλητη και αποκλείει τη δικαιοδοσία των τακτικών δικαστηρίων για τη συγκεκριμένη διαφορά. Εάν οποιοδήποτε από τα μέρη δεν επιθυμεί την υπαγωγή της υπόθεσής του στη δικαιοδοσία του Μουφτή, δύναται να προσφύγει στα πολιτικά δικαστήρια, κατά τις κοινές ουσιαστικές και δικονομικές διατάξεις, τα οποία σε κάθε περίπτωση έχουν το τεκμήριο της δικαιοδοσίας.  β. Με προεδρικό διάταγμα που εκδίδεται με πρόταση των Υπουργών Παιδείας, Έρευνας και Θρησκευμάτων και Δικαιοσύνης, Διαφάνειας και Ανθρωπίνων Δικαιωμάτων καθορίζονται όλοι οι αναγκαίοι δικονομικοί κανόνες για τη συζήτηση της υπόθεσης ενώπιον του Μουφτή και την έκδοση των αποφάσεών του και ιδίως η διαδικασία υποβολής αιτήσεως των μερών, η οποία πρέπει να περιέχει τα στοιχεία των εισαγωγικών δικογράφων κατά τον Κώδικα Πολιτικής Δικονομίας και, επί ποινή ακυρότητας, ρητή ανέκκλητη δήλωση κάθε διαδίκου περί  επιλογής της συγκεκριμένης δικαιοδοσίας, η παράσταση των πληρεξουσίων δικηγόρων, η διαδικασία κατάθεσης και επίδοσής της στο αντίδικο μέρος, η διαδικασία της συζήτησης και της έκδοσης απόφασης, τα θέματα οργάνωσης, σύστασης και διαδικασίας πλήρωσης θέσεων προσωπικού (μονίμων, ιδιωτικού δικαίου αορίστου χρόνου και μετακλητών υπαλλήλων) και λειτουργίας της σχετικής υπηρεσίας της τήρησης αρχείου, καθώς και κάθε σχετικό θέμα για την εφαρμογή του παρόντος. γ. Οι κληρονομικές σχέσεις των μελών της μουσουλμανικής μειονότητας της Θράκης ρυθμίζονται από τις διατάξεις του Αστικού Κώδικα, εκτός εάν ο διαθέτης συντάξει ενώπιον συμβολαιογράφου δήλωση τελευταίας βούλησης, κατά τον τύπο της δημόσιας διαθήκης, με αποκλειστικό περιεχόμενό της τη ρητή επιθυμία του να υπαχθεί η κληρονομική του διαδοχή στον Ιερό Μουσουλμανικό Νόμο. Η δήλωση αυτή είναι ελεύθερα ανακλητή, είτε με μεταγενέστερη αντίθετη δήλωσή του ενώπιον συμβολαιογράφου είτε με σύνταξη μεταγενέστερης διαθήκης, κατά τους όρους του Αστικού Κώδικα. Ταυτόχρονη εφαρμογή του Αστικού Κώδικα και του Ιερού Μουσουλμανικού Νόμου στην κληρονομική περιουσία ή σε ποσοστό ή και σε διακεκριμένα στοιχεία αυτής απαγορεύεται.»'''
 
@@ -159,7 +619,7 @@ def test_syntax_from_string():
 
 def test_codifier():
     cod = codifier.LawCodifier()
-    law = cod.laws['ν. 4511/2018']
+    law = cod.laws.pin('ν. 4511/2018')
     s = '''Οι παράγραφοι 3 και 4 του άρθρου 1 του ν. 4511/2018 αντικαθίστανται ως εξής: «3. Lorem Ipsum 4. Dolor sir amet»'''
     law.apply_amendment(s)
 
@@ -227,6 +687,151 @@ def test_codifier():
     assert('15' not in law.sentences.keys())
 
 
+def test_tree_cache(tmpdir, monkeypatch):
+    cache = tree_cache.TreeCache(str(tmpdir.join('trees.sqlite')), max_entries=2)
+    monkeypatch.setattr(tree_cache, 'tree_cache', cache)
+    s = 'Στο ν. 4511/2018 διαγράφεται το άρθρο 15.'
+    trees = syntax.ActionTreeGenerator.generate_action_tree_from_string(s)
+    cached = syntax.ActionTreeGenerator.generate_action_tree_from_string(s)
+    batched = list(syntax.ActionTreeGenerator.generate_action_trees([s]))
+    # Texts are hashed as they are
+    syntax.ActionTreeGenerator.generate_action_tree_from_string(
+        '  Στο ν. 4511/2018  διαγράφεται το άρθρο 15.')
+
+    assert((cache.hits, cache.misses) == (2, 2))
+    assert(cached == trees and batched == [trees])
+
+    # Hits are marked as used in batches
+    assert(len(cache.touched) == 1)
+    cache.flush()
+    assert(cache.touched == {})
+
+    for i in range(4):
+        cache.store(cache.key(str(i), 'trees', 1), [i])
+    cache.evict()
+    assert(cache.load(cache.key('3', 'trees', 1)) == [3])
+    assert(cache.load(cache.key('0', 'trees', 1)) is None)
+
+
+def test_action_lookup():
+    tokens = 'Η παράγραφος 2 αντικαθίσταται και ΠΡΟΣΤΙΘΕΤΑΙ νέα , ενώ καταργείται'.split(' ')
+
+    expected = [(i, str(action)) for action in entities.actions
+                for i, w in enumerate(tokens) if action == w]
+    found = [(i, str(action))
+             for i, action in entities.action_lookup.find(tokens)]
+
+    # Uppercase words without accents are found too
+    assert(found == [(5, 'προστίθεται')] + expected)
+    assert(entities.action_lookup.contains(['ΚΑΤΑΡΓΟΥΝΤΑΙ']))
+    assert(not entities.action_lookup.contains(['άρθρο']))
+
+
+def test_fuzzy_lexicon():
+    assert(fuzzy.levenshtein('τροποποιείται', 'τροποπ0ιείται') == 1)
+    assert(fuzzy.levenshtein('kitten', 'sitting') == 3)
+    assert(fuzzy.levenshtein('kitten', 'sitting', max_distance=1) == 2)
+
+    lexicon = fuzzy.Lexicon(['ΝΟΜΟΣ', 'ΚΟΙΝΗ', 'ΑΠΟΦΑΣΗ'], max_distance=2)
+    assert(lexicon.lookup('ΝΟΜ0Σ') == ('ΝΟΜΟΣ', 1))
+    assert(lexicon.lookup('ΑΠΦΑΣ') == ('ΑΠΟΦΑΣΗ', 2))
+    assert(lexicon.lookup('ΥΠΟΥΡΓΙΚΗ') is None)
+
+    # Keywords are matched without case and accents
+    assert(entities.keyword_lexicon.lookup('ΠΑΡΑΓΡΑΦ0Σ') == ('παράγραφος', 1))
+
+    # Damaged action words are found only when edits are allowed
+    tokens = 'Η παράγραφος 2 αντικαθιστατα1 ως εξής'.split(' ')
+    assert(entities.action_lookup.find(tokens) == [])
+    assert([(i, str(action)) for i, action in entities.action_lookup.find(
+        tokens, max_distance=1)] == [(3, 'αντικαθίσταται')])
+
+
+def test_damaged_subject(monkeypatch):
+    class Token:
+        def __init__(self, text, i, dep='', children=()):
+            self.text, self.i, self.dep_ = text, i, dep
+            self.children = list(children)
+
+    subject = Token('παράγραφ0ς', 1, 'nsubj')
+    doc = [Token('Η', 0), subject,
+           Token('αντικαθίσταται', 2, children=[subject])]
+
+    tree = {'root': {'children': []}}
+    assert(not syntax.ActionTreeGenerator.get_nsubj(doc, 2, tree)[0])
+
+    monkeypatch.setattr(syntax, 'ACTION_MAX_DISTANCE', 1)
+    found_what, tree, is_plural = syntax.ActionTreeGenerator.get_nsubj(
+        doc, 2, tree)
+    assert(found_what and not is_plural)
+    assert(tree['what'] == {'index': 1, 'context': 'παράγραφος'})
+
+
+def test_level_positions():
+    tmp = 'Η παρ. 2 του άρθρου 5 και η υποπερίπτωση β της περίπτωσης α'.split(' ')
+    positions = syntax.ActionTreeGenerator.level_positions(tmp)
+
+    assert(positions == {stem: [i for i, w in enumerate(tmp) if re.search(stem, w)]
+                         for stem in syntax.ActionTreeGenerator.trans_lookup})
+    assert(positions['περίπτωσ'] == [8, 11])
+    assert(positions['υποπερίπτωσ'] == [8])
+
+
+def test_detection_prefilter(tmpdir, monkeypatch):
+    cache = tree_cache.TreeCache(str(tmpdir.join('trees.sqlite')))
+    monkeypatch.setattr(tree_cache, 'tree_cache', cache)
+    paragraphs = [
+        'Οι διατάξεις του παρόντος ισχύουν από τη δημοσίευσή του.',
+        'Στο ν. 4511/2018 διαγράφεται το άρθρο 15. Lorem ipsum.',
+        'Στην παράγραφο 1 του άρθρου 15 ν. 4511/2018 το πρώτο εδάφιο αντικαθίσταται ως εξής «This is a period being replaced»'
+    ]
+    skipped = syntax.detection_stats['skipped']
+    gated = list(syntax.ActionTreeGenerator.generate_action_trees(paragraphs))
+    assert(syntax.detection_stats['skipped'] >= skipped + 2)
+
+    # Results without the pre-filter are cached apart
+    ungated = list(syntax.ActionTreeGenerator.generate_action_trees(
+        paragraphs, prefilter=False))
+
+    assert(cache.hits == 0)
+    assert(gated == ungated)
+    assert(gated[0] == [] and gated[1] != [])
+
+
+def test_batched_detection():
+    paragraphs = [
+        'Στο ν. 4511/2018 προστίθεται άρθρο 15 ως εξής: « 1. This is a paragraph»',
+        'Lorem ipsum',
+        'Στο ν. 4511/2018 διαγράφεται το άρθρο 15.'
+    ]
+
+    batched = list(syntax.ActionTreeGenerator.generate_action_trees(
+        paragraphs, batch_size=2))
+
+    assert(len(batched) == 3 and batched[1] == [])
+    for s, trees in zip(paragraphs, batched):
+        assert(trees == syntax.ActionTreeGenerator.generate_action_tree_from_string(s))
+
+    law = parser.LawParser('ν. 4511/2018')
+    assert(law.apply_trees(batched[0])[:2] == (1, 1))
+    assert(law.sentences['15'])
+
+
+def test_parse_documents(monkeypatch):
+    # spaCy before 2.2.2 has no n_process
+    class Pipeline:
+        pipe_names = ['parser', 'ner']
+
+        def pipe(self, texts, as_tuples=False, n_threads=2,
+                 batch_size=1000, disable=[]):
+            assert(disable == ['ner'])
+            return iter(texts)
+
+    monkeypatch.setattr(syntax, 'nlp', Pipeline())
+    assert(list(syntax.ActionTreeGenerator.parse_documents(['α', 'β'])) ==
+           ['α', 'β'])
+
+
 def test_iterator():
     s = 'παράγραφοι 6, 7, 8 και 9, 10 και 11, 18 έως 25, 26 και 27'
     z = helpers.ssconj_doc_iterator(s.split(' '), 0, True, True)
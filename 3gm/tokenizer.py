@@ -1,23 +1,29 @@
-import copy
 import re
 import entities
 
 
 class Tokenizer:
+    """Splits texts on delimiters except inside the exceptions, i.e.
+    abbreviations such as παρ. or π.δ. The exceptions are compiled
+    once into a trie. A split finds the exceptions of the text, blanks
+    them out in a copy of the same length so that no delimiter matches
+    inside them, and cuts the original text at the delimiters found
+    in the copy. The fragments are slices of the text, so nothing is
+    restored afterwards and the result does not depend on the process
+    """
+
+    # Blanks out the exceptions, must not appear in any delimiter
+    BLANK = '\0'
 
     def __init__(self, exceptions):
         """Costructor function
         :params exceptions : A list of tokenizer exceptions
         """
         self.exceptions = exceptions
-        self.hashmap = {}
-        self.inv_hashmap = {}
+        self.compile_exceptions()
 
-        # hash exceptions
-        for e in self.exceptions:
-            h = str(hash(e))
-            self.hashmap[h] = e
-            self.inv_hashmap[e] = h
+        # Compiled regular expressions of the delimiters of split
+        self.delimiter_regexes = {}
 
         # subordinate conjuctions
         self.subordinate_conjuctions = [
@@ -47,27 +53,94 @@ class Tokenizer:
         ]
 
         # construct subordinate conjuctions regex
-        self.subordinate_conjuctions_regex = r', ({})[^,]*, '.format(
-            '|'.join(self.subordinate_conjuctions))
+        self.subordinate_conjuctions_regex = re.compile(
+            r', ({})[^,]*, '.format('|'.join(self.subordinate_conjuctions)))
+
+    def compile_exceptions(self):
+        """Build the trie of the exceptions and the offsets of their
+        periods. Exceptions are looked up only around the periods of a
+        text, and the exceptions without a period with a regex"""
+        self.trie = {}
+        self.period_offsets = set()
+        unanchored = []
+        for rank, e in enumerate(self.exceptions):
+            node = self.trie
+            for c in e:
+                node = node.setdefault(c, {})
+            # Nodes ending an exception hold its rank under None
+            node.setdefault(None, rank)
+
+            offsets = [i for i, c in enumerate(e) if c == '.']
+            self.period_offsets.update(offsets)
+            if not offsets and e:
+                unanchored.append(e)
+
+        self.period_offsets = sorted(self.period_offsets)
+        self.unanchored_regex = re.compile('(?=(?:{}))'.format(
+            '|'.join(map(re.escape, unanchored)))) if unanchored else None
 
     def add_exception(self, e):
         """Add exception to tokeinzer
         :params e : The exception to be added
         """
         self.exceptions.append(e)
-        hashmap[str(hash(e))] = e
+        self.compile_exceptions()
 
-    def hash(q):
-        """Hash tokenizer exceptions"""
-        for e in self.exceptions:
-            q = q.replace(e, self.inv_hashmap[e])
-        return q
-
-    def inverse_hash(q):
-        """Invert hashed text"""
-        for h, e in self.hashmap.items():
-            q = q.replace(h, e)
-        return q
+    def exception_spans(self, q):
+        """Spans of the exceptions in a string
+        Exceptions are taken in the order of the list, each one on its
+        leftmost non-overlapping occurrences outside the spans of the
+        previous ones. Returns sorted (start, end) tuples
+        """
+        starts = set()
+        period = q.find('.')
+        while period != -1:
+            starts.update(period - offset for offset in self.period_offsets
+                          if offset <= period)
+            period = q.find('.', period + 1)
+        if self.unanchored_regex is not None:
+            starts.update(m.start()
+                          for m in self.unanchored_regex.finditer(q))
+
+        matches = []
+        for start in starts:
+            end = start
+            node = self.trie
+            while end < len(q):
+                node = node.get(q[end])
+                if node is None:
+                    break
+                end += 1
+                if None in node:
+                    matches.append((node[None], start, end))
+
+        if not matches:
+            return []
+
+        matches.sort()
+        taken = bytearray(len(q))
+        spans = []
+        rank, last_end = None, 0
+        for r, start, end in matches:
+            if r != rank:
+                rank, last_end = r, 0
+            if start < last_end or taken.find(1, start, end) != -1:
+                continue
+            taken[start:end] = b'\x01' * (end - start)
+            spans.append((start, end))
+            last_end = end
+
+        spans.sort()
+        return spans
+
+    def delimiter_regex(self, delimiter):
+        """Compiled regular expression of a tuple of delimiters"""
+        try:
+            return self.delimiter_regexes[delimiter]
+        except KeyError:
+            regex = re.compile('|'.join(map(re.escape, delimiter)))
+            self.delimiter_regexes[delimiter] = regex
+            return regex
 
     def split(self, q, remove_subordinate=False, *delimiter):
         """Split a string using the tokenizer
@@ -79,17 +152,28 @@ class Tokenizer:
         if remove_subordinate:
             q = self.remove_subordinate(q)
 
-        for e in self.exceptions:
-            q = q.replace(e, self.inv_hashmap[e])
+        # Blank out the exceptions so that delimiters do not match there
+        spans = self.exception_spans(q)
+        if spans:
+            parts = []
+            last = 0
+            for start, end in spans:
+                parts.append(q[last:start])
+                parts.append(self.BLANK * (end - start))
+                last = end
+            parts.append(q[last:])
+            blanked = ''.join(parts)
+        else:
+            blanked = q
 
-        splitting_regex = '|'.join(map(re.escape, delimiter))
-        q = re.split(splitting_regex, q)
-
-        for i, x in enumerate(q):
-            for h, e in self.hashmap.items():
-                q[i] = q[i].replace(h, e)
+        result = []
+        last = 0
+        for m in self.delimiter_regex(delimiter).finditer(blanked):
+            result.append(q[last:m.start()])
+            last = m.end()
+        result.append(q[last:])
 
-        return q
+        return result
 
     def split_cases(self, q, ncases, suffix=')', prefix=''):
         """Split into cases provided by Greek Numerals
@@ -117,7 +201,7 @@ class Tokenizer:
         """Remove subordinate conjuctions from a string
         :params q : String to be cleaned
         """
-        return re.sub(self.subordinate_conjuctions_regex, ' ', q)
+        return self.subordinate_conjuctions_regex.sub(' ', q)
 
 
 # Common Tokenizer Exceptions in Legal Texts
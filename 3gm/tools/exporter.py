@@ -10,8 +10,7 @@ issue = parser.IssueParser(None, stdin=True)
 laws = issue.detect_new_laws()
 for i, l in issue.new_laws.items():
     try:
-        result = l.export_law(export_type)
-        sys.stdout.write(result)
+        l.export_law(export_type, outfile=sys.stdout)
     except BaseException:
         sys.stderr.write('Error in exporting')
 sys.stdout.flush()
@@ -38,21 +38,23 @@ def codify_pair(source=None, target=None, outfile=None):
     initial_text = target_law.export_law('issue')
     source_articles = source_law.get_articles_sorted()
 
-    for article in source_articles:
-        for paragraph in source_law.get_paragraphs(article):
-            try:
-                target_law.apply_amendment(paragraph)
-            except BaseException:
-                # If failing write to stderr
-                # sys.stderr.write(paragraph)
-                pass
+    paragraphs = [paragraph for article in source_articles
+                  for paragraph in source_law.get_paragraphs(article)]
+
+    for trees in syntax.ActionTreeGenerator.generate_action_trees(paragraphs):
+        try:
+            target_law.apply_trees(trees)
+        except BaseException:
+            # If failing write to stderr
+            # sys.stderr.write(paragraph)
+            pass
 
     # Write initial version to stdout in pretty format
     with open(sys.argv[2], 'w+') as f:
         f.write(initial_text)
 
     # Write formatted output to stdout
-    sys.stdout.write(target_law.export_law('issue'))
+    target_law.export_law('issue', outfile=sys.stdout)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the hierarchy level extraction of amendments
+# Compares the compiled level tagging of syntax.build_levels with
+# searching every stem in every word
+# Example Usage: python3 levels_benchmark.py ../../resources/phrases.txt
+
+import sys
+sys.path.insert(0, '../')
+import re
+import time
+import collections
+import entities
+import helpers
+import syntax
+
+ActionTreeGenerator = syntax.ActionTreeGenerator
+compiled_full_number_to_integer = entities.Numerals.full_number_to_integer
+
+# Contexts of the amended parts the levels are built for
+contexts = ['άρθρο', 'παράγραφος', 'εδάφιο', 'περίπτωση', 'φράση']
+
+
+def searched_full_number_to_integer(s):
+    """Numeral value by searching every key of the numerals"""
+    result = 0
+    for table in [entities.Numerals.units, entities.Numerals.tens,
+                  entities.Numerals.hundreds]:
+        for key, val in table.items():
+            if re.search(key, s) is not None:
+                result += val
+                break
+    return result
+
+
+def searched_build_levels(tmp, subtree, list_iter=False):
+    """build_levels searching every stem in every word"""
+    for stem, lookup in ActionTreeGenerator.trans_lookup.items():
+        if not re.search(stem, subtree['what']['context']):
+            for i, w in enumerate(tmp):
+                if re.search(stem, w):
+                    if not list_iter:
+                        subtree[lookup]['_id'] = next(
+                            helpers.ssconj_doc_iterator(tmp, i))
+                    else:
+                        subtree[lookup]['_id'] = list(
+                            helpers.ssconj_doc_iterator(tmp, i))
+                    subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
+                    break
+        else:
+            subtree[lookup]['_id'] = subtree['what']['number']
+            subtree[lookup]['children'] = []
+    return subtree
+
+
+def searched_build_levels_helper(tmp, subtree, list_iter=False, recursive=True):
+    """build_levels_helper searching every stem in every word"""
+    for stem, lookup in ActionTreeGenerator.trans_lookup.items():
+        for i, w in enumerate(tmp):
+            if re.search(stem, w):
+                is_plural = helpers.is_plural(w)
+                if not list_iter:
+                    subtree[lookup]['_id'] = next(
+                        helpers.ssconj_doc_iterator(tmp, i))
+                else:
+                    try:
+                        subtree[lookup]['_id'] = list(
+                            helpers.ssconj_doc_iterator(tmp, i, is_plural=is_plural, recursive=recursive))
+                    except:
+                        continue
+                subtree[lookup]['children'] = ActionTreeGenerator.children_loopkup[lookup]
+    return subtree
+
+
+def run(lines, build_levels, build_levels_helper):
+    """Build the levels of every line for every context
+    Returns the trees or the exceptions raised"""
+    result = []
+    for line in lines:
+        tmp = line.split(' ')
+        for context in contexts:
+            subtree = collections.defaultdict(dict)
+            subtree['what'] = {'context': context, 'number': ['1']}
+            try:
+                result.append(dict(build_levels(tmp, subtree)))
+            except Exception as e:
+                result.append(type(e))
+
+        tree = collections.defaultdict(dict)
+        result.append(dict(build_levels_helper(
+            tmp, tree, list_iter=True, recursive=True)))
+    return result
+
+
+def benchmark(lines, name, repeat=5):
+    """Return the throughput of an implementation in paragraphs per
+    second and its results
+    :params lines : Paragraphs
+    :params name : searched or compiled
+    :params repeat : Number of passes over the paragraphs
+    """
+    if name == 'searched':
+        entities.Numerals.full_number_to_integer = searched_full_number_to_integer
+        funcs = searched_build_levels, searched_build_levels_helper
+    else:
+        entities.Numerals.full_number_to_integer = compiled_full_number_to_integer
+        funcs = (ActionTreeGenerator.build_levels,
+                 ActionTreeGenerator.build_levels_helper)
+
+    try:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = run(lines, *funcs)
+        elapsed = time.perf_counter() - start
+    finally:
+        entities.Numerals.full_number_to_integer = compiled_full_number_to_integer
+
+    return repeat * len(lines) / elapsed, result
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else '../../resources/phrases.txt'
+
+    with open(filename) as f:
+        lines = [line for line in f.read().splitlines() if line]
+
+    print('{} paragraphs'.format(len(lines)))
+    results = []
+    for name in ['searched', 'compiled']:
+        throughput, result = benchmark(lines, name)
+        results.append(result)
+        print('{:16} {:10.0f} paragraphs/s'.format(name, throughput))
+
+    assert(results[0] == results[1])
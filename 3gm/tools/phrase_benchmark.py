@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# Micro-benchmark of phrase amendments
+# Compares the offset based PhraseEditor with joining the periods,
+# substituting and splitting the paragraph again
+# Example Usage: python3 phrase_benchmark.py ../../resources/phrases.txt
+
+import sys
+sys.path.insert(0, '../')
+import re
+import time
+import tokenizer
+import phrase_fun
+
+
+def resplit_replace(periods, old_phrase, new_phrase):
+    """Phrase replacement by re-tokenizing the whole paragraph"""
+    joined = '. '.join(periods)
+    joined = re.sub(re.escape(old_phrase), lambda m: new_phrase, joined)
+    return tokenizer.tokenizer.split(joined, False, '. ')
+
+
+def editor_replace(periods, old_phrase, new_phrase):
+    """Phrase replacement with the PhraseEditor"""
+    return phrase_fun.replace_phrase(periods, old_phrase, new_phrase)
+
+
+def amendments(lines):
+    """Build (periods, old phrase, new phrase) cases from the phrase
+    amendments of the lines. Each amendment is applied on its own
+    text which holds the quoted phrase"""
+    result = []
+    for line in lines:
+        old_phrase = phrase_fun.detect_phrase_content(line)
+        if not old_phrase:
+            continue
+        new_phrase = phrase_fun.detect_phr_replacement(line)
+        periods = tokenizer.tokenizer.split(line, False, '. ')
+        result.append((periods, old_phrase, new_phrase))
+    return result
+
+
+def benchmark(cases, func, repeat=20):
+    """Return the throughput of func in amendments per second
+    :params cases : Amendments as returned by amendments
+    :params func : Replacement function
+    :params repeat : Number of passes over the amendments
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for periods, old_phrase, new_phrase in cases:
+            func(periods, old_phrase, new_phrase)
+    elapsed = time.perf_counter() - start
+    return repeat * len(cases) / elapsed
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else '../../resources/phrases.txt'
+
+    with open(filename) as f:
+        cases = amendments(f.read().splitlines())
+
+    for periods, old_phrase, new_phrase in cases:
+        assert(resplit_replace(periods, old_phrase, new_phrase) ==
+               editor_replace(periods, old_phrase, new_phrase))
+
+    print('{} phrase amendments'.format(len(cases)))
+    for name, func in [('resplit', resplit_replace),
+                       ('phrase editor', editor_replace)]:
+        print('{:16} {:10.0f} amendments/s'.format(name, benchmark(cases, func)))
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# Micro-benchmark of statute detection
+# Compares the single pass StatuteScanner with one re.finditer
+# pass per statute type
+# Example Usage: python3 statute_benchmark.py ../../resources/phrases.txt
+
+import sys
+sys.path.insert(0, '../')
+import re
+import time
+import entities
+
+
+def separate_passes(text):
+    """Statute detection with one pass per statute type"""
+    result = []
+    for _, pattern in entities.StatuteScanner.patterns:
+        result.extend(m.group() for m in re.finditer(pattern, text))
+    return result
+
+
+def single_pass(text):
+    """Statute detection with the StatuteScanner"""
+    return [statute.text for statute in
+            entities.statute_scanner.findall(
+                text, order=entities.StatuteScanner.types)]
+
+
+def benchmark(lines, func, repeat=20):
+    """Return the throughput of func in lines and MB per second
+    :params lines : Lines to scan
+    :params func : Detection function
+    :params repeat : Number of passes over the lines
+    """
+    size = sum(len(line.encode('utf-8')) for line in lines)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            func(line)
+    elapsed = time.perf_counter() - start
+    return repeat * len(lines) / elapsed, repeat * size / elapsed / 2**20
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else '../../resources/phrases.txt'
+
+    with open(filename) as f:
+        lines = f.read().splitlines()
+
+    for line in lines:
+        assert(separate_passes(line) == single_pass(line))
+
+    for name, func in [('separate passes', separate_passes),
+                       ('single pass', single_pass)]:
+        lines_per_sec, mb_per_sec = benchmark(lines, func)
+        print('{:16} {:10.0f} lines/s {:8.2f} MB/s'.format(
+            name, lines_per_sec, mb_per_sec))
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Micro-benchmark of the tokenizer
+# Compares the trie based Tokenizer.split with masking the exceptions
+# with hashes, splitting and unmasking every fragment
+# Example Usage: python3 tokenizer_benchmark.py ../../resources/phrases.txt
+
+import sys
+sys.path.insert(0, '../')
+import re
+import time
+import tokenizer
+
+
+def hashed_split(q, remove_subordinate=False, *delimiter):
+    """Split by replacing the exceptions with their hashes"""
+    tok = tokenizer.tokenizer
+    if remove_subordinate:
+        q = tok.remove_subordinate(q)
+
+    hashmap = {str(hash(e)): e for e in tok.exceptions}
+    inv_hashmap = {e: h for h, e in hashmap.items()}
+
+    for e in tok.exceptions:
+        q = q.replace(e, inv_hashmap[e])
+
+    splitting_regex = '|'.join(map(re.escape, delimiter))
+    q = re.split(splitting_regex, q)
+
+    for i, x in enumerate(q):
+        for h, e in hashmap.items():
+            q[i] = q[i].replace(h, e)
+
+    return q
+
+
+def benchmark(lines, func, delimiters, repeat=20):
+    """Return the throughput of func in paragraphs per second
+    :params lines : Paragraphs to split
+    :params func : Split function
+    :params delimiters : Delimiters to split on
+    :params repeat : Number of passes over the paragraphs
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            func(line, False, *delimiters)
+    elapsed = time.perf_counter() - start
+    return repeat * len(lines) / elapsed
+
+
+if __name__ == '__main__':
+    filename = sys.argv[1] if len(sys.argv) > 1 else '../../resources/phrases.txt'
+
+    with open(filename) as f:
+        lines = [line for line in f.read().splitlines() if line]
+
+    cases = ('. ',), tuple(
+        tokenizer.entities.Numerals.greek_num_generator(20, suffix=') '))
+    for delimiters in cases:
+        for line in lines:
+            assert(hashed_split(line, False, *delimiters) ==
+                   tokenizer.tokenizer.split(line, False, *delimiters))
+
+    print('{} paragraphs'.format(len(lines)))
+    for delimiters in cases:
+        print('delimiters {!r}...'.format(delimiters[0]))
+        for name, func in [('hashed', hashed_split),
+                           ('trie', tokenizer.tokenizer.split)]:
+            print('{:16} {:10.0f} paragraphs/s'.format(
+                name, benchmark(lines, func, delimiters)))
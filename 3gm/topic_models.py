@@ -100,9 +100,9 @@ def build_data_samples(min_size=4, use_spacy=True):
     indices = {}
 
     i = 0
-    for law in codifier.codifier.laws.keys():
+    for law, law_object in codifier.codifier.laws.iter_laws():
         print(law)
-        corpus = codifier.codifier.laws[law].export_law('str')
+        corpus = law_object.export_law('str')
         if use_spacy:
             tmp = nlp(corpus)
         else:
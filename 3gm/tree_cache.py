@@ -0,0 +1,152 @@
+'''
+    Persistent cache of detected action trees.
+    The same amending paragraphs are run through amendment detection on
+    every link build and law rebuild. Detection results are stored in a
+    SQLite file under the SHA-256 of the text, the kind of detection
+    and the detector and model versions. SQLite serializes the writers,
+    so the cache is shared by concurrent processes. The least recently
+    used entries are evicted above max_entries. Hits only mark their
+    entries as used in memory and the marks are written in batches.
+    The cache is off unless CODIFIER_TREE_CACHE names its file.
+'''
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+
+
+class TreeCache:
+    """Store of detection results keyed by text digest"""
+
+    def __init__(self, filename, max_entries=200000, touch_batch=1000):
+        """Cache constructor
+        :params filename : SQLite file (created on first use).
+        If None the cache is disabled
+        :params max_entries : Entries kept after eviction
+        :params touch_batch : Hits marked as used with one write
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.touched = {}
+        self.hits = 0
+        self.misses = 0
+        self.connection = None
+        self.pid = None
+        self.writes = 0
+
+    def key(self, s, kind, version):
+        """Compute the cache key of a text
+        :params s : Query string
+        :params kind : Kind of detection e.g. trees or removals
+        :params version : Detector and model version
+        """
+        h = hashlib.sha256(s.encode('utf-8'))
+        h.update('\0{}\0{}'.format(kind, version).encode('utf-8'))
+        return h.hexdigest()
+
+    @property
+    def enabled(self):
+        """Tell if the cache reads and writes entries"""
+        return bool(self.filename)
+
+    def connect(self):
+        """Return the connection of the current process"""
+        if self.connection is not None and self.pid == os.getpid():
+            return self.connection
+
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.filename, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS trees '
+            '(key TEXT PRIMARY KEY, value BLOB, used REAL)')
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS trees_used ON trees (used)')
+        connection.commit()
+        self.connection, self.pid = connection, os.getpid()
+        return connection
+
+    def load(self, key):
+        """Load an entry. Returns None if missing or unreadable"""
+        if not self.enabled:
+            return None
+        try:
+            connection = self.connect()
+            row = connection.execute(
+                'SELECT value FROM trees WHERE key = ?', (key,)).fetchone()
+            if row is not None:
+                value = pickle.loads(zlib.decompress(row[0]))
+                self.touched[key] = time.time()
+                if len(self.touched) >= self.touch_batch:
+                    self.flush()
+        except (OSError, sqlite3.Error, zlib.error, pickle.UnpicklingError) as e:
+            logging.warning('Could not read tree cache: ' + str(e))
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def store(self, key, value):
+        """Store an entry, evicting the least recently used entries
+        when the cache grows above max_entries"""
+        if not self.enabled:
+            return
+        try:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO trees VALUES (?, ?, ?)',
+                    (key, zlib.compress(pickle.dumps(
+                        value, protocol=pickle.HIGHEST_PROTOCOL)),
+                     time.time()))
+
+            # Check the size once every few writes
+            self.writes += 1
+            if self.writes % 1000 == 0:
+                self.evict()
+        except (OSError, sqlite3.Error) as e:
+            logging.warning('Could not cache trees: ' + str(e))
+
+    def flush(self):
+        """Write the pending marks of the used entries"""
+        if not self.touched:
+            return
+        touched, self.touched = self.touched, {}
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                'UPDATE trees SET used = ? WHERE key = ?',
+                [(used, key) for key, used in touched.items()])
+
+    def evict(self):
+        """Drop the least recently used entries above max_entries"""
+        self.flush()
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                'DELETE FROM trees WHERE key IN (SELECT key FROM trees '
+                'ORDER BY used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    def clear(self):
+        """Remove every entry of the cache"""
+        if not self.enabled:
+            return
+        self.touched = {}
+        connection = self.connect()
+        with connection:
+            connection.execute('DELETE FROM trees')
+
+
+# Default cache, enabled by setting CODIFIER_TREE_CACHE to a file
+global tree_cache
+tree_cache = TreeCache(os.environ.get('CODIFIER_TREE_CACHE'))
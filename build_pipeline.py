@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
-# usage built_pipeline.py laws links topics versions
-import codifier
+# usage built_pipeline.py laws links topics versions snapshot
+# incremental usage (only new issues) built_pipeline.py --incremental
 import os
 import sys
+
+# Builds always start from the database. The snapshot stage
+# writes to CODIFIER_SNAPSHOT if set
+snapshot_file = os.environ.pop('CODIFIER_SNAPSHOT', None)
+# Parsed issues and detected trees are cached across builds if
+# CODIFIER_ISSUE_CACHE (directory) and CODIFIER_TREE_CACHE (file) are set
+# CODIFIER_ACTION_MAX_DISTANCE=1 finds action words and subjects damaged by OCR
+
+import codifier
 pipeline_depth = {
     'laws': 0,
     'links': 1,
     'topics': 2,
-    'versions': 3
+    'versions': 3,
+    'snapshot': 4
 }
 
 # data dir
@@ -17,8 +27,17 @@ except KeyError:
     print('Please export CODIFIER_DATA')
     sys.exit(0)
 
-pipeline = sorted(sys.argv[1:], key=lambda x: pipeline_depth[x])
 sys.path.insert(0, './3gm')
-print('Building codifier')
-codifier.build(start=1999, end=2018, data_dir=data_dir, pipeline=pipeline)
+if '--incremental' in sys.argv[1:]:
+    print('Building codifier incrementally')
+    new_laws, rebuilt = codifier.build_incremental(
+        start=1999, end=2018, data_dir=data_dir,
+        snapshot_file=snapshot_file)
+    print('New laws: {}, Rebuilt versions: {}'.format(
+        len(new_laws), len(rebuilt)))
+else:
+    pipeline = sorted(sys.argv[1:], key=lambda x: pipeline_depth[x])
+    print('Building codifier')
+    codifier.build(start=1999, end=2018, data_dir=data_dir,
+                   pipeline=pipeline, snapshot_file=snapshot_file)
 print('Complete')
@@ -1,8 +1,9 @@
-import distance
 import sys
 import glob
 import os
 import multiprocessing
+sys.path.insert(0, '../3gm')
+import fuzzy
 
 threshold = 3
 output_dir = sys.argv[1]
@@ -20,17 +21,14 @@ def fix_file(filename):
     for line in lines:
         tmp = line.split(' ')
         for i, x in enumerate(tmp):
-            for w in words:
-                x = x.replace('|', 'Ι')
-                if ' ' not in x and distance.levenshtein(x, w) <= threshold:
-                    tmp[i] = w
-                elif x == 'ΠΡΟΕΔΡ|ΚΟ':
-                    tmp[i] = 'ΠΡΟΕΔΡΙΚΟ'
-                elif x in ['ΔίΑΤΑΓΜΑ', 'Δ|ΑΤΑΓΜΑ']:
-                    tmp[i] = 'ΔΙΑΤΑΓΜΑ'
-                elif len(x) <= 3 and 'ΥΠ' in x:
-                    tmp[i] = 'ΥΠ’'
-                tmp[i] = tmp[i].replace('|', 'Ι')
+            x = x.replace('|', 'Ι')
+            match = lexicon.lookup(x)
+            if match is not None:
+                tmp[i] = match[0]
+            elif len(x) <= 3 and 'ΥΠ' in x:
+                tmp[i] = 'ΥΠ’'
+            else:
+                tmp[i] = x
 
         result.append(' '.join(tmp) + '\n')
 
@@ -41,7 +39,7 @@ def fix_file(filename):
 
 words = [
     'ΝΟΜΟΣ',
-    'ΔΙΑΤΑΓΜΑ'
+    'ΔΙΑΤΑΓΜΑ',
     'ΠΡΟΕΔΡΙΚΟ',
     'ΚΟΙΝΗ',
     'ΥΠΟΥΡΓΙΚΗ',
@@ -50,5 +48,8 @@ words = [
     'ΑΡΙΘΜ.'
 ]
 
+# Closest header word within threshold edits of a token
+lexicon = fuzzy.Lexicon(words, max_distance=threshold)
+
 pool = multiprocessing.Pool(5)
 pool.map(fix_file, filelist)
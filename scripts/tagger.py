@@ -33,10 +33,8 @@ if __name__ == '__main__':
                     tmp = list(map(lambda s: s.strip(
                         string.punctuation),  non_extract.split(' ')))
 
-                    for action in actions:
-                        for i, w in enumerate(tmp):
-                            if action == w:
-                                f.write(non_extract + '\n')
-                                print('woo')
+                    for i, action in action_lookup.find(tmp):
+                        f.write(non_extract + '\n')
+                        print('woo')
     f.close()
     print('Unmatched Brackets: ', counter)